@@ -9,7 +9,7 @@ db = SQLAlchemy()
 cors = CORS()
 migrate = Migrate()
 
-def create_app():
+def create_app(config=None):
     load_dotenv()
 
     app = Flask(__name__)
@@ -19,19 +19,84 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
     app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER')
     app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH'))
+    # Project archives are streamed, not buffered: no limit unless one is set
+    app.config['IMPORT_MAX_CONTENT_LENGTH'] = int(os.getenv('IMPORT_MAX_CONTENT_LENGTH', 0)) or None
+
+    # Explicit overrides (benchmarks, tests) win over the environment
+    if config:
+        app.config.update(config)
+
+    from app.utils.database import engine_options
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
 
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
     db.init_app(app)
     cors.init_app(app)
 
+    from app.utils.serialization import init_json
+    init_json(app)
+
+    if os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes'):
+        from app.utils.profiling import init_profiling
+        init_profiling(app)
+
     from app.models import models
 
+    from app.models.types import set_id_strategy
+    app.config.setdefault('ID_STRATEGY', os.getenv('ID_STRATEGY', 'uuid7'))
+    set_id_strategy(app.config['ID_STRATEGY'])
+
+    from app.utils.caching import init_caching
+    init_caching(app)
+
+    from app.utils.compression import init_compression
+    init_compression(app)
+
+    from app.utils.text_compression import init_text_compression
+    init_text_compression(app)
+
+    from app.utils.ingestion import init_ingestion
+    init_ingestion(app)
+
+    from app.utils.dedup import init_dedup
+    init_dedup(app)
+
+    from app.utils.deletion import init_deletion
+    init_deletion(app)
+
+    from app.utils.counters import init_counters
+    init_counters(app)
+
+    from app.utils.changes import init_changes
+    init_changes(app)
+
+    from app.utils.usage import init_usage
+    init_usage(app)
+
+    from app.utils.cold_storage import init_cold_storage
+    init_cold_storage(app)
+
+    from app.utils.analytics import init_analytics
+    init_analytics(app)
+
     migrate.init_app(app, db)
 
     from app.routes.projects import bp as projects_bp
     app.register_blueprint(projects_bp)
 
+    from app.routes.milestones import bp as milestones_bp
+    app.register_blueprint(milestones_bp)
+
+    from app.routes.changes import bp as changes_bp
+    app.register_blueprint(changes_bp)
+
+    from app.routes.usage import bp as usage_bp
+    app.register_blueprint(usage_bp)
+
+    from app.routes.analytics import bp as analytics_bp
+    app.register_blueprint(analytics_bp)
+
     @app.route('/')
     def index():
         return {
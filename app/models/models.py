@@ -1,28 +1,32 @@
 from app import db
 import datetime
-import uuid
-from sqlalchemy.orm import validates
+from sqlalchemy.orm import validates, deferred
 from enum import Enum
+from app.utils.profiling import timed
+from app.models.types import GUID, CompressedText, JSONType, new_id
 
 
 # tables for many-to-many relationships
 
 question_resource = db.Table('question_resource',
-    db.Column('question_id', db.String(36), db.ForeignKey('question.id'), primary_key=True),
-    db.Column('document_id', db.String(36), db.ForeignKey('document.id'), primary_key=True)
+    db.Column('question_id', GUID(), db.ForeignKey('question.id'), primary_key=True),
+    db.Column('document_id', GUID(), db.ForeignKey('document.id'), primary_key=True)
 )
 
 learning_session_resource = db.Table('learning_session_resource',
-    db.Column('session_id', db.String(36), db.ForeignKey('learning_session.id'), primary_key=True),
-    db.Column('document_id', db.String(36), db.ForeignKey('document.id'), primary_key=True)
+    db.Column('session_id', GUID(), db.ForeignKey('learning_session.id'), primary_key=True),
+    db.Column('document_id', GUID(), db.ForeignKey('document.id'), primary_key=True)
 )
 
 learning_session_test = db.Table('learning_session_test',
-    db.Column('session_id', db.String(36), db.ForeignKey('learning_session.id'), primary_key=True),
-    db.Column('document_id', db.String(36), db.ForeignKey('document.id'), primary_key=True)
+    db.Column('session_id', GUID(), db.ForeignKey('learning_session.id'), primary_key=True),
+    db.Column('document_id', GUID(), db.ForeignKey('document.id'), primary_key=True)
 )
 
 
+# Enum and datetime values are returned as they are by to_dict(), the JSON
+# provider (app.utils.serialization) encodes them.
+
 # Types of documents
 class DocumentCategory(Enum):
     RESOURCE = 'Resource'
@@ -32,31 +36,99 @@ class QuestionSourceType(Enum):
     RESOURCE = 'Resource'
     TEST = 'Test'
 
+# Processing state of an uploaded document (see app.utils.ingestion)
+class DocumentStatus(Enum):
+    PENDING = 'Pending'
+    PROCESSING = 'Processing'
+    READY = 'Ready'
+    FAILED = 'Failed'
+
 
 # Document model
 class Document(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    project_id = db.Column(db.String(36), db.ForeignKey('project.id'), nullable=False)
+    id = db.Column(GUID(), primary_key=True, default=new_id)
+    project_id = db.Column(GUID(), db.ForeignKey('project.id'), nullable=False, index=True)
     filename = db.Column(db.String(200), nullable=False)
     category = db.Column(db.Enum(DocumentCategory), nullable=False)
-    content = db.Column(db.Text, nullable=True)
+    # Extracted text, stored compressed and only loaded (and decompressed) when
+    # accessed. Served in ranges by the /documents/<id>/content endpoint, never
+    # inlined in to_dict()
+    content = deferred(db.Column(CompressedText, nullable=True))
     file_path = db.Column(db.String(500), nullable=False)
 
+    # Metadata
+    size_bytes = db.Column(db.Integer, nullable=True)
+    checksum = db.Column(db.String(64), nullable=True)
+    page_count = db.Column(db.Integer, nullable=True)
+    char_count = db.Column(db.Integer, nullable=True)
+
+    # Ingestion pipeline state
+    status = db.Column(db.Enum(DocumentStatus), nullable=False, default=DocumentStatus.PENDING,
+                       server_default=DocumentStatus.PENDING.name)
+    processing_error = db.Column(db.Text, nullable=True)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    # When a worker moved it to PROCESSING (stale claims are taken over, see app.utils.ingestion)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+
+    chunks = db.relationship('DocumentChunk', backref='document', lazy='dynamic',
+                             cascade='all, delete-orphan', order_by='DocumentChunk.position')
+
+    @timed('serialize')
     def to_dict(self):
         return {
+            'id': self.id,
             'projectId': self.project_id,
             'filename': self.filename,
-            'category': self.category.value,
-            'content': self.content
+            'category': self.category,
+            'status': self.status,
+            'error': self.processing_error,
+            'size': self.size_bytes,
+            'checksum': self.checksum,
+            'pageCount': self.page_count,
+            'charCount': self.char_count
         }
 
 
+# Passage of the extracted text of a document, produced by the ingestion pipeline
+class DocumentChunk(db.Model):
+    __tablename__ = 'document_chunk'
+
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(GUID(), db.ForeignKey('document.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    char_offset = db.Column(db.Integer, nullable=False)
+    content = db.Column(CompressedText, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_document_chunk_document_position', 'document_id', 'position', unique=True),
+    )
+
+
+# Compression dictionary trained on the text of a project's documents (see
+# app.utils.text_compression). Rows are never updated: values refer to them by id
+class TextDictionary(db.Model):
+    __tablename__ = 'text_dictionary'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    project_id = db.Column(GUID(), db.ForeignKey('project.id'), nullable=False)
+    codec = db.Column(db.String(10), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_text_dictionary_project', 'project_id', 'id'),
+        # ids are never reused: processes cache dictionaries by id
+        {'sqlite_autoincrement': True},
+    )
+
+
 class DocumentReference(db.Model):
     __tablename__ = 'document_reference'
 
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    question_id = db.Column(db.String(36), db.ForeignKey('question.id'), nullable=False)
-    document_id = db.Column(db.String(36), db.ForeignKey('document.id'), nullable=False)
+    id = db.Column(GUID(), primary_key=True, default=new_id)
+    question_id = db.Column(GUID(), db.ForeignKey('question.id'), nullable=False, index=True)
+    document_id = db.Column(GUID(), db.ForeignKey('document.id'), nullable=False, index=True)
 
     line_number = db.Column(db.Integer, nullable=True)
     page_number = db.Column(db.Integer, nullable=True)
@@ -65,6 +137,7 @@ class DocumentReference(db.Model):
 
     document = db.relationship('Document', foreign_keys=[document_id])
 
+    @timed('serialize')
     def to_dict(self):
         return {
             'document': self.document.to_dict(),
@@ -76,16 +149,18 @@ class DocumentReference(db.Model):
 
 # Question model
 class Question(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    session_id = db.Column(db.String(36), db.ForeignKey('learning_session.id'), nullable=False)
+    id = db.Column(GUID(), primary_key=True, default=new_id)
+    session_id = db.Column(GUID(), db.ForeignKey('learning_session.id'), nullable=False, index=True)
     question = db.Column(db.Text, nullable=False)
     answer = db.Column(db.Text, nullable=False)
     correction = db.Column(db.Text, nullable=True)
     evaluation = db.Column(db.Float, nullable=True)
     source_type = db.Column(db.Enum(QuestionSourceType), nullable=False)
+    # Bumped on every write, see app.utils.bulk (optimistic concurrency)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Relazion with the document for the question
-    test_document_id = db.Column(db.String(36), db.ForeignKey('document.id'), nullable=True)
+    test_document_id = db.Column(GUID(), db.ForeignKey('document.id'), nullable=True, index=True)
     test_document = db.relationship('Document', foreign_keys=[test_document_id])
 
     resource_documents = db.relationship('Document',
@@ -98,6 +173,16 @@ class Question(db.Model):
                                  cascade='all, delete-orphan',
                                  lazy=True)
 
+    # Spaced-repetition schedule (see app.utils.scheduler)
+    review = db.relationship('ReviewState', backref='question', uselist=False,
+                             cascade='all, delete-orphan')
+
+    # MinHash/LSH band buckets for near-duplicate detection (see app.utils.dedup)
+    lsh_bands = db.relationship('QuestionBand', cascade='all, delete-orphan', lazy=True)
+
+    __mapper_args__ = {'version_id_col': version}
+
+    @timed('serialize')
     def to_dict(self):
         return {
             'id': self.id,
@@ -105,17 +190,65 @@ class Question(db.Model):
             'answer': self.answer,
             'correction': self.correction,
             'evaluation': self.evaluation,
-            'sourceType': self.source_type.value,
+            'sourceType': self.source_type,
+            'version': self.version,
             'testDocument': self.test_document.to_dict() if self.test_document else None,
             'resourceDocuments': [doc.to_dict() for doc in self.resource_documents],
             'references': [ref.to_dict() for ref in self.references]
         }
 
 
+# Spaced-repetition state of a question. project_id is denormalized so that
+# the due questions of a project are a range scan on (project_id, due_at)
+class ReviewState(db.Model):
+    __tablename__ = 'review_state'
+
+    question_id = db.Column(GUID(), db.ForeignKey('question.id'), primary_key=True)
+    project_id = db.Column(GUID(), db.ForeignKey('project.id'), nullable=False)
+    due_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    ease_factor = db.Column(db.Float, nullable=False, default=2.5)
+    interval_days = db.Column(db.Float, nullable=False, default=0)
+    repetitions = db.Column(db.Integer, nullable=False, default=0)
+    lapses = db.Column(db.Integer, nullable=False, default=0)
+    last_reviewed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_review_state_project_due', 'project_id', 'due_at'),
+    )
+
+    @timed('serialize')
+    def to_dict(self):
+        return {
+            'dueAt': self.due_at,
+            'easeFactor': self.ease_factor,
+            'intervalDays': self.interval_days,
+            'repetitions': self.repetitions,
+            'lapses': self.lapses,
+            'lastReviewedAt': self.last_reviewed_at
+        }
+
+
+# One LSH band bucket of a question's MinHash signature. Questions sharing a
+# (project_id, band, bucket) are candidate near-duplicates
+class QuestionBand(db.Model):
+    __tablename__ = 'question_lsh_band'
+
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(GUID(), db.ForeignKey('question.id'), nullable=False)
+    project_id = db.Column(GUID(), db.ForeignKey('project.id'), nullable=False)
+    band = db.Column(db.SmallInteger, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_question_lsh_band_lookup', 'project_id', 'band', 'bucket'),
+        db.Index('ix_question_lsh_band_question', 'question_id'),
+    )
+
+
 # LearningSession moodel
 class LearningSession(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    project_id = db.Column(db.String(36), db.ForeignKey('project.id'), nullable=False)
+    id = db.Column(GUID(), primary_key=True, default=new_id)
+    project_id = db.Column(GUID(), db.ForeignKey('project.id'), nullable=False, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     duration_minutes = db.Column(db.Integer, nullable=False)
     motivation = db.Column(db.Text, nullable=True)
@@ -128,6 +261,9 @@ class LearningSession(db.Model):
     performance_level = db.Column(db.Float, nullable=True)
     satisfaction_level = db.Column(db.Float, nullable=True)
 
+    # Kept up to date on every write (see app.utils.counters)
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Relazioni
     resource_documents = db.relationship('Document',
                                        secondary=learning_session_resource,
@@ -137,14 +273,16 @@ class LearningSession(db.Model):
                                     backref='test_sessions')
     questions = db.relationship('Question', backref='session', cascade='all, delete-orphan')
 
+    @timed('serialize')
     def to_dict(self):
         return {
             'id': self.id,
             'projectId': self.project_id,
-            'timestamp': self.timestamp.isoformat(),
+            'timestamp': self.timestamp,
             'durationMinutes': self.duration_minutes,
             'motivation': self.motivation,
             'learningObjective': self.learning_objective,
+            'questionCount': self.question_count,
             'metrics': {
                 'awarenessLevel': self.awareness_level,
                 'confidenceLevel': self.confidence_level,
@@ -158,9 +296,44 @@ class LearningSession(db.Model):
         }
 
 
+# A learning session moved to cold storage (see app.utils.cold_storage): its
+# summary, and its rows and those of its questions as compressed JSON
+class ArchivedSession(db.Model):
+    __tablename__ = 'archived_session'
+
+    id = db.Column(GUID(), primary_key=True)
+    project_id = db.Column(GUID(), db.ForeignKey('project.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    # Summary
+    duration_minutes = db.Column(db.Integer, nullable=False)
+    question_count = db.Column(db.Integer, nullable=False)
+    evaluated_count = db.Column(db.Integer, nullable=False)
+    average_evaluation = db.Column(db.Float, nullable=True)
+
+    payload = deferred(db.Column(db.LargeBinary, nullable=False))
+    payload_size = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_archived_session_project_timestamp', 'project_id', 'timestamp'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'projectId': self.project_id,
+            'timestamp': self.timestamp,
+            'archivedAt': self.archived_at,
+            'durationMinutes': self.duration_minutes,
+            'questionCount': self.question_count,
+            'evaluatedCount': self.evaluated_count,
+            'averageEvaluation': self.average_evaluation,
+        }
+
 
 class Project(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(GUID(), primary_key=True, default=new_id)
     name = db.Column(db.String(100), nullable=False)
 
     # Metrics
@@ -168,7 +341,21 @@ class Project(db.Model):
     difficulty = db.Column(db.Float, nullable=True)
     interest = db.Column(db.Float, nullable=True)
 
-    motivations = db.Column(db.JSON, default=list)
+    motivations = db.Column(JSONType, default=list)
+
+    # Bumped on every write to the project or its children (see app.utils.caching)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # Child counters, kept up to date on every write (see app.utils.counters)
+    document_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    session_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    task_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_task_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    study_minutes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Model tokens the project may use per calendar month (None: LLM_TOKEN_BUDGET, see app.utils.usage)
+    token_budget = db.Column(db.Integer, nullable=True)
 
     documents = db.relationship('Document', backref='project', lazy=True, cascade='all, delete-orphan')
 
@@ -190,6 +377,7 @@ class Project(db.Model):
             raise ValueError(f"{key} must be between 0 and 100")
         return value
 
+    @timed('serialize')
     def to_dict(self):
         return {
             'id': self.id,
@@ -207,16 +395,42 @@ class Project(db.Model):
             }
         }
 
+    @timed('serialize')
+    def to_summary(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'counts': {
+                'documents': self.document_count,
+                'sessions': self.session_count,
+                'questions': self.question_count,
+                'tasks': self.task_count,
+                'completedTasks': self.completed_task_count,
+                'studyMinutes': self.study_minutes
+            },
+            'metrics': {
+                'overallPerformance': self.overall_performance,
+                'difficulty': self.difficulty,
+                'interest': self.interest
+            }
+        }
+
     def __repr__(self):
         return f'<Project {self.name}>'
 
 
 class Milestone(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(GUID(), primary_key=True, default=new_id)
     name = db.Column(db.String(100), nullable=False)
     due_date = db.Column(db.DateTime, nullable=False)
     is_deadline = db.Column(db.Boolean, default=False)
-    project_id = db.Column(db.String(36), db.ForeignKey('project.id'), nullable=True)
+    project_id = db.Column(GUID(), db.ForeignKey('project.id'), nullable=True, index=True)
+
+    # Range scans of the cross-project calendar (app.routes.milestones)
+    __table_args__ = (
+        db.Index('ix_milestone_due_date', 'due_date', 'id'),
+        db.Index('ix_milestone_deadline_due_date', 'is_deadline', 'due_date', 'id'),
+    )
 
     #__table_args__ = (
     #    db.CheckConstraint(
@@ -226,34 +440,102 @@ class Milestone(db.Model):
     #    ),
     #)
 
+    @timed('serialize')
     def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
-            'date': self.due_date.isoformat(),
+            'date': self.due_date,
             'isDeadline': self.is_deadline
         }
 
 
 class Task(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(GUID(), primary_key=True, default=new_id)
     name = db.Column(db.String(100), nullable=False)
-    project_id = db.Column(db.String(36), db.ForeignKey('project.id'), nullable=False)
-    milestone_id = db.Column(db.String(36), db.ForeignKey('milestone.id'), nullable=True)
+    project_id = db.Column(GUID(), db.ForeignKey('project.id'), nullable=False, index=True)
+    milestone_id = db.Column(GUID(), db.ForeignKey('milestone.id'), nullable=True)
     completed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     description = db.Column(db.Text, nullable=True)
+    # Bumped on every write, see app.utils.bulk (optimistic concurrency)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # Open task counts per milestone
+    __table_args__ = (
+        db.Index('ix_task_milestone_completed', 'milestone_id', 'completed'),
+    )
 
     # Relationships
     milestone = db.relationship('Milestone', backref='tasks')
 
+    __mapper_args__ = {'version_id_col': version}
+
+    @timed('serialize')
     def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
             'project_id': self.project_id,
+            'completed': self.completed,
+            'version': self.version,
             'milestone': self.milestone.to_dict() if self.milestone else None
         }
 
     def __repr__(self):
         return f'<Task {self.name}>'
+
+
+# Change feed for incremental client sync (see app.utils.changes). One row per
+# created/updated (deleted=False) or deleted (tombstone) entity, in commit order.
+class Change(db.Model):
+    __tablename__ = 'change_log'
+
+    seq = db.Column(db.BigInteger().with_variant(db.Integer(), 'sqlite'), primary_key=True, autoincrement=True)
+    project_id = db.Column(GUID(), nullable=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(GUID(), nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_project_seq', 'project_id', 'seq'),
+        db.Index('ix_change_log_entity', 'entity_id', 'entity', 'seq'),
+        # seq values are never reused, even after compaction
+        {'sqlite_autoincrement': True},
+    )
+
+
+# Highest seq whose tombstones were dropped by compaction: clients that
+# synced before it must start over (see app.utils.changes)
+class ChangeHorizon(db.Model):
+    __tablename__ = 'change_log_horizon'
+
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+# One model call (see app.utils.usage). Append-only: rows outlive the project
+# and session they are charged to, for accounting
+class LlmUsage(db.Model):
+    __tablename__ = 'llm_usage'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer(), 'sqlite'), primary_key=True, autoincrement=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    project_id = db.Column(GUID(), nullable=True)
+    session_id = db.Column(GUID(), nullable=True)
+    operation = db.Column(db.String(40), nullable=False)
+    provider = db.Column(db.String(40), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    prompt_tokens = db.Column(db.Integer, nullable=False)
+    response_tokens = db.Column(db.Integer, nullable=False)
+    latency_ms = db.Column(db.Float, nullable=False)
+    # USD, None when the model has no known price
+    cost = db.Column(db.Float, nullable=True)
+    failed = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        db.Index('ix_llm_usage_project_created', 'project_id', 'created_at'),
+        db.Index('ix_llm_usage_session', 'session_id'),
+        db.Index('ix_llm_usage_created', 'created_at'),
+    )
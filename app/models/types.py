@@ -0,0 +1,135 @@
+"""
+Column types that map to the native types of each backend, and id generation.
+
+GUID is a UUID column on PostgreSQL. On SQLite the column is declared as a 36
+character string, but canonical (lowercase, hyphenated) UUIDs are stored as
+16 byte blobs, which halves the size of every primary key, foreign key and
+index entry; any other id a client supplies is stored as text, as before.
+Ids are handled as strings by the application in every case.
+JSONType is JSONB on PostgreSQL and the generic JSON type elsewhere.
+CompressedText is a text column stored compressed (see app.utils.text_compression).
+
+New ids are UUIDv7 by default (ID_STRATEGY=uuid7): the first 48 bits are the
+creation time in milliseconds, so ids are roughly sorted by creation and
+inserts land at the right edge of the B-trees instead of at random pages.
+ID_STRATEGY=uuid4 keeps fully random ids.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+
+from sqlalchemy import JSON, LargeBinary, String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeDecorator
+
+from app.utils.text_compression import compress_text, decompress_text
+
+_CANONICAL_UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z')
+
+
+class GUID(TypeDecorator):
+    """UUID primary/foreign key, exposed as a string."""
+
+    impl = String(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(String(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        if dialect.name == 'postgresql':
+            try:
+                return str(uuid.UUID(str(value)))
+            except ValueError:
+                raise ValueError(f'Invalid id (not a UUID): {value}')
+        if isinstance(value, str) and _CANONICAL_UUID.match(value):
+            return bytes.fromhex(value.replace('-', ''))
+        return value
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            h = value.hex()
+            return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+        return value
+
+
+JSONType = JSON().with_variant(postgresql.JSONB(), 'postgresql')
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text stored as a compressed blob, exposed as a string: values are
+    compressed on write and decompressed when the column is loaded (defer it
+    to only pay when the text is used). Values already encoded with
+    compress_text (e.g. with a project's dictionary) are stored as they are.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        return decompress_text(value)
+
+
+# -----------------------------------------------
+# ID GENERATION
+# -----------------------------------------------
+_uuid7_lock = threading.Lock()
+_uuid7_last = [0, 0]  # milliseconds, sequence of the last id
+
+
+def uuid7():
+    """
+    A UUIDv7 (RFC 9562) string: 48 bit Unix time in ms, then a 12 bit
+    sequence (random start, incremented for ids created in the same
+    millisecond, so ids of one process are strictly increasing) and 62 random
+    bits.
+    """
+    with _uuid7_lock:
+        ms = time.time_ns() // 1_000_000
+        last_ms, sequence = _uuid7_last
+        if ms <= last_ms:
+            ms, sequence = last_ms, sequence + 1
+            if sequence > 0xFFF:
+                ms, sequence = ms + 1, 0
+        else:
+            sequence = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        _uuid7_last[:] = [ms, sequence]
+
+    value = (ms << 80) | (0x7 << 76) | (sequence << 64) | (0b10 << 62) | (int.from_bytes(os.urandom(8), 'big') >> 2)
+    return str(uuid.UUID(int=value))
+
+
+def uuid4():
+    return str(uuid.uuid4())
+
+
+ID_STRATEGIES = {'uuid7': uuid7, 'uuid4': uuid4}
+_generate_id = uuid7
+
+
+def set_id_strategy(name):
+    """Select the generator used by new_id() (see ID_STRATEGIES)."""
+    global _generate_id
+
+    if name not in ID_STRATEGIES:
+        raise ValueError(f"Unknown ID_STRATEGY {name!r} (expected one of: {', '.join(ID_STRATEGIES)})")
+    _generate_id = ID_STRATEGIES[name]
+
+
+def new_id():
+    """A new primary key, as a string."""
+    return _generate_id()
@@ -0,0 +1,53 @@
+import tempfile
+
+from flask import Blueprint, request, jsonify, send_file
+
+from app import db
+from app.utils.analytics import SNAPSHOTS, default_format, formats, write_snapshot
+
+bp = Blueprint('analytics', __name__, url_prefix='/api/analytics')
+
+MIMETYPES = {'npz': 'application/octet-stream', 'parquet': 'application/vnd.apache.parquet'}
+
+
+# -------------------------------------------------------------
+# 1. AVAILABLE SNAPSHOTS
+# -------------------------------------------------------------
+@bp.route('/snapshots', methods=['GET'])
+def list_snapshots():
+    """Snapshots, their columns and the formats available on this server."""
+    return jsonify({
+        'formats': list(formats()),
+        'defaultFormat': default_format(),
+        'snapshots': {name: [{'name': column, 'type': kind} for column, kind in columns]
+                      for name, columns in SNAPSHOTS.items()},
+    }), 200
+
+
+# -------------------------------------------------------------
+# 2. COLUMNAR SNAPSHOT OF THE SESSIONS, QUESTIONS OR TASKS
+# -------------------------------------------------------------
+@bp.route('/snapshots/<snapshot>', methods=['GET'])
+def get_snapshot(snapshot):
+    """
+    Download a columnar snapshot (sessions, questions or tasks) of every
+    project, or of one with ?projectId=. Use ?format=npz|parquet (default:
+    parquet when available, else npz). See app.utils.analytics.
+    """
+    fmt = request.args.get('format') or default_format()
+    if snapshot not in SNAPSHOTS:
+        return jsonify({'error': f'Snapshot must be one of {", ".join(SNAPSHOTS)}'}), 404
+    if fmt not in formats():
+        return jsonify({'error': f'format must be one of {", ".join(formats())}'}), 400
+    project_id = request.args.get('projectId') or None
+
+    spool = tempfile.TemporaryFile()
+    try:
+        write_snapshot(snapshot, spool, fmt, project_id)
+        spool.seek(0)
+        return send_file(spool, mimetype=MIMETYPES[fmt], as_attachment=True,
+                         download_name=f'{snapshot}.{fmt}')
+    except Exception as e:
+        spool.close()
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,46 @@
+from flask import Blueprint, request, jsonify
+
+from app.utils.changes import read_changes, ResyncRequired
+
+# Default and maximum number of change log rows per page
+PAGE_SIZE_DEFAULT = 500
+PAGE_SIZE_MAX = 2000
+
+bp = Blueprint('changes', __name__, url_prefix='/api/changes')
+
+
+# -------------------------------------------------------------
+# 1. CHANGES SINCE A SEQUENCE NUMBER (DELTA SYNC)
+# -------------------------------------------------------------
+@bp.route('/', methods=['GET'], strict_slashes=False)
+def get_changes():
+    """
+    Everything created, updated or deleted after `since`, oldest first:
+    upserts carry the current state of the row (flat, children are synced on
+    their own), deletes only the id. Keep `nextSince` and ask again while
+    `hasMore` is true.
+
+    Query: ?since=<nextSince of the previous call, 0 for a full sync>
+           &horizon=<horizon of the previous call>&projectId=&limit=500
+
+    Returns 410 with `resync: true` when the log was compacted past `since`:
+    drop the local copy and sync again from 0.
+    """
+    since = request.args.get('since', 0, type=int)
+    known_horizon = request.args.get('horizon', 0, type=int)
+    if since < 0 or known_horizon < 0:
+        return jsonify({'error': 'since and horizon must be non-negative integers'}), 400
+
+    limit = request.args.get('limit', PAGE_SIZE_DEFAULT, type=int)
+    if limit <= 0:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    limit = min(limit, PAGE_SIZE_MAX)
+
+    project_id = request.args.get('projectId') or None
+
+    try:
+        return jsonify(read_changes(since, project_id, limit, known_horizon)), 200
+    except ResyncRequired as e:
+        return jsonify({'error': str(e), 'resync': True}), 410
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
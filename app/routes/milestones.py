@@ -0,0 +1,96 @@
+import base64
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify
+from sqlalchemy import select, func, and_, or_
+
+from app.models.models import Milestone, Project, Task
+from app import db
+
+# Default and maximum number of milestones per page
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 500
+
+bp = Blueprint('milestones', __name__, url_prefix='/api/milestones')
+
+
+def _encode_cursor(due_date, milestone_id):
+    return base64.urlsafe_b64encode(f'{due_date.isoformat()}|{milestone_id}'.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    due_date, milestone_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    return datetime.fromisoformat(due_date), milestone_id
+
+
+def _parse_bool(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+# -------------------------------------------------------------
+# 1. UPCOMING MILESTONES OF EVERY PROJECT (CALENDAR)
+# -------------------------------------------------------------
+@bp.route('/', methods=['GET'], strict_slashes=False)
+def get_milestones_calendar():
+    """
+    Milestones of all projects due between `from` and `to` (ISO 8601, default
+    from now on), ordered by date, with the project name and the number of
+    open tasks of each milestone.
+
+    Query: ?from=&to=&deadlineOnly=true&limit=100&cursor=<nextCursor of the previous page>
+
+    The date range is an index range scan on (due_date, id), or on
+    (is_deadline, due_date, id) with deadlineOnly; pages continue from the
+    last (due_date, id) seen instead of using an offset.
+    """
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else datetime.utcnow()
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+        cursor = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid date or cursor (dates use ISO 8601)'}), 400
+
+    limit = request.args.get('limit', PAGE_SIZE_DEFAULT, type=int)
+    if limit <= 0:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    limit = min(limit, PAGE_SIZE_MAX)
+
+    try:
+        open_tasks = (select(func.count())
+                      .where(Task.milestone_id == Milestone.id,
+                             or_(Task.completed.is_(False), Task.completed.is_(None)))
+                      .scalar_subquery())
+
+        query = (select(Milestone.id, Milestone.name, Milestone.due_date, Milestone.is_deadline,
+                        Milestone.project_id, Project.name.label('project_name'),
+                        open_tasks.label('open_tasks'))
+                 .outerjoin(Project, Project.id == Milestone.project_id)
+                 .where(Milestone.due_date >= start)
+                 .order_by(Milestone.due_date, Milestone.id)
+                 .limit(limit + 1))
+        if end is not None:
+            query = query.where(Milestone.due_date < end)
+        if _parse_bool(request.args.get('deadlineOnly', False)):
+            query = query.where(Milestone.is_deadline.is_(True))
+        if cursor is not None:
+            due_date, milestone_id = cursor
+            query = query.where(or_(Milestone.due_date > due_date,
+                                    and_(Milestone.due_date == due_date, Milestone.id > milestone_id)))
+
+        rows = db.session.execute(query).all()
+        next_cursor = _encode_cursor(rows[limit - 1].due_date, rows[limit - 1].id) if len(rows) > limit else None
+
+        return jsonify({
+            'milestones': [{
+                'id': row.id,
+                'name': row.name,
+                'date': row.due_date,
+                'isDeadline': row.is_deadline,
+                'projectId': row.project_id,
+                'projectName': row.project_name,
+                'openTasks': row.open_tasks
+            } for row in rows[:limit]],
+            'nextCursor': next_cursor
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
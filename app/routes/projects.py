@@ -1,16 +1,50 @@
 import os
-from flask import Blueprint, request, jsonify
+import tarfile
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from werkzeug.wsgi import get_input_stream
 from werkzeug.utils import secure_filename
 from app.models.models import *
 from app import db
-from datetime import datetime
-import uuid
+from datetime import datetime, timedelta
 from flask import send_file
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from app.models.types import new_id
+from app.utils.serialization import json_array_response
+from app.utils.caching import etag_cached, bump_project_version
+from app.utils.file_processor import save_upload, extracted_text_path, write_text_file, read_text_range
+from app.utils.ingestion import enqueue_document, sample_document_text
+from app.utils.scheduler import schedule_new_question, record_review, due_questions
+from app.utils.dedup import index_question, find_duplicate, dedupe_project
+from app.utils.archive import export_project, gzip_stream, import_project
+from app.utils.bulk import parse_patches, apply_patches, ConcurrentUpdateError
+from app.utils.deletion import delete_project, delete_session, schedule_sweep
+from app.utils.counters import adjust_counters
+from app.utils.changes import record_changes
+from app.utils.compression import negotiate, precompressed, precompress_file
+from app.utils.usage import llm_job, budget_status
+from app.utils.cold_storage import archive_sessions, rehydrate_session
+
+# Default and maximum size (bytes) of a slice returned by the document content endpoint
+CONTENT_SLICE_DEFAULT = 64 * 1024
+CONTENT_SLICE_MAX = 1024 * 1024
 
 bp = Blueprint('projects', __name__, url_prefix='/api/projects')
 
 
+@bp.before_request
+def rehydrate_archived_session():
+    """Move an archived session back to the hot tables before a request naming it (see app.utils.cold_storage)."""
+    session_id = (request.view_args or {}).get('session_id')
+    if session_id is None:
+        return None
+    try:
+        rehydrate_session(session_id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 ##########################
 #      POST METHODS      #
 ##########################
@@ -27,7 +61,7 @@ def create_project():
             return jsonify({'error': 'Name is required'}), 400
 
         new_project = Project(
-            id=data.get('id', str(uuid.uuid4())),
+            id=data.get('id', new_id()),
             name=data['name'],
             motivations=data.get('motivations', []),
             overall_performance=data.get('overall_performance'),
@@ -65,19 +99,24 @@ def add_document(project_id):
         filename = secure_filename(file.filename)
         os.makedirs(f"uploads/{project_id}", exist_ok=True)
         filepath = os.path.join(f"uploads/{project_id}", filename)
-        file.save(filepath)
+        size, checksum = save_upload(file, filepath)
 
         new_doc = Document(
-            id=custom_id or str(uuid.uuid4()),  # Use custom ID if provided
+            id=custom_id or new_id(),  # Use custom ID if provided
             project_id=project_id,
             filename=filename,
             file_path=filepath,
-            category=request.form.get('category', 'RESOURCE')
+            category=request.form.get('category', 'RESOURCE'),
+            size_bytes=size,
+            checksum=checksum
         )
 
         db.session.add(new_doc)
         db.session.commit()
 
+        # Text extraction, chunking etc. run in the background (see app.utils.ingestion)
+        enqueue_document(current_app._get_current_object(), new_doc.id)
+
         return jsonify(new_doc.to_dict()), 201
     except Exception as e:
         db.session.rollback()
@@ -91,7 +130,9 @@ def add_document(project_id):
 def add_milestone(project_id):
     try:
         data = request.get_json()
-        project = Project.query.get_or_404(project_id)
+        # Lock the project row (PostgreSQL; a no-op on SQLite) so that concurrent
+        # requests cannot both flip the deadline and leave two of them
+        project = Project.query.with_for_update().filter_by(id=project_id).first_or_404()
 
         if not data.get('name'):
             return jsonify({'error': 'Name is required'}), 400
@@ -104,7 +145,10 @@ def add_milestone(project_id):
 
         # Se è una deadline, disattiva qualsiasi deadline esistente
         if is_deadline:
-            Milestone.query.filter_by(project_id=project_id, is_deadline=True).update({'is_deadline': False})
+            previous = Milestone.query.filter_by(project_id=project_id, is_deadline=True)
+            record_changes('milestone', [milestone_id for milestone_id, in previous.with_entities(Milestone.id)],
+                           project_id)
+            previous.update({'is_deadline': False})
 
         new_milestone = Milestone(
             name=data['name'],
@@ -140,7 +184,7 @@ def create_learning_session(project_id):
 
         # Crea la sessione di apprendimento
         new_session = LearningSession(
-            id=data.get('id', str(uuid.uuid4())),
+            id=data.get('id', new_id()),
             project_id=project_id,
             duration_minutes=data['durationMinutes'],
             motivation=data.get('motivation'),
@@ -216,10 +260,10 @@ def add_documents_to_session(project_id, session_id):
 # 7. GETTTING ALL THE PROJECTS
 # -----------------------------------------------
 @bp.route('/', methods=['GET'])
+@etag_cached('projects')
 def get_all_projects():
     try:
-        projects = Project.query.all()
-        return jsonify([project.to_dict() for project in projects]), 200
+        return json_array_response(Project.query.yield_per(100))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -228,6 +272,7 @@ def get_all_projects():
 # 8. GETTING THE PROJECT WITH A CERTAIN ID
 # -----------------------------------------------
 @bp.route('/<project_id>', methods=['GET'])
+@etag_cached('project')
 def get_project(project_id):
     try:
         project = Project.query.get_or_404(project_id)
@@ -240,11 +285,11 @@ def get_project(project_id):
 # 9. GETTING ALL THE DOCUMENTS OF A CERTAIN PROJECT
 # --------------------------------------------------
 @bp.route('/<project_id>/documents', methods=['GET'])
+@etag_cached('documents')
 def get_project_documents(project_id):
     try:
         project = Project.query.get_or_404(project_id)
-        documents = Document.query.filter_by(project_id=project_id).all()
-        return jsonify([doc.to_dict() for doc in documents]), 200
+        return json_array_response(Document.query.filter_by(project_id=project_id).yield_per(100))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -253,6 +298,7 @@ def get_project_documents(project_id):
 # 10. GETTING THE DOCUMENT OF A CERTAIN INDEX
 # -----------------------------------------------
 @bp.route('/<project_id>/documents/<document_id>', methods=['GET'])
+@etag_cached('document')
 def get_document(project_id, document_id):
     try:
         document = Document.query.get_or_404(document_id)
@@ -296,15 +342,98 @@ def download_document(project_id, document_id):
         return jsonify({'error': str(e)}), 500
 
 
+# -----------------------------------------------
+# 11b. READ THE EXTRACTED TEXT OF A DOCUMENT IN SLICES
+# -----------------------------------------------
+# call it with: GET /api/projects/{project_id}/documents/{document_id}/content?offset=0&length=65536
+# offset and length are in bytes of the UTF-8 text, use nextOffset to read the following slice
+@bp.route('/<project_id>/documents/<document_id>/content', methods=['GET'])
+@etag_cached('document_content')
+def get_document_content(project_id, document_id):
+    try:
+        offset = request.args.get('offset', 0, type=int)
+        length = request.args.get('length', CONTENT_SLICE_DEFAULT, type=int)
+        if offset < 0 or length <= 0:
+            return jsonify({'error': 'offset must be >= 0 and length > 0'}), 400
+        length = min(length, CONTENT_SLICE_MAX)
+
+        document = Document.query.get_or_404(document_id)
+
+        if document.project_id != project_id:
+            return jsonify({'error': 'Document does not belong to this project'}), 404
+
+        if document.status != DocumentStatus.READY:
+            return jsonify({'error': 'Document has not been processed yet',
+                            'status': document.status.value}), 409
+
+        # The ingestion pipeline writes the text file, rebuild it from the DB if it went missing
+        text_path = extracted_text_path(document.file_path, document.id)
+        if not os.path.exists(text_path):
+            write_text_file(text_path, document.content or '')
+
+        content, start, end, total = read_text_range(text_path, offset, length)
+
+        return jsonify({
+            'documentId': document.id,
+            'offset': start,
+            'length': end - start,
+            'nextOffset': end if end < total else None,
+            'totalLength': total,
+            'content': content
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -----------------------------------------------
+# 11c. DOWNLOAD THE EXTRACTED TEXT OF A DOCUMENT
+# -----------------------------------------------
+# call it with: curl --compressed "http://localhost:5000/api/projects/{project_id}/documents/{document_id}/text"
+# served from the precompressed copy matching Accept-Encoding (gzip, br, zstd), or as plain text
+@bp.route('/<project_id>/documents/<document_id>/text', methods=['GET'])
+def download_document_text(project_id, document_id):
+    try:
+        document = Document.query.get_or_404(document_id)
+
+        if document.project_id != project_id:
+            return jsonify({'error': 'Document does not belong to this project'}), 404
+
+        if document.status != DocumentStatus.READY:
+            return jsonify({'error': 'Document has not been processed yet',
+                            'status': document.status.value}), 409
+
+        text_path = extracted_text_path(document.file_path, document.id)
+        if not os.path.exists(text_path):
+            write_text_file(text_path, document.content or '')
+
+        encoding = negotiate(request.accept_encodings, current_app.config['COMPRESSION_ENCODINGS'])
+        path = precompressed(text_path, encoding)
+        if encoding is not None and path is None:
+            # Text written before the copies were kept (or the copy is stale)
+            precompress_file(text_path)
+            path = precompressed(text_path, encoding)
+
+        response = send_file(os.path.abspath(path or text_path), mimetype='text/plain',
+                             download_name=f'{os.path.splitext(document.filename)[0]}.txt')
+        if path:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 # ---------------------------------------------------
 # 12. GETTING ALL THE MILESTONES OF A CERTAIN PROJECT
 # ---------------------------------------------------
 @bp.route('/<project_id>/milestones', methods=['GET'])
+@etag_cached('milestones')
 def get_project_milestones(project_id):
     try:
         project = Project.query.get_or_404(project_id)
-        milestones = Milestone.query.filter_by(project_id=project_id).all()
-        return jsonify([milestone.to_dict() for milestone in milestones]), 200
+        return json_array_response(Milestone.query.filter_by(project_id=project_id).yield_per(100))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -313,6 +442,7 @@ def get_project_milestones(project_id):
 # 13. GETTING THE MILESTONE WITH A CERTAIN ID
 # -----------------------------------------------
 @bp.route('/<project_id>/milestones/<milestone_id>', methods=['GET'])
+@etag_cached('milestone')
 def get_milestone(project_id, milestone_id):
     try:
         milestone = Milestone.query.get_or_404(milestone_id)
@@ -329,11 +459,11 @@ def get_milestone(project_id, milestone_id):
 # 14. GETTING ALL THE MILESTONES OF A CERTAIN PROJECT
 # ---------------------------------------------------
 @bp.route('/<project_id>/sessions', methods=['GET'])
+@etag_cached('sessions')
 def get_project_sessions(project_id):
     try:
         project = Project.query.get_or_404(project_id)
-        sessions = LearningSession.query.filter_by(project_id=project_id).all()
-        return jsonify([session.to_dict() for session in sessions]), 200
+        return json_array_response(LearningSession.query.filter_by(project_id=project_id).yield_per(100))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -342,6 +472,7 @@ def get_project_sessions(project_id):
 # 15. GETTING THE SESSION WITH A CERTAIN ID
 # ---------------------------------------------------
 @bp.route('/<project_id>/sessions/<session_id>', methods=['GET'])
+@etag_cached('session')
 def get_session(project_id, session_id):
     try:
         session = LearningSession.query.get_or_404(session_id)
@@ -358,11 +489,12 @@ def get_session(project_id, session_id):
 # 16. GET ALL THE TASK OF A CERTAIN PROJECT
 # ---------------------------------------------------
 @bp.route('/<project_id>/tasks', methods=['GET'])
+@etag_cached('tasks')
 def get_project_tasks(project_id):
     """Get all tasks for a specific project"""
     try:
         project = Project.query.get_or_404(project_id)
-        return jsonify([task.to_dict() for task in project.tasks]), 200
+        return json_array_response(Task.query.filter_by(project_id=project_id).yield_per(100))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -400,6 +532,7 @@ def create_project_task(project_id):
 # 18. GET A SPECIFIC TASK FOR A CERTAIN PROJECT
 # ---------------------------------------------------
 @bp.route('/<project_id>/tasks/<task_id>', methods=['GET'])
+@etag_cached('task')
 def get_task(project_id, task_id):
     """Get a specific task by ID"""
     try:
@@ -421,6 +554,7 @@ def get_task(project_id, task_id):
 # 18. ENDPOINT FOR TRIGGER RESOURCE QUESTIONS CREATIONS BY THE LLM
 # -----------------------------------------------------------------
 @bp.route('/<project_id>/sessions/<session_id>/generate-questions', methods=['POST'])
+@llm_job
 def generate_questions(project_id, session_id):
     """Generate questions for a learning session based on resource documents"""
     try:
@@ -433,15 +567,38 @@ def generate_questions(project_id, session_id):
         if not resource_documents:
             return jsonify({'error': 'No resource documents found for this session'}), 400
 
-        from app.utils.ai_services import generate_question_from_document
-
-        generated_questions = []
-
-        for document in resource_documents:
+        # Only documents already processed by the ingestion pipeline are used
+        ready_documents = [doc for doc in resource_documents if doc.status == DocumentStatus.READY]
+        if not ready_documents:
+            return jsonify({'error': 'Resource documents are still being processed',
+                            'documents': [doc.to_dict() for doc in resource_documents]}), 409
 
-            question_text, answer_text = generate_question_from_document(document.file_path)
+        from app.utils.ai_services import generate_question_from_text
 
-            if question_text.startswith("Error") or question_text.startswith("Could not"):
+        generated_questions = []
+        rejected_duplicates = []
+        max_retries = current_app.config.get('DEDUP_MAX_RETRIES', 2)
+
+        for document in ready_documents:
+
+            text = sample_document_text(document, max_length=10000)
+
+            # Near-duplicates of existing questions are rejected and generation
+            # is retried, telling the model which questions to stay away from
+            avoid = []
+            for attempt in range(max_retries + 1):
+                question_text, answer_text = generate_question_from_text(text, avoid=avoid)
+                if question_text.startswith("Error") or question_text.startswith("Could not"):
+                    break
+                duplicate, similarity = find_duplicate(project_id, question_text)
+                if duplicate is None:
+                    break
+                rejected_duplicates.append({'question': question_text, 'duplicateOf': duplicate.id,
+                                            'similarity': round(similarity, 3)})
+                avoid.append(duplicate.question)
+                question_text = None
+
+            if not question_text or question_text.startswith("Error") or question_text.startswith("Could not"):
                 continue
 
             new_question = Question(
@@ -454,6 +611,8 @@ def generate_questions(project_id, session_id):
 
 
             new_question.resource_documents.append(document)
+            schedule_new_question(new_question, project_id)
+            index_question(new_question, project_id)
             db.session.add(new_question)
             generated_questions.append(new_question)
 
@@ -461,6 +620,7 @@ def generate_questions(project_id, session_id):
 
         return jsonify({
             'message': f'Generated {len(generated_questions)} questions',
+            'rejectedDuplicates': rejected_duplicates,
             'questions': [q.to_dict() for q in generated_questions]
         }), 201
 
@@ -473,6 +633,7 @@ def generate_questions(project_id, session_id):
 # 19. ENDPOINT FOR TRIGGER TEST QUESTIONS CREATIONS BY THE LLM
 # -------------------------------------------------------------
 @bp.route('/<project_id>/sessions/<session_id>/extract-test-questions', methods=['POST'])
+@llm_job
 def extract_test_questions(project_id, session_id):
     """
     Extract questions from TEST documents associated with a learning session.
@@ -487,15 +648,29 @@ def extract_test_questions(project_id, session_id):
         if not test_documents:
             return jsonify({'error': 'No TEST documents associated with this session'}), 400
 
+        # Only documents already processed by the ingestion pipeline are used
+        ready_documents = [doc for doc in test_documents if doc.status == DocumentStatus.READY]
+        if not ready_documents:
+            return jsonify({'error': 'TEST documents are still being processed',
+                            'documents': [doc.to_dict() for doc in test_documents]}), 409
+
         created_questions = []
-        for doc in test_documents:
+        skipped_duplicates = []
+        for doc in ready_documents:
             if doc.category != DocumentCategory.TEST:
                 continue
 
-            from app.utils.ai_services import extract_questions_from_test
-            question_answer_pairs = extract_questions_from_test(doc.file_path)
+            from app.utils.ai_services import extract_questions_from_text
+            question_answer_pairs = extract_questions_from_text(doc.content)
 
             for question_text, answer_text in question_answer_pairs:
+                # A question already in the project is not extracted again
+                duplicate, similarity = find_duplicate(project_id, question_text or '')
+                if duplicate is not None:
+                    skipped_duplicates.append({'question': question_text, 'duplicateOf': duplicate.id,
+                                               'similarity': round(similarity, 3)})
+                    continue
+
                 question = Question(
                     session_id=session_id,
                     question=question_text,
@@ -503,6 +678,8 @@ def extract_test_questions(project_id, session_id):
                     test_document_id=doc.id,
                     source_type=QuestionSourceType.TEST
                 )
+                schedule_new_question(question, project_id)
+                index_question(question, project_id)
                 db.session.add(question)
                 created_questions.append(question)
 
@@ -510,9 +687,440 @@ def extract_test_questions(project_id, session_id):
 
         return jsonify({
             'message': f'Successfully extracted {len(created_questions)} questions from TEST documents',
+            'skippedDuplicates': skipped_duplicates,
             'questions': [q.to_dict() for q in created_questions]
         }), 201
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+# -------------------------------------------------------------
+# 20. ENDPOINT FOR GRADING THE ANSWERS OF A SESSION
+# -------------------------------------------------------------
+@bp.route('/<project_id>/sessions/<session_id>/grade', methods=['POST'])
+@llm_job
+def grade_session_answers(project_id, session_id):
+    """
+    Grade the answers given to the questions of a session and store the result
+    in Question.evaluation and Question.correction.
+    Body: {"answers": [{"questionId": "...", "answer": "..."}, ...]}
+    """
+    try:
+        session = LearningSession.query.get(session_id)
+        if not session or session.project_id != project_id:
+            return jsonify({'error': 'Session not found or does not belong to the project'}), 404
+
+        data = request.get_json()
+        answers = data.get('answers') if data else None
+        if not isinstance(answers, list) or not answers:
+            return jsonify({'error': 'A non-empty list of answers is required'}), 400
+
+        questions = {q.id: q for q in Question.query.options(selectinload(Question.review)).filter(
+            Question.session_id == session_id,
+            Question.id.in_([a.get('questionId') for a in answers])
+        )}
+
+        unknown = [a.get('questionId') for a in answers if a.get('questionId') not in questions]
+        if unknown:
+            return jsonify({'error': 'Questions not found in this session', 'questionIds': unknown}), 400
+
+        from app.utils.grading import grade
+
+        result = grade([{
+            'id': a['questionId'],
+            'question': questions[a['questionId']].question,
+            'reference': questions[a['questionId']].answer,
+            'answer': a.get('answer') or ''
+        } for a in answers], current_app.config)
+
+        for question_id, (evaluation, correction) in result['grades'].items():
+            questions[question_id].evaluation = evaluation
+            questions[question_id].correction = correction
+            record_review(questions[question_id], evaluation)
+
+        db.session.commit()
+
+        return jsonify({
+            'message': f"Graded {len(result['grades'])} answers",
+            'gradedLocally': result['local'],
+            'modelCalls': result['llm_calls'],
+            'failedQuestionIds': result['failed'],
+            'questions': [questions[question_id].to_dict() for question_id in result['grades']]
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 21. NEXT QUESTIONS TO REVIEW (SPACED REPETITION)
+# -------------------------------------------------------------
+@bp.route('/<project_id>/review/next', methods=['GET'])
+def get_next_review(project_id):
+    """Get the n most overdue questions of a project (default 20, max 200)"""
+    try:
+        project = Project.query.get_or_404(project_id)
+
+        n = request.args.get('n', 20, type=int)
+        if n <= 0:
+            return jsonify({'error': 'n must be a positive integer'}), 400
+
+        states = due_questions(project_id, min(n, 200))
+
+        return jsonify([dict(state.question.to_dict(), review=state.to_dict()) for state in states]), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 22. MERGE THE NEAR-DUPLICATE QUESTIONS OF A PROJECT
+# -------------------------------------------------------------
+@bp.route('/<project_id>/questions/dedupe', methods=['POST'])
+def dedupe_project_questions(project_id):
+    """
+    Rebuild the near-duplicate index of a project and merge the duplicates.
+    Body (optional): {"threshold": 0.6, "dryRun": false}
+    """
+    data = request.get_json(silent=True) or {}
+    threshold = data.get('threshold')
+    if threshold is not None and (isinstance(threshold, bool) or not isinstance(threshold, (int, float))
+                                  or not 0 < threshold <= 1):
+        return jsonify({'error': 'threshold must be a number in (0, 1]'}), 400
+
+    try:
+        project = Project.query.get_or_404(project_id)
+
+        merges = dedupe_project(project_id, threshold=threshold, dry_run=bool(data.get('dryRun')))
+
+        return jsonify({
+            'message': f"{len(merges)} duplicate questions {'found' if data.get('dryRun') else 'merged'}",
+            'duplicates': [{'keptId': kept, 'duplicateId': duplicate, 'similarity': round(score, 3)}
+                           for kept, duplicate, score in merges]
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 23. EXPORT A WHOLE PROJECT AS A STREAMED ARCHIVE
+# -------------------------------------------------------------
+@bp.route('/<project_id>/export', methods=['GET'])
+def export_project_archive(project_id):
+    """
+    Stream a tar archive of the project: NDJSON records of every table plus the
+    uploaded files. Use ?compress=gzip for a .tar.gz.
+    """
+    try:
+        project = Project.query.get_or_404(project_id)
+
+        chunks = export_project(project_id)
+        filename = f'project-{project_id}.tar'
+        mimetype = 'application/x-tar'
+        if request.args.get('compress') == 'gzip':
+            chunks = gzip_stream(chunks)
+            filename += '.gz'
+            mimetype = 'application/gzip'
+
+        response = current_app.response_class(stream_with_context(chunks), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 24. IMPORT A PROJECT ARCHIVE
+# -------------------------------------------------------------
+@bp.route('/import', methods=['POST'])
+def import_project_archive():
+    """
+    Import an archive produced by the export endpoint (raw tar or tar.gz body).
+    The project and all its records get new ids.
+    """
+    try:
+        # The archive is read straight from the WSGI input: MAX_CONTENT_LENGTH is
+        # meant for uploads that are buffered, imports have their own limit
+        stream = get_input_stream(request.environ,
+                                  max_content_length=current_app.config['IMPORT_MAX_CONTENT_LENGTH'])
+
+        project_id, counts = import_project(stream)
+
+        return jsonify({
+            'message': 'Project imported successfully',
+            'projectId': project_id,
+            'imported': counts
+        }), 201
+    except (ValueError, tarfile.TarError) as e:
+        return jsonify({'error': f'Invalid archive: {e}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 25. BULK UPDATE OF TASKS
+# -------------------------------------------------------------
+def _validate_completed(value):
+    if not isinstance(value, bool):
+        raise ValueError('completed must be true or false')
+    return value
+
+
+def _validate_evaluation(value):
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                              or not 0 <= value <= 100):
+        raise ValueError('evaluation must be a number between 0 and 100 (or null)')
+    return float(value) if value is not None else None
+
+
+def _validate_correction(value):
+    if value is not None and not isinstance(value, str):
+        raise ValueError('correction must be a string (or null)')
+    return value
+
+
+@bp.route('/<project_id>/tasks', methods=['PATCH'])
+def update_project_tasks(project_id):
+    """
+    Update many tasks in one transaction.
+    Body: {"tasks": [{"id": "...", "version": 3, "completed": true}, ...]}
+
+    Each update carries the version it is based on; tasks modified since are
+    returned in `conflicts` (with their current values) and left untouched.
+    Only the tasks that actually changed are returned in `updated`.
+    """
+    try:
+        project = Project.query.get_or_404(project_id)
+        data = request.get_json(silent=True) or {}
+
+        patches = parse_patches(data.get('tasks'), {'completed': ('completed', _validate_completed)})
+        result = apply_patches(Task, Task.project_id == project_id, patches)
+        if result['changed']:
+            adjust_counters(project_id, completed_task_count=sum(
+                bool(values['completed']) - bool(result['previous'][task_id].completed)
+                for task_id, values in result['changed'].items()))
+            record_changes('task', result['changed'], project_id)
+            bump_project_version(project_id)
+        db.session.commit()
+
+        return jsonify({
+            'updated': [{'id': task_id, 'completed': values['completed'], 'version': version}
+                        for task_id, values, version in _changed_rows(Task, result['changed'])],
+            'conflicts': [{'id': row.id, 'completed': row.completed, 'version': row.version}
+                          for row in result['conflicts']],
+            'notFound': result['not_found']
+        }), 200
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except ConcurrentUpdateError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+def _changed_rows(model, changed):
+    """(id, changed values, new version) of the updated rows."""
+    if not changed:
+        return []
+    versions = dict(db.session.query(model.id, model.version).filter(model.id.in_(list(changed))))
+    return [(row_id, values, versions[row_id]) for row_id, values in changed.items()]
+
+
+# -------------------------------------------------------------
+# 26. BULK UPDATE OF QUESTIONS (CORRECTION / EVALUATION)
+# -------------------------------------------------------------
+@bp.route('/<project_id>/questions', methods=['PATCH'])
+def update_project_questions(project_id):
+    """
+    Update the correction and/or evaluation of many questions in one transaction.
+    Body: {"questions": [{"id": "...", "version": 2, "evaluation": 80, "correction": "..."}, ...]}
+
+    Same concurrency rules as the task bulk update. A new evaluation also
+    moves the question's review schedule.
+    """
+    try:
+        project = Project.query.get_or_404(project_id)
+        data = request.get_json(silent=True) or {}
+
+        patches = parse_patches(data.get('questions'), {
+            'evaluation': ('evaluation', _validate_evaluation),
+            'correction': ('correction', _validate_correction),
+        })
+        sessions = db.session.query(LearningSession.id).filter(LearningSession.project_id == project_id)
+        result = apply_patches(Question, Question.session_id.in_(sessions), patches)
+
+        evaluated = {question_id: values['evaluation'] for question_id, values in result['changed'].items()
+                     if values.get('evaluation') is not None}
+        if evaluated:
+            for question in Question.query.options(selectinload(Question.review)).filter(
+                    Question.id.in_(list(evaluated))):
+                if question.review is None:
+                    schedule_new_question(question, project_id)
+                record_review(question, evaluated[question.id])
+        if result['changed']:
+            record_changes('question', result['changed'], project_id)
+            bump_project_version(project_id)
+        db.session.commit()
+
+        return jsonify({
+            'updated': [dict(values, id=question_id, version=version)
+                        for question_id, values, version in _changed_rows(Question, result['changed'])],
+            'conflicts': [{'id': row.id, 'version': row.version,
+                           **{column: getattr(row, column) for column in ('evaluation', 'correction')
+                              if column in row._fields}}
+                          for row in result['conflicts']],
+            'notFound': result['not_found']
+        }), 200
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except ConcurrentUpdateError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 27. DELETE A PROJECT
+# -------------------------------------------------------------
+@bp.route('/<project_id>', methods=['DELETE'])
+def remove_project(project_id):
+    """
+    Delete a project with its documents, sessions, questions, tasks and
+    milestones, in chunked set-based deletes (see app.utils.deletion). Its
+    upload directory is removed in the background.
+    """
+    try:
+        counts = delete_project(project_id)
+        if counts is None:
+            return jsonify({'error': 'Project not found'}), 404
+        schedule_sweep(current_app._get_current_object(), [project_id])
+
+        return jsonify({'message': 'Project deleted', 'deleted': counts}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 28. DELETE A LEARNING SESSION
+# -------------------------------------------------------------
+@bp.route('/<project_id>/sessions/<session_id>', methods=['DELETE'])
+def remove_session(project_id, session_id):
+    """Delete a learning session with its questions (the documents stay)."""
+    try:
+        session = LearningSession.query.get(session_id)
+        if not session or session.project_id != project_id:
+            return jsonify({'error': 'Session not found or does not belong to the project'}), 404
+
+        counts = delete_session(session_id)
+
+        return jsonify({'message': 'Session deleted', 'deleted': counts}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 29. SUMMARY OF ALL THE PROJECTS (COUNTS ONLY)
+# -------------------------------------------------------------
+@bp.route('/summary', methods=['GET'])
+@etag_cached('projects-summary')
+def get_projects_summary():
+    """
+    Every project with its counts (documents, sessions, questions, tasks,
+    completed tasks, study minutes) and metrics, read from the project table
+    only (see app.utils.counters).
+    """
+    try:
+        return json_array_response(Project.query.yield_per(500), serialize=lambda project: project.to_summary())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 30. LLM TOKEN BUDGET OF A PROJECT
+# -------------------------------------------------------------
+@bp.route('/<project_id>/budget', methods=['GET', 'PUT'])
+def project_budget(project_id):
+    """
+    Model tokens the project may use per calendar month (UTC), and how many
+    it used. Once they are exhausted, generating, extracting and grading
+    questions answer 429 (see app.utils.usage).
+    Body (PUT): {"tokens": <int, 0 for unlimited, null for the default LLM_TOKEN_BUDGET>}
+    """
+    try:
+        project = Project.query.get_or_404(project_id)
+
+        if request.method == 'PUT':
+            data = request.get_json() or {}
+            if 'tokens' not in data:
+                return jsonify({'error': 'tokens is required'}), 400
+            tokens = data['tokens']
+            if tokens is not None and (not isinstance(tokens, int) or isinstance(tokens, bool) or tokens < 0):
+                return jsonify({'error': 'tokens must be a non-negative integer or null'}), 400
+            project.token_budget = tokens
+            db.session.commit()
+
+        return jsonify(budget_status(project)), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 31. MOVE THE OLD SESSIONS OF A PROJECT TO COLD STORAGE
+# -------------------------------------------------------------
+@bp.route('/<project_id>/sessions/archive', methods=['POST'])
+def archive_project_sessions(project_id):
+    """
+    Archive the sessions started before a date (see app.utils.cold_storage).
+    They keep counting in the project summary and come back on first access.
+    Body: {"before": "<ISO 8601>"} or {"olderThanDays": 365} (default SESSION_ARCHIVE_AFTER_DAYS)
+    """
+    try:
+        project = Project.query.get_or_404(project_id)
+        data = request.get_json(silent=True) or {}
+
+        if data.get('before'):
+            before = datetime.fromisoformat(data['before'])
+        else:
+            days = data.get('olderThanDays', current_app.config['SESSION_ARCHIVE_AFTER_DAYS'])
+            if not isinstance(days, int) or isinstance(days, bool) or days < 0:
+                return jsonify({'error': 'olderThanDays must be a non-negative integer'}), 400
+            before = datetime.utcnow() - timedelta(days=days)
+
+        counts = archive_sessions(before, project_id)
+
+        return jsonify({'message': f"Archived {counts['sessions']} sessions", 'archived': counts}), 200
+    except ValueError:
+        return jsonify({'error': 'Invalid date format (use ISO 8601)'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# -------------------------------------------------------------
+# 32. SUMMARIES OF THE ARCHIVED SESSIONS OF A PROJECT
+# -------------------------------------------------------------
+@bp.route('/<project_id>/sessions/archived', methods=['GET'])
+@etag_cached('archived-sessions')
+def get_archived_sessions(project_id):
+    """
+    Summaries of the sessions in cold storage, oldest first. Any request to
+    /sessions/<session_id> rehydrates the full session.
+    """
+    try:
+        project = Project.query.get_or_404(project_id)
+        return json_array_response(ArchivedSession.query.filter_by(project_id=project_id)
+                                   .order_by(ArchivedSession.timestamp, ArchivedSession.id).yield_per(500))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify
+from sqlalchemy import func
+
+from app.models.models import LlmUsage
+from app.utils.usage import usage_totals
+
+bp = Blueprint('usage', __name__, url_prefix='/api/usage')
+
+# groupBy values -> column
+GROUPS = {
+    'project': LlmUsage.project_id,
+    'session': LlmUsage.session_id,
+    'operation': LlmUsage.operation,
+    'model': LlmUsage.model,
+    'day': func.date(LlmUsage.created_at),
+}
+
+
+# -------------------------------------------------------------
+# 1. TOKENS, COST AND LATENCY OF THE MODEL CALLS
+# -------------------------------------------------------------
+@bp.route('/', methods=['GET'], strict_slashes=False)
+def get_usage():
+    """
+    Calls, prompt/response tokens, cost (USD, null for models without a
+    known price) and average latency of the model calls between `from` and
+    `to` (ISO 8601, `to` excluded), in total and per group.
+
+    Query: ?projectId=&sessionId=&from=&to=&groupBy=project|session|operation|model|day
+
+    Calls made in the last USAGE_FLUSH_INTERVAL seconds may not be counted
+    yet (see app.utils.usage).
+    """
+    filters = {}
+    for arg, key in (('projectId', 'project_id'), ('sessionId', 'session_id')):
+        if request.args.get(arg):
+            filters[key] = request.args[arg]
+    try:
+        for arg, key in (('from', 'start'), ('to', 'end')):
+            if request.args.get(arg):
+                filters[key] = datetime.fromisoformat(request.args[arg])
+    except ValueError:
+        return jsonify({'error': 'Invalid date format (use ISO 8601)'}), 400
+
+    group_by = request.args.get('groupBy')
+    if group_by is not None and group_by not in GROUPS:
+        return jsonify({'error': f'groupBy must be one of {", ".join(GROUPS)}'}), 400
+
+    try:
+        result = {'totals': usage_totals(**filters)[0]}
+        if group_by is not None:
+            result['groups'] = usage_totals(GROUPS[group_by], **filters)
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,133 @@
+"""
+Production server.
+
+Runs the app under gunicorn with preforked worker processes, each serving
+requests with a pool of threads (gthread worker):
+
+    python -m app.server                      # or: python run.py --production
+    python -m app.server --bind 0.0.0.0:8000 --workers 4 --threads 8
+
+Settings come from the command line or the WEB_* environment variables:
+
+    WEB_BIND                  address to listen on (default 127.0.0.1:8000)
+    WEB_WORKERS               worker processes (default 2 x CPUs + 1)
+    WEB_THREADS               threads per worker (default 4)
+    WEB_MAX_REQUESTS          recycle a worker after this many requests (default 1000, 0 = never),
+                              so the memory held after parsing large PDFs is given back
+    WEB_MAX_REQUESTS_JITTER   random extra requests so workers do not all restart at once (default 100)
+    WEB_TIMEOUT               seconds before a silent worker is killed (default 120, model calls are slow)
+    WEB_GRACEFUL_TIMEOUT      seconds a worker has to finish its requests on reload/stop (default 30)
+    WEB_KEEPALIVE             seconds to keep idle client connections open (default 5)
+    WEB_PRELOAD               load the app once in the master before forking (default true)
+
+The app is loaded in the master and forked (copy-on-write), so workers start
+fast and share the imported code. Each worker opens its own database
+connections after the fork. On a single CPU, more than one worker was
+measured to be slower than the development server; see the README for the
+numbers.
+
+Signals (to the master): HUP reloads the configuration and replaces the
+workers gracefully; with a preloaded app new code needs USR2 (start a new
+master) then WINCH and QUIT to the old one. TERM stops gracefully.
+"""
+import argparse
+import multiprocessing
+import os
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+def server_options(**overrides):
+    """Gunicorn settings from the environment, with explicit overrides."""
+    options = {
+        'bind': os.getenv('WEB_BIND', '127.0.0.1:8000'),
+        'workers': int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1)),
+        'threads': int(os.getenv('WEB_THREADS', 4)),
+        'worker_class': 'gthread',
+        'max_requests': int(os.getenv('WEB_MAX_REQUESTS', 1000)),
+        'max_requests_jitter': int(os.getenv('WEB_MAX_REQUESTS_JITTER', 100)),
+        'timeout': int(os.getenv('WEB_TIMEOUT', 120)),
+        'graceful_timeout': int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30)),
+        'keepalive': int(os.getenv('WEB_KEEPALIVE', 5)),
+        'preload_app': _env_bool('WEB_PRELOAD', True),
+        'accesslog': '-',
+        'post_fork': _post_fork,
+        'worker_exit': _worker_exit,
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return options
+
+
+# -----------------------------------------------
+# WORKER HOOKS
+# -----------------------------------------------
+def _post_fork(server, worker):
+    # Connections opened by the master while preloading must not be shared
+    # between processes: drop them, each worker opens its own
+    from app import db
+
+    app = server.app.application
+    if app is None:
+        return
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def _worker_exit(server, worker):
+    # Let background ingestion finish before a recycled worker goes away,
+    # otherwise its documents would stay PROCESSING (same for file sweeps,
+    # and for the buffered LLM usage rows)
+    from app.utils.ingestion import shutdown_ingestion
+    from app.utils.deletion import shutdown_sweeper
+    from app.utils.usage import shutdown_usage
+
+    shutdown_ingestion()
+    shutdown_sweeper()
+    shutdown_usage()
+
+
+def serve(app=None, **overrides):
+    """Run the app (created with create_app() if not given) under gunicorn."""
+    from gunicorn.app.base import BaseApplication
+
+    class ProductionServer(BaseApplication):
+
+        def __init__(self, options):
+            self.options = options
+            self.application = app
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            if self.application is None:
+                from app import create_app
+                self.application = create_app()
+            return self.application
+
+    options = server_options(**overrides)
+    if options['preload_app'] and app is None:
+        from app import create_app
+        app = create_app()
+    ProductionServer(options).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Purplle API with the production server')
+    parser.add_argument('--bind', help='address to listen on, e.g. 0.0.0.0:8000')
+    parser.add_argument('--workers', type=int, help='worker processes')
+    parser.add_argument('--threads', type=int, help='threads per worker')
+    parser.add_argument('--max-requests', type=int, help='recycle workers after N requests')
+    parser.add_argument('--keepalive', type=int, help='keep-alive seconds')
+    args = parser.parse_args(argv)
+
+    serve(bind=args.bind, workers=args.workers, threads=args.threads, max_requests=args.max_requests,
+          keepalive=args.keepalive)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@ import tempfile
 import time
 
 
-BASE_URL = "http://localhost:5000/api"
+BASE_URL = os.getenv("API_BASE_URL", "http://localhost:5000/api")
 PROJECTS_URL = f"{BASE_URL}/projects"
 
 
@@ -0,0 +1,38 @@
+"""
+Columnar snapshots: npz output without numpy, and ids of any shape.
+"""
+import ast
+import io
+import zipfile
+
+
+def _npz_column(data, name):
+    """dtype and values of a string column of an .npz snapshot (read without numpy)."""
+    member = zipfile.ZipFile(io.BytesIO(data)).read(f'{name}.npy')
+    header_length = int.from_bytes(member[8:10], 'little')
+    header = ast.literal_eval(member[10:10 + header_length].decode('latin1'))
+    width = int(header['descr'][2:])
+    body = member[10 + header_length:]
+    return header['descr'], [body[i:i + width * 4].decode('utf-32-le').rstrip('\0')
+                             for i in range(0, len(body), width * 4)]
+
+
+def test_snapshot_of_a_project_with_a_client_supplied_id(client):
+    project_id = 'my-project-with-a-client-supplied-id-longer-than-a-uuid'
+    assert client.post('/api/projects/', json={'name': 'p', 'id': project_id}).status_code == 201
+    for name in ('Read chapter 1', 'Read chapter 2'):
+        client.post(f'/api/projects/{project_id}/tasks', json={'name': name})
+
+    r = client.get(f'/api/analytics/snapshots/tasks?projectId={project_id}&format=npz')
+
+    assert r.status_code == 200
+    dtype, values = _npz_column(r.data, 'project_id')
+    assert dtype == f'<U{len(project_id)}' and values == [project_id, project_id]
+    assert sorted(_npz_column(r.data, 'name')[1]) == ['Read chapter 1', 'Read chapter 2']
+
+
+def test_snapshot_of_an_unknown_project_is_empty(client):
+    r = client.get('/api/analytics/snapshots/sessions?projectId=missing&format=npz')
+
+    assert r.status_code == 200
+    assert _npz_column(r.data, 'id') == ('<U1', [])
@@ -0,0 +1,87 @@
+"""
+Project export and import: the round trip, unsafe file names in an archive,
+and documents exported while they were being processed.
+"""
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+from app import db
+from app.models.models import Document, DocumentStatus, Project
+from app.utils.counters import counter_drift
+
+
+def _rewrite(archive, filename):
+    """The archive with every document (record and file) renamed to `filename`."""
+    source = tarfile.open(fileobj=io.BytesIO(archive))
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode='w') as target:
+        for member in source:
+            data = source.extractfile(member).read() if member.isfile() else b''
+            name = member.name
+            if name.endswith('_document.ndjson'):
+                rows = [json.loads(line) for line in data.splitlines() if line.strip()]
+                for row in rows:
+                    row['filename'] = filename
+                data = b''.join(json.dumps(row).encode() + b'\n' for row in rows)
+            elif name.startswith('files/'):
+                name = name.rsplit('/', 1)[0] + '/' + filename
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            target.addfile(info, io.BytesIO(data))
+    return out.getvalue()
+
+
+def test_import_round_trip(app, client, project):
+    archive = client.get(f"/api/projects/{project['id']}/export").get_data()
+
+    r = client.post('/api/projects/import', data=archive, content_type='application/x-tar')
+
+    assert r.status_code == 201
+    imported = r.get_json()['projectId']
+    assert imported != project['id']
+    summaries = {p['id']: p['counts'] for p in client.get('/api/projects/summary').get_json()}
+    assert summaries[imported] == summaries[project['id']]
+    with app.app_context():
+        assert counter_drift() == []
+        document = Document.query.filter_by(project_id=imported).first()
+        assert document.file_path.startswith(os.path.join('uploads', imported))
+    r = client.get(f'/api/projects/{imported}/documents/{document.id}/download')
+    assert r.status_code == 200 and r.get_data().startswith(b'Slides')
+
+
+def test_import_accepts_gzip(client, project):
+    archive = client.get(f"/api/projects/{project['id']}/export?compress=gzip").get_data()
+
+    assert client.post('/api/projects/import', data=archive, content_type='application/gzip').status_code == 201
+
+
+@pytest.mark.parametrize('filename', ['../../../../etc/hostname', '/etc/hostname', 'a/../../x', '..'])
+def test_import_rejects_unsafe_file_names(app, client, project, filename):
+    archive = _rewrite(client.get(f"/api/projects/{project['id']}/export").get_data(), filename)
+
+    r = client.post('/api/projects/import', data=archive, content_type='application/x-tar')
+
+    assert r.status_code == 400
+    with app.app_context():
+        assert Project.query.count() == 1
+
+
+def test_import_requeues_documents_exported_while_processing(app, client, project):
+    with app.app_context():
+        db.session.get(Document, project['documents'][0]).status = DocumentStatus.PROCESSING
+        db.session.commit()
+    archive = client.get(f"/api/projects/{project['id']}/export").get_data()
+
+    imported = client.post('/api/projects/import', data=archive, content_type='application/x-tar').get_json()['projectId']
+
+    with app.app_context():
+        statuses = {document.status for document in Document.query.filter_by(project_id=imported)}
+        assert DocumentStatus.PROCESSING not in statuses
+
+
+def test_import_rejects_garbage(client):
+    assert client.post('/api/projects/import', data=b'not a tar archive').status_code == 400
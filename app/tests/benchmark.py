@@ -0,0 +1,655 @@
+"""
+Benchmark harness for the Purplle REST API.
+
+Seeds a synthetic dataset (projects x sessions x questions x documents), drives
+every endpoint of the projects blueprint with concurrent clients and reports
+p50/p95/p99 latency, throughput and SQL query counts per endpoint. Results are
+saved as JSON so regressions can be compared across commits.
+
+By default the benchmark runs in-process through the Flask test client against
+a throw-away SQLite database. Pass --base-url to drive a running server
+instead (SQL counts are not available in that mode, the dataset is seeded
+through the database configured in the environment), or --serve to start the
+development server (`flask run --debug`, as run.py does) or the production
+server (app.server) on the throw-away database and drive it over HTTP.
+
+Usage:
+    python -m app.tests.benchmark --projects 20 --sessions 10 --questions 20 --documents 5
+    python -m app.tests.benchmark --clients 8 --requests 200 --output bench_results/run.json
+    python -m app.tests.benchmark --compare bench_results/previous.json
+    python -m app.tests.benchmark --serve dev --clients 16 --llm skip
+    python -m app.tests.benchmark --serve production --clients 16 --llm skip
+    python -m app.tests.benchmark --database-uri postgresql+psycopg://localhost/purplle_bench
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+# -----------------------------------------------
+# SQL STATEMENT COUNTING
+# -----------------------------------------------
+_sql_counter = threading.local()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    _sql_counter.value = getattr(_sql_counter, 'value', 0) + 1
+
+
+def _sql_count():
+    return getattr(_sql_counter, 'value', 0)
+
+
+# -----------------------------------------------
+# CLIENTS
+# -----------------------------------------------
+class FlaskClient:
+    """Drives the app in-process. One test client per worker thread."""
+
+    counts_sql = True
+
+    def __init__(self, app, headers=None):
+        self.app = app
+        self.headers = headers or {}
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def request(self, method, path, json_body=None, form=None, upload=None):
+        data = None
+        if form is not None or upload is not None:
+            data = dict(form or {})
+            if upload is not None:
+                data['file'] = (io.BytesIO(upload[1]), upload[0])
+        response = self._client().open(path, method=method, json=json_body, data=data, headers=self.headers)
+        return response.status_code, len(response.get_data())
+
+
+class HttpClient:
+    """Drives a running server over HTTP. One requests session per worker thread."""
+
+    counts_sql = False
+
+    def __init__(self, base_url, headers=None):
+        import requests
+
+        self._requests = requests
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers or {}
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = self._requests.Session()
+            self._local.session.headers.update(self.headers)
+        return self._local.session
+
+    def request(self, method, path, json_body=None, form=None, upload=None):
+        files = {'file': upload} if upload is not None else None
+        response = self._session().request(method, self.base_url + path, json=json_body, data=form, files=files,
+                                           stream=True)
+        # Bytes on the wire (still compressed)
+        return response.status_code, len(response.raw.read(decode_content=False))
+
+
+# -----------------------------------------------
+# SERVERS
+# -----------------------------------------------
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workdir, port, timeout=30):
+    """
+    Start the development ('dev') or production ('production') server in a
+    subprocess, in its own process group, and wait until it accepts connections.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.getenv('PYTHONPATH')])))
+    if mode == 'dev':
+        command = [sys.executable, '-m', 'flask', '--app', os.path.join(root, 'run.py'), 'run', '--debug',
+                   '--port', str(port)]
+    else:
+        command = [sys.executable, '-m', 'app.server', '--bind', f'127.0.0.1:{port}']
+
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'The {mode} server exited with code {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'The {mode} server did not start within {timeout}s')
+
+
+def stop_server(process):
+    """Stop a server started by start_server, reloader/worker processes included."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+# -----------------------------------------------
+# SYNTHETIC DATASET
+# -----------------------------------------------
+def seed_dataset(app, workdir, projects, sessions, questions, documents, seed=42):
+    """
+    Insert a synthetic dataset directly through the models.
+
+    Args:
+        app: Flask application bound to the target database
+        workdir (str): Directory where the uploaded files are written
+        projects (int): Number of projects
+        sessions (int): Learning sessions per project
+        questions (int): Questions per learning session
+        documents (int): Documents per project (alternating RESOURCE/TEST)
+        seed (int): Seed for the random generator
+
+    Returns:
+        dict: Ids of the seeded rows, used to build the request paths
+    """
+    from app import db
+    from app.models.models import (Project, Document, DocumentCategory, DocumentChunk, DocumentStatus,
+                                   LearningSession, Question, QuestionSourceType, Milestone, Task)
+    from app.models.types import new_id
+    from app.utils.ingestion import chunk_text
+    from app.utils.scheduler import schedule_new_question
+
+    rng = random.Random(seed)
+    ids = {'projects': [], 'documents': {}, 'sessions': {}, 'questions': {}, 'milestones': {}, 'tasks': {}}
+    now = datetime.datetime.utcnow()
+
+    with app.app_context():
+        for p in range(projects):
+            project = Project(id=new_id(), name=f'Bench project {p}',
+                              motivations=['benchmark'], overall_performance=rng.uniform(0, 100),
+                              difficulty=rng.uniform(0, 100), interest=rng.uniform(0, 100))
+            db.session.add(project)
+
+            folder = os.path.join(workdir, 'uploads', project.id)
+            os.makedirs(folder, exist_ok=True)
+            docs = []
+            for d in range(documents):
+                category = DocumentCategory.RESOURCE if d % 2 == 0 else DocumentCategory.TEST
+                filename = f'doc_{d}.txt'
+                path = os.path.join(folder, filename)
+                text = f'Synthetic document {d} of project {p}.\n' * 50
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                # Seeded as already ingested, like documents uploaded long ago
+                doc = Document(id=new_id(), project_id=project.id, filename=filename,
+                               category=category, file_path=path, content=text, char_count=len(text),
+                               size_bytes=len(text.encode()), status=DocumentStatus.READY)
+                doc.chunks.extend(DocumentChunk(position=i, char_offset=offset, content=passage)
+                                  for i, (offset, passage) in enumerate(chunk_text(text)))
+                docs.append(doc)
+            db.session.add_all(docs)
+            resources = [doc for doc in docs if doc.category == DocumentCategory.RESOURCE]
+            tests = [doc for doc in docs if doc.category == DocumentCategory.TEST]
+
+            milestones = [Milestone(id=new_id(), name=f'Milestone {m}', project_id=project.id,
+                                    due_date=now + datetime.timedelta(days=7 * (m + 1)), is_deadline=(m == 2))
+                          for m in range(3)]
+            db.session.add_all(milestones)
+            tasks = [Task(id=new_id(), name=f'Task {t}', project_id=project.id,
+                          milestone_id=milestones[t % len(milestones)].id, completed=rng.random() < 0.5)
+                     for t in range(5)]
+            db.session.add_all(tasks)
+
+            session_ids = []
+            session_questions = {}
+            for s in range(sessions):
+                session = LearningSession(id=new_id(), project_id=project.id,
+                                          duration_minutes=rng.randint(15, 180),
+                                          timestamp=now - datetime.timedelta(days=s),
+                                          awareness_level=rng.uniform(0, 100),
+                                          confidence_level=rng.uniform(0, 100))
+                session.resource_documents.extend(resources[:2])
+                session.test_documents.extend(tests[:1])
+                for q in range(questions):
+                    from_test = bool(tests) and q % 3 == 0
+                    question = Question(session=session,
+                                        question=f'Synthetic question {q} of session {s}?',
+                                        answer=f'Synthetic answer {q}.',
+                                        evaluation=rng.uniform(0, 100),
+                                        source_type=QuestionSourceType.TEST if from_test else QuestionSourceType.RESOURCE,
+                                        test_document_id=tests[0].id if from_test else None)
+                    if not from_test and resources:
+                        question.resource_documents.append(resources[q % len(resources)])
+                    schedule_new_question(question, project.id, now - datetime.timedelta(hours=rng.randint(-48, 48)))
+                db.session.add(session)
+                session_ids.append(session.id)
+                session_questions[session.id] = list(session.questions)
+
+            db.session.commit()
+
+            ids['projects'].append(project.id)
+            ids['documents'][project.id] = [(doc.id, doc.category.name) for doc in docs]
+            ids['sessions'][project.id] = session_ids
+            ids['milestones'][project.id] = [m.id for m in milestones]
+            ids['tasks'][project.id] = [t.id for t in tasks]
+            for session_id, session_question_list in session_questions.items():
+                ids['questions'][session_id] = [(q.id, q.answer) for q in session_question_list]
+
+    return ids
+
+
+# -----------------------------------------------
+# SCENARIOS: one per endpoint of the projects blueprint
+# -----------------------------------------------
+def _pick_project(ids, rng):
+    return rng.choice(ids['projects'])
+
+
+def _pick_document(ids, rng, project_id, category=None):
+    docs = [d for d, c in ids['documents'][project_id] if category is None or c == category]
+    return rng.choice(docs) if docs else None
+
+
+def _scenarios():
+    """
+    Each scenario returns (method, path, kwargs) for a random target, or None
+    when the dataset has nothing to target (e.g. zero documents).
+    """
+    base = '/api/projects'
+
+    def get_all_projects(ids, rng):
+        return 'GET', f'{base}/', {}
+
+    def get_projects_summary(ids, rng):
+        return 'GET', f'{base}/summary', {}
+
+    def get_project(ids, rng):
+        return 'GET', f'{base}/{_pick_project(ids, rng)}', {}
+
+    def get_project_documents(ids, rng):
+        return 'GET', f'{base}/{_pick_project(ids, rng)}/documents', {}
+
+    def get_document(ids, rng):
+        pid = _pick_project(ids, rng)
+        did = _pick_document(ids, rng, pid)
+        return did and ('GET', f'{base}/{pid}/documents/{did}', {})
+
+    def download_document(ids, rng):
+        pid = _pick_project(ids, rng)
+        did = _pick_document(ids, rng, pid)
+        return did and ('GET', f'{base}/{pid}/documents/{did}/download', {})
+
+    def get_document_content(ids, rng):
+        pid = _pick_project(ids, rng)
+        did = _pick_document(ids, rng, pid)
+        return did and ('GET', f'{base}/{pid}/documents/{did}/content?offset={rng.randint(0, 1024)}', {})
+
+    def download_document_text(ids, rng):
+        pid = _pick_project(ids, rng)
+        did = _pick_document(ids, rng, pid)
+        return did and ('GET', f'{base}/{pid}/documents/{did}/text', {})
+
+    def get_project_milestones(ids, rng):
+        return 'GET', f'{base}/{_pick_project(ids, rng)}/milestones', {}
+
+    def get_milestone(ids, rng):
+        pid = _pick_project(ids, rng)
+        return 'GET', f'{base}/{pid}/milestones/{rng.choice(ids["milestones"][pid])}', {}
+
+    def get_milestones_calendar(ids, rng):
+        until = datetime.datetime.utcnow() + datetime.timedelta(days=rng.choice([7, 30]))
+        return 'GET', f'/api/milestones?to={until.isoformat()}&deadlineOnly={rng.random() < 0.5}', {}
+
+    def get_project_changes(ids, rng):
+        # Full sync of a project through the change feed (first page)
+        return 'GET', f'/api/changes?since=0&projectId={_pick_project(ids, rng)}', {}
+
+    def get_project_sessions(ids, rng):
+        return 'GET', f'{base}/{_pick_project(ids, rng)}/sessions', {}
+
+    def get_session(ids, rng):
+        pid = _pick_project(ids, rng)
+        sessions = ids['sessions'][pid]
+        return sessions and ('GET', f'{base}/{pid}/sessions/{rng.choice(sessions)}', {})
+
+    def get_next_review(ids, rng):
+        return 'GET', f'{base}/{_pick_project(ids, rng)}/review/next?n=20', {}
+
+    def get_project_tasks(ids, rng):
+        return 'GET', f'{base}/{_pick_project(ids, rng)}/tasks', {}
+
+    def get_task(ids, rng):
+        pid = _pick_project(ids, rng)
+        return 'GET', f'{base}/{pid}/tasks/{rng.choice(ids["tasks"][pid])}', {}
+
+    def create_project(ids, rng):
+        return 'POST', f'{base}/', {'json_body': {'name': f'Bench {uuid.uuid4().hex[:8]}', 'interest': 50}}
+
+    def add_document(ids, rng):
+        upload = (f'upload_{rng.randint(0, 9)}.txt', b'Uploaded benchmark content.\n' * 20)
+        return 'POST', f'{base}/{_pick_project(ids, rng)}/documents', {'form': {'category': 'RESOURCE'},
+                                                                        'upload': upload}
+
+    def add_milestone(ids, rng):
+        date = (datetime.datetime.utcnow() + datetime.timedelta(days=rng.randint(1, 90))).isoformat()
+        return 'POST', f'{base}/{_pick_project(ids, rng)}/milestones', {
+            'json_body': {'name': 'Bench milestone', 'date': date, 'isDeadline': rng.random() < 0.2}}
+
+    def create_learning_session(ids, rng):
+        return 'POST', f'{base}/{_pick_project(ids, rng)}/sessions', {
+            'json_body': {'durationMinutes': rng.randint(15, 120), 'metrics': {'energyLevel': 50}}}
+
+    def add_documents_to_session(ids, rng):
+        pid = _pick_project(ids, rng)
+        sessions = ids['sessions'][pid]
+        if not sessions:
+            return None
+        body = {'resourceDocumentIds': [d for d, c in ids['documents'][pid] if c == 'RESOURCE'][:3],
+                'testDocumentIds': [d for d, c in ids['documents'][pid] if c == 'TEST'][:3]}
+        return 'POST', f'{base}/{pid}/sessions/{rng.choice(sessions)}/documents', {'json_body': body}
+
+    def create_project_task(ids, rng):
+        pid = _pick_project(ids, rng)
+        return 'POST', f'{base}/{pid}/tasks', {
+            'json_body': {'name': 'Bench task', 'milestone_id': rng.choice(ids['milestones'][pid])}}
+
+    def generate_questions(ids, rng):
+        pid = _pick_project(ids, rng)
+        sessions = ids['sessions'][pid]
+        return sessions and ('POST', f'{base}/{pid}/sessions/{rng.choice(sessions)}/generate-questions', {})
+
+    def extract_test_questions(ids, rng):
+        pid = _pick_project(ids, rng)
+        sessions = ids['sessions'][pid]
+        return sessions and ('POST', f'{base}/{pid}/sessions/{rng.choice(sessions)}/extract-test-questions', {})
+
+    def grade_session_answers(ids, rng):
+        pid = _pick_project(ids, rng)
+        sessions = [s for s in ids['sessions'][pid] if ids['questions'].get(s)]
+        if not sessions:
+            return None
+        sid = rng.choice(sessions)
+        # Half exact answers (graded locally), half wrong ones (graded by the model)
+        answers = [{'questionId': qid, 'answer': answer if rng.random() < 0.5 else 'I do not know'}
+                   for qid, answer in ids['questions'][sid]]
+        return 'POST', f'{base}/{pid}/sessions/{sid}/grade', {'json_body': {'answers': answers}}
+
+    return {
+        'get_all_projects': get_all_projects,
+        'get_projects_summary': get_projects_summary,
+        'get_project': get_project,
+        'get_project_documents': get_project_documents,
+        'get_document': get_document,
+        'download_document': download_document,
+        'get_document_content': get_document_content,
+        'download_document_text': download_document_text,
+        'get_project_milestones': get_project_milestones,
+        'get_milestone': get_milestone,
+        'get_milestones_calendar': get_milestones_calendar,
+        'get_project_changes': get_project_changes,
+        'get_project_sessions': get_project_sessions,
+        'get_session': get_session,
+        'get_next_review': get_next_review,
+        'get_project_tasks': get_project_tasks,
+        'get_task': get_task,
+        'create_project': create_project,
+        'add_document': add_document,
+        'add_milestone': add_milestone,
+        'create_learning_session': create_learning_session,
+        'add_documents_to_session': add_documents_to_session,
+        'create_project_task': create_project_task,
+        'generate_questions': generate_questions,
+        'extract_test_questions': extract_test_questions,
+        'grade_session_answers': grade_session_answers,
+    }
+
+
+LLM_SCENARIOS = {'generate_questions', 'extract_test_questions', 'grade_session_answers'}
+
+
+def _stub_llm():
+    """
+    Replace the model calls with deterministic fakes, so that the LLM endpoints
+    measure our own overhead (DB, serialization) and not the provider latency.
+    """
+    from app.utils import ai_services
+
+    ai_services.generate_question_from_text = lambda text, topic=None, avoid=None: (
+        f'Stub question {uuid.uuid4().hex}?', 'Stub answer.')
+    ai_services.extract_questions_from_text = lambda text: [
+        (f'Stub test question {uuid.uuid4().hex}?', 'Stub answer.')]
+    ai_services.grade_answers = lambda items: {item['id']: (50.0, 'Stub correction.') for item in items}
+
+
+# -----------------------------------------------
+# RUNNER
+# -----------------------------------------------
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(client, name, scenario, ids, clients, requests_count, seed):
+    """
+    Fire `requests_count` requests for a scenario using `clients` concurrent workers.
+
+    Returns:
+        dict: Latency percentiles (ms), throughput (req/s), error count,
+              average SQL statements and response bytes per request
+    """
+    latencies = []
+    sql_counts = []
+    sizes = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(worker_id, count):
+        nonlocal errors
+        rng = random.Random(f'{seed}-{name}-{worker_id}')
+        for _ in range(count):
+            target = scenario(ids, rng)
+            if not target:
+                continue
+            method, path, kwargs = target
+            sql_before = _sql_count()
+            start = time.perf_counter()
+            status, size = client.request(method, path, **kwargs)
+            elapsed = (time.perf_counter() - start) * 1000
+            sql = _sql_count() - sql_before
+            with lock:
+                latencies.append(elapsed)
+                sql_counts.append(sql)
+                sizes.append(size)
+                if status >= 400:
+                    errors += 1
+
+    per_worker = [requests_count // clients + (1 if i < requests_count % clients else 0) for i in range(clients)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(worker, i, n) for i, n in enumerate(per_worker) if n]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': _percentile(latencies, 50),
+        'p95_ms': _percentile(latencies, 95),
+        'p99_ms': _percentile(latencies, 99),
+        'max_ms': latencies[-1] if latencies else None,
+        'throughput_rps': len(latencies) / wall if wall else None,
+        'sql_per_request': (sum(sql_counts) / len(sql_counts)) if client.counts_sql and sql_counts else None,
+        'bytes_per_request': (sum(sizes) / len(sizes)) if sizes else None,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current, previous_path):
+    """Print the p95 and throughput deltas against a previous result file."""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+
+    print(f"\nComparison with {previous_path} (revision {previous.get('revision')}):")
+    print(f"{'endpoint':<28}{'p95 before':>12}{'p95 now':>12}{'delta':>10}{'rps delta':>12}")
+    for name, now in current['results'].items():
+        before = previous.get('results', {}).get(name)
+        if not before or not before.get('p95_ms') or not now.get('p95_ms'):
+            continue
+        delta = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        rps = ((now['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] * 100
+               if before.get('throughput_rps') else 0)
+        print(f"{name:<28}{before['p95_ms']:>12.2f}{now['p95_ms']:>12.2f}{delta:>+9.1f}%{rps:>+11.1f}%")
+
+
+def _print_report(report):
+    print(f"\n{'endpoint':<28}{'n':>6}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}{'sql':>7}{'KB':>9}")
+    for name, r in report['results'].items():
+        if not r['requests']:
+            continue
+        sql = f"{r['sql_per_request']:.1f}" if r['sql_per_request'] is not None else '-'
+        print(f"{name:<28}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['throughput_rps']:>9.1f}{sql:>7}{r['bytes_per_request'] / 1024:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Purplle REST API')
+    parser.add_argument('--projects', type=int, default=10)
+    parser.add_argument('--sessions', type=int, default=5, help='learning sessions per project')
+    parser.add_argument('--questions', type=int, default=10, help='questions per session')
+    parser.add_argument('--documents', type=int, default=4, help='documents per project')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--only', nargs='*', help='run only these endpoints')
+    parser.add_argument('--llm', choices=['stub', 'live', 'skip'], default='stub',
+                        help='how to handle the endpoints that call the LLM')
+    parser.add_argument('--base-url', help='drive a running server instead of the Flask test client')
+    parser.add_argument('--database-uri',
+                        help='throw-away database to use instead of SQLite (its tables are dropped and recreated)')
+    parser.add_argument('--serve', choices=['dev', 'production'],
+                        help='start this server on the benchmark database and drive it over HTTP')
+    parser.add_argument('--accept-encoding', default='identity',
+                        help='Accept-Encoding sent with every request (e.g. "gzip, br, zstd")')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='where to save the JSON results')
+    parser.add_argument('--compare', help='previous JSON result to compare with')
+    args = parser.parse_args(argv)
+
+    revision = _git_revision()
+    workdir = tempfile.mkdtemp(prefix='purplle-bench-')
+    cwd = os.getcwd()
+    server = None
+
+    if not args.base_url:
+        # Throw-away database and upload folder. Uploads are stored relative
+        # to the working directory, so move there for the whole run.
+        os.environ['DATABASE_URI'] = args.database_uri or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ.setdefault('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024))
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.chdir(workdir)
+
+    try:
+        from app import create_app, db
+        from sqlalchemy import event
+        from sqlalchemy.engine import make_url
+
+        app = create_app()
+        with app.app_context():
+            if args.database_uri:
+                db.drop_all()
+            db.create_all()
+            event.listen(db.engine, 'before_cursor_execute', _count_statement)
+
+        if args.llm == 'stub':
+            _stub_llm()
+
+        started = time.perf_counter()
+        ids = seed_dataset(app, workdir, args.projects, args.sessions, args.questions, args.documents,
+                           seed=args.seed)
+        seed_seconds = time.perf_counter() - started
+
+        if args.serve:
+            port = _free_port()
+            server = start_server(args.serve, workdir, port)
+            args.base_url = f'http://127.0.0.1:{port}'
+
+        headers = {'Accept-Encoding': args.accept_encoding}
+        client = HttpClient(args.base_url, headers) if args.base_url else FlaskClient(app, headers)
+        scenarios = _scenarios()
+        selected = args.only or list(scenarios)
+
+        results = {}
+        for name in selected:
+            # The stub only patches this process, a spawned server would call the real model
+            if name in LLM_SCENARIOS and (args.llm == 'skip' or (args.serve and args.llm == 'stub')):
+                continue
+            results[name] = run_scenario(client, name, scenarios[name], ids, args.clients, args.requests,
+                                         args.seed)
+
+        report = {
+            'revision': revision,
+            'timestamp': datetime.datetime.utcnow().isoformat(),
+            'mode': args.serve or ('http' if args.base_url else 'test_client'),
+            'dataset': {'projects': args.projects, 'sessions': args.sessions, 'questions': args.questions,
+                        'documents': args.documents, 'seed_seconds': seed_seconds},
+            'database': make_url(os.environ['DATABASE_URI']).get_backend_name(),
+            'clients': args.clients,
+            'requests_per_endpoint': args.requests,
+            'llm': args.llm,
+            'accept_encoding': args.accept_encoding,
+            'results': results,
+        }
+    finally:
+        if server is not None:
+            stop_server(server)
+        os.chdir(cwd)
+
+    _print_report(report)
+
+    output = args.output or os.path.join(
+        'bench_results', f"{report['revision'] or 'local'}-{datetime.datetime.utcnow():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults saved to {output}')
+
+    if args.compare:
+        compare(report, args.compare)
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
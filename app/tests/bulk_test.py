@@ -0,0 +1,110 @@
+"""
+Bulk PATCH of tasks and questions (optimistic concurrency on `version`) and
+the project/session counters kept in step with every kind of write.
+"""
+from app import db
+from app.models.models import Project, Question, Task
+from app.utils.counters import counter_drift
+
+
+def _versions(app, model, ids):
+    with app.app_context():
+        return dict(db.session.query(model.id, model.version).filter(model.id.in_(ids)))
+
+
+def _summary(client, project_id):
+    return next(p for p in client.get('/api/projects/summary').get_json() if p['id'] == project_id)['counts']
+
+
+def test_patch_tasks_updates_current_versions(app, client, project):
+    task_ids = project['tasks'][:2]
+    versions = _versions(app, Task, task_ids)
+
+    r = client.patch(f"/api/projects/{project['id']}/tasks", json={'tasks': [
+        {'id': task_id, 'version': versions[task_id], 'completed': True} for task_id in task_ids]})
+
+    assert r.status_code == 200
+    body = r.get_json()
+    assert sorted(row['id'] for row in body['updated']) == sorted(task_ids)
+    assert all(row['version'] == versions[row['id']] + 1 for row in body['updated'])
+    assert body['conflicts'] == [] and body['notFound'] == []
+    assert _summary(client, project['id'])['completedTasks'] == 2
+
+
+def test_patch_tasks_stale_version_is_a_conflict_and_left_unchanged(app, client, project):
+    task_id = project['tasks'][0]
+    version = _versions(app, Task, [task_id])[task_id]
+    # Someone else completes the task first
+    client.patch(f"/api/projects/{project['id']}/tasks",
+                 json={'tasks': [{'id': task_id, 'version': version, 'completed': True}]})
+
+    r = client.patch(f"/api/projects/{project['id']}/tasks",
+                     json={'tasks': [{'id': task_id, 'version': version, 'completed': False}]})
+
+    assert r.status_code == 200
+    body = r.get_json()
+    assert body['updated'] == []
+    assert body['conflicts'] == [{'id': task_id, 'completed': True, 'version': version + 1}]
+    with app.app_context():
+        task = db.session.get(Task, task_id)
+        assert task.completed is True and task.version == version + 1
+        assert counter_drift() == []
+
+
+def test_patch_tasks_reports_unknown_ids_and_rejects_bad_values(client, project):
+    r = client.patch(f"/api/projects/{project['id']}/tasks",
+                     json={'tasks': [{'id': 'missing', 'version': 1, 'completed': True}]})
+    assert r.status_code == 200 and r.get_json()['notFound'] == ['missing']
+
+    r = client.patch(f"/api/projects/{project['id']}/tasks",
+                     json={'tasks': [{'id': project['tasks'][0], 'version': 1, 'completed': 'yes'}]})
+    assert r.status_code == 400
+
+
+def test_patch_questions_stale_version_is_a_conflict(app, client, project):
+    question_id = project['questions'][0]
+    version = _versions(app, Question, [question_id])[question_id]
+    first = client.patch(f"/api/projects/{project['id']}/questions",
+                         json={'questions': [{'id': question_id, 'version': version, 'evaluation': 80}]})
+    assert [row['id'] for row in first.get_json()['updated']] == [question_id]
+
+    r = client.patch(f"/api/projects/{project['id']}/questions",
+                     json={'questions': [{'id': question_id, 'version': version, 'evaluation': 20}]})
+
+    body = r.get_json()
+    assert body['updated'] == []
+    assert body['conflicts'] == [{'id': question_id, 'version': version + 1, 'evaluation': 80.0}]
+    with app.app_context():
+        assert db.session.get(Question, question_id).evaluation == 80.0
+
+
+def test_counters_have_no_drift_after_bulk_archive_import_and_delete(app, client, project):
+    project_id = project['id']
+    versions = _versions(app, Task, project['tasks'])
+    client.patch(f'/api/projects/{project_id}/tasks', json={'tasks': [
+        {'id': task_id, 'version': version, 'completed': True} for task_id, version in versions.items()]})
+    with app.app_context():
+        assert counter_drift() == []
+    counts = _summary(client, project_id)
+    assert counts['tasks'] == 4 and counts['completedTasks'] == 4 and counts['questions'] == 9
+
+    r = client.post(f'/api/projects/{project_id}/sessions/archive', json={'olderThanDays': 100})
+    assert r.status_code == 200 and r.get_json()['archived']['sessions'] == 2
+    with app.app_context():
+        assert counter_drift() == []
+    assert _summary(client, project_id) == counts
+
+    archive = client.get(f'/api/projects/{project_id}/export').get_data()
+    r = client.post('/api/projects/import', data=archive, content_type='application/x-tar')
+    assert r.status_code == 201
+    with app.app_context():
+        assert counter_drift() == []
+
+    assert client.delete(f"/api/projects/{project_id}/sessions/{project['sessions'][2]}").status_code == 200
+    with app.app_context():
+        assert counter_drift() == []
+
+    assert client.delete(f'/api/projects/{project_id}').status_code == 200
+    with app.app_context():
+        assert counter_drift() == []
+        assert db.session.get(Project, project_id) is None
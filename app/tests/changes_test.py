@@ -0,0 +1,98 @@
+"""
+Delta-sync change feed: paging, tombstones, compaction and the horizon that
+forces a client to resync from 0.
+"""
+from app.utils.changes import compact_changes
+
+
+def _sync(client, since=0, horizon=0, limit=5):
+    """Page through the feed like a client; returns (changes, nextSince, horizon)."""
+    changes = []
+    while True:
+        r = client.get(f'/api/changes?since={since}&horizon={horizon}&limit={limit}')
+        assert r.status_code == 200, r.get_json()
+        body = r.get_json()
+        changes.extend(body['changes'])
+        since, horizon = body['nextSince'], body['horizon']
+        if not body['hasMore']:
+            return changes, since, horizon
+
+
+def _live(changes):
+    """Apply the changes to an empty replica: the ids left per entity."""
+    replica = {}
+    for change in changes:
+        ids = replica.setdefault(change['entity'], set())
+        if change['op'] == 'upsert':
+            ids.add(change['id'])
+        else:
+            ids.discard(change['id'])
+    return replica
+
+
+def test_full_sync_returns_every_live_row(client, project):
+    changes, since, horizon = _sync(client)
+
+    replica = _live(changes)
+    assert replica['project'] == {project['id']}
+    assert replica['session'] == set(project['sessions'])
+    assert replica['question'] == set(project['questions'])
+    assert replica['task'] == set(project['tasks'])
+    assert since > 0 and horizon == 0
+
+
+def test_incremental_sync_sees_updates_and_deletes(client, project):
+    _, since, horizon = _sync(client)
+
+    client.delete(f"/api/projects/{project['id']}/sessions/{project['sessions'][0]}")
+    changes, _, _ = _sync(client, since, horizon)
+
+    deleted = {(change['entity'], change['id']) for change in changes if change['op'] == 'delete'}
+    assert ('session', project['sessions'][0]) in deleted
+    assert any(change['entity'] == 'project' and change['op'] == 'upsert' for change in changes)
+
+
+def test_since_below_a_newer_horizon_requires_a_resync(app, client, project):
+    _, since, horizon = _sync(client)
+    client.delete(f"/api/projects/{project['id']}/sessions/{project['sessions'][0]}")
+    with app.app_context():
+        compacted = compact_changes(retention_days=0)
+    assert compacted['horizon'] > since
+
+    r = client.get(f'/api/changes?since={since}&horizon={horizon}')
+    assert r.status_code == 410 and r.get_json()['resync'] is True
+
+    # Starting over from 0 replays the live rows, without the deleted session
+    changes, _, new_horizon = _sync(client)
+    assert new_horizon == compacted['horizon']
+    replica = _live(changes)
+    assert replica['session'] == set(project['sessions'][1:])
+    assert project['sessions'][0] not in replica['session']
+
+
+def test_a_client_that_knows_the_horizon_keeps_paging(app, client, project):
+    client.delete(f"/api/projects/{project['id']}/sessions/{project['sessions'][0]}")
+    with app.app_context():
+        current = compact_changes(retention_days=0)['horizon']
+
+    # Paging a full sync below the horizon it was given is fine
+    r = client.get(f'/api/changes?since=1&horizon={current}&limit=5')
+    assert r.status_code == 200 and r.get_json()['horizon'] == current
+
+
+def test_project_feed_accepts_client_supplied_ids(client):
+    project_id = 'my-project'
+    assert client.post('/api/projects/', json={'name': 'p', 'id': project_id}).status_code == 201
+    client.post(f'/api/projects/{project_id}/tasks', json={'name': 'Read chapter 1'})
+
+    r = client.get(f'/api/changes?projectId={project_id}')
+
+    assert r.status_code == 200
+    assert {(change['entity'], change['op']) for change in r.get_json()['changes']} == {
+        ('project', 'upsert'), ('task', 'upsert')}
+    assert r.get_json()['changes'][0]['id'] == project_id
+
+
+def test_invalid_arguments(client):
+    assert client.get('/api/changes?since=-1').status_code == 400
+    assert client.get('/api/changes?limit=0').status_code == 400
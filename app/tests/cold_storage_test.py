@@ -0,0 +1,64 @@
+"""
+Cold storage of old sessions: archiving, and rehydration on first access.
+"""
+from app import db
+from app.models.models import ArchivedSession, LearningSession, Question
+from app.utils.counters import counter_drift
+from app.utils.deletion import _delete_documents
+
+
+def _archive(client, project_id):
+    r = client.post(f'/api/projects/{project_id}/sessions/archive', json={'olderThanDays': 100})
+    assert r.status_code == 200
+    return r.get_json()['archived']
+
+
+def test_archive_moves_old_sessions_out_of_the_hot_tables(app, client, project):
+    archived = _archive(client, project['id'])
+
+    assert archived['sessions'] == 2
+    hot = client.get(f"/api/projects/{project['id']}/sessions").get_json()
+    assert [session['id'] for session in hot] == [project['sessions'][2]]
+    summaries = client.get(f"/api/projects/{project['id']}/sessions/archived").get_json()
+    assert [session['id'] for session in summaries] == project['sessions'][:2]
+    with app.app_context():
+        assert LearningSession.query.count() == 1 and Question.query.count() == 3
+        assert counter_drift() == []
+
+
+def test_access_rehydrates_the_session_unchanged(app, client, project):
+    session_id = project['sessions'][0]
+    before = client.get(f"/api/projects/{project['id']}/sessions/{session_id}").get_json()
+    _archive(client, project['id'])
+
+    after = client.get(f"/api/projects/{project['id']}/sessions/{session_id}").get_json()
+
+    assert after == before
+    with app.app_context():
+        assert db.session.get(ArchivedSession, session_id) is None
+        assert ArchivedSession.query.count() == 1
+        assert counter_drift() == []
+
+
+def test_rehydration_drops_links_to_documents_deleted_meanwhile(app, client, project):
+    session_id = project['sessions'][0]
+    _archive(client, project['id'])
+    with app.app_context():
+        _delete_documents([project['documents'][0]], {})
+        db.session.commit()
+
+    r = client.get(f"/api/projects/{project['id']}/sessions/{session_id}")
+
+    assert r.status_code == 200
+    with app.app_context():
+        session = db.session.get(LearningSession, session_id)
+        assert session.resource_documents == []
+        assert len(session.questions) == 3
+        assert all(question.resource_documents == [] for question in session.questions)
+
+
+def test_archive_validates_its_arguments(client, project):
+    r = client.post(f"/api/projects/{project['id']}/sessions/archive", json={'olderThanDays': -1})
+    assert r.status_code == 400
+    r = client.post(f"/api/projects/{project['id']}/sessions/archive", json={'before': 'yesterday'})
+    assert r.status_code == 400
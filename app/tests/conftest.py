@@ -0,0 +1,83 @@
+"""
+Fixtures of the behaviour tests (the *_test.py modules run in process with
+pytest; API_test.py drives a running server instead): an app on a throw-away
+SQLite database and a seeded project.
+"""
+import datetime
+import io
+
+import pytest
+
+from app import create_app, db
+
+
+@pytest.fixture
+def app_config():
+    """Extra app configuration; override this fixture in a test module to change it."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, app_config):
+    # Uploads are written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024))
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'INGESTION_MODE': 'off',
+        **app_config,
+    })
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def project(app, client):
+    """
+    A project with 2 documents, 3 sessions (started 400, 300 and 10 days ago)
+    with 3 questions each, and 4 tasks. Returns a dict of the ids.
+    """
+    from app.models.models import DocumentCategory, LearningSession, Question, QuestionSourceType
+
+    project_id = client.post('/api/projects/', json={'name': 'Databases'}).get_json()['id']
+    document_ids = [client.post(f'/api/projects/{project_id}/documents',
+                                data={'file': (io.BytesIO(f'Slides {i}'.encode()), f'slides-{i}.txt')}).get_json()['id']
+                    for i in range(2)]
+    task_ids = [client.post(f'/api/projects/{project_id}/tasks', json={'name': f'Exercise {i}'}).get_json()['id']
+                for i in range(4)]
+
+    now = datetime.datetime.utcnow()
+    session_ids, question_ids = [], []
+    with app.app_context():
+        from app.models.models import Document
+
+        resource = db.session.get(Document, document_ids[0])
+        assert resource.category == DocumentCategory.RESOURCE
+        for days in (400, 300, 10):
+            session = LearningSession(project_id=project_id, duration_minutes=30,
+                                      timestamp=now - datetime.timedelta(days=days))
+            session.resource_documents.append(resource)
+            for i in range(3):
+                question = Question(question=f'Question {i} of the session of {days} days ago',
+                                    answer=f'Answer {i}', source_type=QuestionSourceType.RESOURCE)
+                question.resource_documents.append(resource)
+                session.questions.append(question)
+            db.session.add(session)
+            db.session.flush()
+            session_ids.append(session.id)
+            question_ids.extend(question.id for question in session.questions)
+        db.session.commit()
+
+    return {'id': project_id, 'documents': document_ids, 'tasks': task_ids,
+            'sessions': session_ids, 'questions': question_ids}
@@ -0,0 +1,27 @@
+"""
+Near-duplicate questions: the similarity threshold comes from the app config.
+"""
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def app_config():
+    return {'DEDUP_THRESHOLD': 1.0}
+
+
+def test_configured_threshold_is_used_by_default(app, client, project):
+    r = client.post(f"/api/projects/{project['id']}/questions/dedupe", json={'dryRun': True})
+    assert r.status_code == 200 and r.get_json()['duplicates'] == []
+
+    # An explicit threshold still wins over the configured one
+    r = client.post(f"/api/projects/{project['id']}/questions/dedupe", json={'dryRun': True, 'threshold': 0.3})
+    assert r.status_code == 200 and r.get_json()['duplicates']
+
+
+def test_out_of_range_threshold_is_rejected_at_configuration(tmp_path, monkeypatch):
+    monkeypatch.setenv('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024))
+    with pytest.raises(ValueError, match='DEDUP_THRESHOLD'):
+        create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+                    'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'DEDUP_THRESHOLD': 1.5})
@@ -0,0 +1,55 @@
+"""
+Local pre-scoring of answers: only answers that match the reference word for
+word (up to case, punctuation and typos) skip the model.
+"""
+import pytest
+
+from app.utils.grading import PROMPT_OVERHEAD_TOKENS, estimate_tokens, make_batches, pre_score
+
+THRESHOLD = 0.9
+
+
+@pytest.mark.parametrize('answer', [
+    'A primary key uniquely identifies each row',
+    'a primary key uniquely identifies each row.',
+    'A primary key uniquely identifes each row',
+])
+def test_matching_answers_are_scored_locally(answer):
+    score = pre_score(answer, 'A primary key uniquely identifies each row', THRESHOLD)
+
+    assert score is not None
+    evaluation, correction = score
+    assert evaluation >= THRESHOLD * 100
+    assert correction
+
+
+@pytest.mark.parametrize('answer, reference', [
+    # Reordered words change the meaning
+    ('The child table references the parent table', 'The parent table references the child table'),
+    # A different number is a different answer
+    ('Third normal form requires 2 conditions', 'Third normal form requires 3 conditions'),
+    ('It was introduced in 1976', 'It was introduced in 1970'),
+    # A missing negation
+    ('A view is materialized', 'A view is not materialized'),
+    # A different word
+    ('The lock is shared', 'The lock is held'),
+    ('Something unrelated entirely', 'A primary key uniquely identifies each row'),
+])
+def test_other_answers_go_to_the_model(answer, reference):
+    assert pre_score(answer, reference, THRESHOLD) is None
+
+
+def test_empty_answers_score_zero():
+    assert pre_score('', 'Anything', THRESHOLD)[0] == 0.0
+    assert pre_score('  ...  ', 'Anything', THRESHOLD)[0] == 0.0
+
+
+def test_batches_respect_the_token_budget_and_size():
+    items = [{'id': i, 'question': 'q' * 400, 'reference': 'r' * 400, 'answer': 'a' * 400} for i in range(10)]
+
+    batches = make_batches(items, token_budget=1000, max_items=4)
+
+    assert sorted(item['id'] for batch in batches for item in batch) == list(range(10))
+    assert all(len(batch) <= 4 for batch in batches)
+    assert all(PROMPT_OVERHEAD_TOKENS + sum(estimate_tokens(item) for item in batch) <= 1000 for batch in batches)
+    assert len(batches) == 5
@@ -0,0 +1,111 @@
+"""
+Import-time budget for the app factory.
+
+Runs `create_app()` (and a `flask` CLI command) in fresh interpreters with
+`python -X importtime`, reports the total import time, the time spent in the
+app's own modules and the slowest top-level imports, and fails when a median
+exceeds its budget or when a module that must be loaded lazily (document
+parsers, LLM SDK, optional codecs) was imported.
+
+Most of the total is Flask, SQLAlchemy and Alembic (about 480 ms here), and
+it varies by +-150 ms from run to run on a busy machine: the total budget
+(default 800 ms) only catches gross regressions. The app's own modules (about
+75 ms) have a budget of their own (default 120 ms), which is where an eager
+import added to start-up shows.
+
+Usage:
+    python -m app.tests.importtime
+    python -m app.tests.importtime --budget-ms 700 --app-budget-ms 100 --runs 7 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Loaded on first use only (see app.utils.file_processor, app.utils.ai_services,
+# app.utils.compression, app.utils.text_compression and app.utils.analytics)
+LAZY_MODULES = ['pypdf', 'pdfplumber', 'docx', 'odf', 'google.generativeai', 'pyarrow', 'zstandard', 'brotli']
+
+TARGETS = {
+    'create_app': ['-c', 'from app import create_app; create_app()'],
+    'flask_cli': ['-m', 'flask', '--app', 'app', 'routes'],
+}
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+        list: (module, self us, cumulative us, nesting level) tuples
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), level))
+    return imports
+
+
+def measure(target):
+    """Import profile of one fresh interpreter running the target."""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.getenv('PYTHONPATH')])))
+    env.setdefault('DATABASE_URI', 'sqlite:///:memory:')
+    env.setdefault('SECRET_KEY', 'importtime')
+    env.setdefault('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024))
+    env.setdefault('UPLOAD_FOLDER', os.path.join(root, 'uploads'))
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + TARGETS[target], env=env, cwd=root,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'{target} failed:\n{result.stderr[-2000:]}')
+    return parse_importtime(result.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the import time of the app against a budget')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_MS', 800)),
+                        help='maximum median import time per target')
+    parser.add_argument('--app-budget-ms', type=float, default=float(os.getenv('IMPORT_APP_BUDGET_MS', 120)),
+                        help="maximum median import time of the app's own modules per target")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest top-level imports to show')
+    parser.add_argument('--only', nargs='*', choices=list(TARGETS))
+    args = parser.parse_args(argv)
+
+    failed = False
+    for target in args.only or list(TARGETS):
+        runs = [measure(target) for _ in range(args.runs)]
+        totals = [sum(self_us for _, self_us, _, _ in imports) / 1000 for imports in runs]
+        median = statistics.median(totals)
+        app_median = statistics.median(
+            sum(self_us for name, self_us, _, _ in imports if name == 'app' or name.startswith('app.')) / 1000
+            for imports in runs)
+
+        print(f'\n{target}: median {median:.1f} ms (min {min(totals):.1f}, max {max(totals):.1f}, '
+              f'budget {args.budget_ms:.0f} ms), app modules {app_median:.1f} ms '
+              f'(budget {args.app_budget_ms:.0f} ms)')
+        top_level = sorted((i for i in runs[-1] if i[3] == 0), key=lambda i: i[2], reverse=True)
+        for name, _, cumulative_us, _ in top_level[:args.top]:
+            print(f'  {cumulative_us / 1000:>8.1f} ms  {name}')
+
+        loaded = {name for name, _, _, _ in runs[-1]}
+        eager = [m for m in LAZY_MODULES if m in loaded]
+        if eager:
+            print(f'  FAIL: imported eagerly: {", ".join(eager)}')
+            failed = True
+        if median > args.budget_ms:
+            print(f'  FAIL: over budget by {median - args.budget_ms:.1f} ms')
+            failed = True
+        if app_median > args.app_budget_ms:
+            print(f'  FAIL: app modules over budget by {app_median - args.app_budget_ms:.1f} ms')
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Document ingestion: extraction failures, text that merely looks like one, and
+the PDF backend setting.
+"""
+import io
+
+import pytest
+
+from app import create_app, db
+from app.models.models import Document, DocumentStatus
+from app.utils.ingestion import ingest_document
+
+
+def _upload(client, project_id, content, filename):
+    r = client.post(f'/api/projects/{project_id}/documents', data={'file': (io.BytesIO(content), filename)})
+    assert r.status_code == 201
+    return r.get_json()['id']
+
+
+def test_text_starting_like_an_error_is_ingested(app, client):
+    project_id = client.post('/api/projects/', json={'name': 'p'}).get_json()['id']
+    text = 'Error handling in transactions: rollback, savepoints and retries.'
+    document_id = _upload(client, project_id, text.encode(), 'errors.txt')
+
+    with app.app_context():
+        assert ingest_document(document_id) is True
+        document = db.session.get(Document, document_id)
+        assert document.status == DocumentStatus.READY
+        assert document.processing_error is None
+        assert document.content == text
+
+
+def test_unsupported_and_unreadable_files_fail(app, client):
+    project_id = client.post('/api/projects/', json={'name': 'p'}).get_json()['id']
+    unsupported = _upload(client, project_id, b'x', 'slides.key')
+    unreadable = _upload(client, project_id, b'\xff\xfe not utf-8', 'broken.txt')
+
+    with app.app_context():
+        assert ingest_document(unsupported) is False
+        assert ingest_document(unreadable) is False
+        document = db.session.get(Document, unsupported)
+        assert document.status == DocumentStatus.FAILED
+        assert document.processing_error == 'Unsupported file format: .key'
+        document = db.session.get(Document, unreadable)
+        assert document.status == DocumentStatus.FAILED
+        assert document.processing_error.startswith('Error extracting text from ')
+
+
+def test_unknown_pdf_backend_is_rejected_at_configuration(tmp_path, monkeypatch):
+    monkeypatch.setenv('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024))
+    with pytest.raises(ValueError, match='PDF_BACKEND'):
+        create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+                    'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'PDF_BACKEND': 'pdfminer'})
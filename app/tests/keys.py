@@ -0,0 +1,122 @@
+"""
+Primary key benchmark: random UUIDv4 vs time-ordered UUIDv7 ids, stored as
+text or compactly (16 byte blobs on SQLite, native uuid on PostgreSQL).
+
+Inserts --rows rows into a scratch table shaped like the app's tables (a
+primary key, an indexed foreign key to an earlier row, a payload) in batches
+of --batch, one transaction per batch, then reports the insert rate overall
+and over the last tenth of the rows (random keys slow down as the indexes
+outgrow the cache), the size of the table and of its indexes, and the rate
+of primary key lookups.
+
+Usage:
+    python -m app.tests.keys --rows 200000
+    python -m app.tests.keys --rows 1000000 --database-uri postgresql+psycopg://localhost/purplle_bench
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import Column, MetaData, String, Table, create_engine, select, text
+
+from app.models.types import GUID, uuid4, uuid7
+
+GENERATORS = {'uuid4': uuid4, 'uuid7': uuid7}
+
+
+def _table(metadata, storage):
+    id_type = GUID() if storage == 'compact' else String(36)
+    return Table('key_bench', metadata,
+                 Column('id', id_type, primary_key=True),
+                 Column('parent_id', id_type, index=True),
+                 Column('payload', String(50)))
+
+
+def _sizes(connection, table_name='key_bench'):
+    """(table bytes, index bytes) of a scratch table."""
+    params = {'name': table_name}
+    if connection.dialect.name == 'postgresql':
+        return connection.execute(text('SELECT pg_table_size(:name), pg_indexes_size(:name)'), params).one()
+    rows = dict(connection.execute(text(
+        "SELECT name, sum(pgsize) FROM dbstat WHERE name = :name OR name IN "
+        "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :name) GROUP BY name"), params).all())
+    table = rows.pop(table_name)
+    return table, sum(rows.values())
+
+
+def run(database_uri, strategy, storage, rows, batch, lookups, seed=42):
+    engine = create_engine(database_uri)
+    metadata = MetaData()
+    table = _table(metadata, storage)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    rng = random.Random(seed)
+    generate = GENERATORS[strategy]
+    ids = []
+    tail_start = rows - rows // 10
+    started = time.perf_counter()
+    tail_started = None
+    for offset in range(0, rows, batch):
+        if tail_started is None and offset >= tail_start:
+            tail_started = time.perf_counter()
+        params = []
+        for _ in range(min(batch, rows - offset)):
+            row_id = generate()
+            params.append({'id': row_id, 'parent_id': rng.choice(ids) if ids else None, 'payload': 'x' * 40})
+            ids.append(row_id)
+        with engine.begin() as connection:
+            connection.execute(table.insert(), params)
+    finished = time.perf_counter()
+
+    with engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('ANALYZE key_bench'))
+        table_bytes, index_bytes = _sizes(connection)
+
+        sample = [rng.choice(ids) for _ in range(lookups)]
+        lookup_started = time.perf_counter()
+        for row_id in sample:
+            connection.execute(select(table.c.payload).where(table.c.id == row_id)).one()
+        lookup_seconds = time.perf_counter() - lookup_started
+
+    metadata.drop_all(engine)
+    engine.dispose()
+    tail_rows = rows - tail_start
+    return {
+        'strategy': strategy,
+        'storage': storage,
+        'rows_per_s': rows / (finished - started),
+        'tail_rows_per_s': tail_rows / (finished - tail_started) if tail_started else None,
+        'table_mb': table_bytes / 1e6,
+        'index_mb': index_bytes / 1e6,
+        'lookups_per_s': lookups / lookup_seconds if lookups else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare primary key strategies at scale')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=1000, help='rows per transaction')
+    parser.add_argument('--lookups', type=int, default=10000, help='primary key lookups after the inserts')
+    parser.add_argument('--database-uri', help='scratch database (default: a temporary SQLite file)')
+    args = parser.parse_args(argv)
+
+    workdir = None
+    if not args.database_uri:
+        workdir = tempfile.mkdtemp(prefix='purplle-keys-')
+        args.database_uri = f"sqlite:///{os.path.join(workdir, 'keys.db')}"
+
+    print(f"{'strategy':<8} {'storage':<8} {'rows/s':>9} {'last 10%':>9} {'table MB':>9} {'index MB':>9} "
+          f"{'lookups/s':>10}")
+    for storage in ('text', 'compact'):
+        for strategy in ('uuid4', 'uuid7'):
+            r = run(args.database_uri, strategy, storage, args.rows, args.batch, args.lookups)
+            print(f"{r['strategy']:<8} {r['storage']:<8} {r['rows_per_s']:>9.0f} {r['tail_rows_per_s']:>9.0f} "
+                  f"{r['table_mb']:>9.1f} {r['index_mb']:>9.1f} {r['lookups_per_s'] or 0:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
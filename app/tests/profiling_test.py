@@ -0,0 +1,45 @@
+"""
+Request profiling: on-demand profiles need the token, and a request that
+fails in its view still stops its profiler and shows up in /metrics.
+"""
+import os
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def profiled_app(request, monkeypatch, tmp_path):
+    monkeypatch.setenv('PROFILING_ENABLED', '1')
+    monkeypatch.setenv('PROFILE_TOKEN', 's3cret')
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path / 'profiles'))
+    app = request.getfixturevalue('app')
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    return app
+
+
+def test_profile_needs_the_token(profiled_app):
+    client = profiled_app.test_client()
+
+    assert 'X-Profile-File' not in client.get('/api/projects/', headers={'X-Profile': 'cprofile'}).headers
+    r = client.get('/api/projects/', headers={'X-Profile': 'cprofile', 'X-Profile-Token': 's3cret'})
+    name = r.headers['X-Profile-File']
+    assert os.path.basename(name) == name
+    assert os.path.exists(os.path.join(profiled_app.config['PROFILE_DIR'], name))
+
+
+def test_failed_request_stops_its_profiler_and_is_counted(profiled_app):
+    client = profiled_app.test_client()
+
+    # TESTING propagates the exception: after_request never runs
+    with pytest.raises(RuntimeError):
+        client.get('/boom', headers={'X-Profile': 'cprofile', 'X-Profile-Token': 's3cret'})
+
+    assert sys.getprofile() is None
+    assert len(os.listdir(profiled_app.config['PROFILE_DIR'])) == 1
+    assert 'purplle_requests_total{endpoint="/boom",method="GET",status="500"} 1' in client.get('/metrics').get_data(
+        as_text=True)
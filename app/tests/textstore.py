@@ -0,0 +1,141 @@
+"""
+Document text storage benchmark: plain text vs CompressedText, with zlib
+and zstd (when the `zstandard` package is installed), without and with a
+dictionary trained on the samples.
+
+Writes --rows chunks of synthetic lecture slides (the same headers, footers
+and phrases over and over, as in real course material) to a scratch table
+shaped like document_chunk, then reports the size of the table, the rate of
+a full scan reading every text and of random lookups by primary key, and
+the rate of a scan that does not read the text (what a deferred column
+costs when it is not used).
+
+Usage:
+    python -m app.tests.textstore --rows 20000
+    python -m app.tests.textstore --rows 100000 --database-uri postgresql+psycopg://localhost/purplle_bench
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, create_engine, func, select, text
+
+from app.models.types import CompressedText
+from app.tests.keys import _sizes
+from app.utils import text_compression
+from app.utils.text_compression import build_dictionary, compress_text, register_dictionary
+
+WORDS = ('relation schema tuple attribute key foreign primary index query join selection projection '
+         'transaction isolation serializable lock commit rollback normal form dependency closure '
+         'decomposition lossless entity relationship cardinality aggregate group order view trigger').split()
+HEADERS = ['Basi di Dati - Lezione {n}', 'Corso di Laurea in Informatica - A.A. 2024/2025',
+           'Prof. M. Rossi - Dipartimento di Ingegneria']
+FOOTERS = ['Slide {n} - Riproduzione vietata', 'Esercizi: vedere il materiale sulla piattaforma del corso']
+
+
+def _chunk(rng, n, size=2000):
+    """A chunk of slides: headers, footers and bullet points over a small vocabulary."""
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        slide = rng.randrange(1, 60)
+        lines.extend(header.format(n=n) for header in HEADERS)
+        for _ in range(rng.randrange(3, 7)):
+            lines.append('- ' + ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(6, 14))) + '.')
+        lines.extend(footer.format(n=slide) for footer in FOOTERS)
+    return '\n'.join(lines)[:size]
+
+
+def _variants():
+    codecs = [codec for codec in ('zlib', 'zstd') if codec in text_compression.CODECS]
+    return [('text', None, False)] + [(codec, codec, dictionary) for codec in codecs for dictionary in (False, True)]
+
+
+def run(database_uri, name, codec, use_dictionary, chunks, batch, lookups, samples, dictionary_size, seed=42):
+    engine = create_engine(database_uri)
+    metadata = MetaData()
+    table = Table('text_bench', metadata,
+                  Column('id', Integer, primary_key=True),
+                  Column('position', Integer),
+                  Column('content', Text if codec is None else CompressedText))
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    dictionary = None
+    if codec is not None:
+        text_compression.configure(codec)
+        if use_dictionary:
+            data = build_dictionary(chunks[:samples], dictionary_size, codec)
+            dictionary = register_dictionary(1 if codec == 'zlib' else 2, codec, data)
+
+    started = time.perf_counter()
+    for offset in range(0, len(chunks), batch):
+        params = [{'id': offset + i + 1, 'position': i,
+                   'content': compress_text(chunk, dictionary) if codec is not None else chunk}
+                  for i, chunk in enumerate(chunks[offset:offset + batch])]
+        with engine.begin() as connection:
+            connection.execute(table.insert(), params)
+    write_seconds = time.perf_counter() - started
+
+    rng = random.Random(seed)
+    with engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('ANALYZE text_bench'))
+        table_bytes, _ = _sizes(connection, 'text_bench')
+
+        started = time.perf_counter()
+        characters = sum(len(content) for content, in connection.execute(select(table.c.content)))
+        scan_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        connection.execute(select(func.sum(table.c.position))).scalar()
+        skip_seconds = time.perf_counter() - started
+
+        sample = [rng.randrange(1, len(chunks) + 1) for _ in range(lookups)]
+        started = time.perf_counter()
+        for row_id in sample:
+            connection.execute(select(table.c.content).where(table.c.id == row_id)).one()
+        lookup_seconds = time.perf_counter() - started
+
+    metadata.drop_all(engine)
+    engine.dispose()
+    assert characters == sum(len(chunk) for chunk in chunks)
+    return {
+        'storage': name + (' + dict' if use_dictionary else ''),
+        'table_mb': table_bytes / 1e6,
+        'write_rows_per_s': len(chunks) / write_seconds,
+        'scan_rows_per_s': len(chunks) / scan_seconds,
+        'skip_rows_per_s': len(chunks) / skip_seconds,
+        'lookup_ms': lookup_seconds * 1000 / lookups if lookups else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare plain and compressed storage of document text')
+    parser.add_argument('--rows', type=int, default=20000, help='chunks of about 2000 characters')
+    parser.add_argument('--batch', type=int, default=500, help='rows per transaction')
+    parser.add_argument('--lookups', type=int, default=2000, help='primary key lookups after the inserts')
+    parser.add_argument('--samples', type=int, default=2000, help='chunks the dictionaries are trained on')
+    parser.add_argument('--dictionary-size', type=int, default=16 * 1024)
+    parser.add_argument('--database-uri', help='scratch database (default: a temporary SQLite file)')
+    args = parser.parse_args(argv)
+
+    workdir = None
+    if not args.database_uri:
+        workdir = tempfile.mkdtemp(prefix='purplle-textstore-')
+        args.database_uri = f"sqlite:///{os.path.join(workdir, 'textstore.db')}"
+
+    rng = random.Random(42)
+    chunks = [_chunk(rng, n // 50) for n in range(args.rows)]
+    print(f"{'storage':<12} {'table MB':>9} {'writes/s':>9} {'scan rows/s':>12} {'no text/s':>10} "
+          f"{'lookup ms':>10}")
+    for name, codec, use_dictionary in _variants():
+        r = run(args.database_uri, name, codec, use_dictionary, chunks, args.batch, args.lookups,
+                args.samples, args.dictionary_size)
+        print(f"{r['storage']:<12} {r['table_mb']:>9.1f} {r['write_rows_per_s']:>9.0f} {r['scan_rows_per_s']:>12.0f} "
+              f"{r['skip_rows_per_s']:>10.0f} {r['lookup_ms'] or 0:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Usage report: totals and groups of the recorded model calls.
+"""
+from app import db
+from app.models.models import LlmUsage
+
+
+def _record(app, project_id, session_id, prompt_tokens, failed=False):
+    with app.app_context():
+        db.session.add(LlmUsage(project_id=project_id, session_id=session_id, operation='grade', provider='gemini',
+                                model='gemini-2.0-flash', prompt_tokens=prompt_tokens, response_tokens=10,
+                                latency_ms=100.0, failed=failed))
+        db.session.commit()
+
+
+def test_usage_filters_accept_client_supplied_ids(app, client):
+    _record(app, 'my-project', 'my-session', 100)
+    _record(app, 'my-project', 'other-session', 200, failed=True)
+    _record(app, 'other-project', None, 400)
+
+    r = client.get('/api/usage?projectId=my-project&groupBy=session')
+
+    assert r.status_code == 200
+    body = r.get_json()
+    assert body['totals']['calls'] == 2 and body['totals']['promptTokens'] == 300 and body['totals']['failed'] == 1
+    assert {group['key']: group['calls'] for group in body['groups']} == {'my-session': 1, 'other-session': 1}
+
+    r = client.get('/api/usage?projectId=my-project&sessionId=my-session')
+    assert r.get_json()['totals']['totalTokens'] == 110
+
+
+def test_usage_rejects_bad_arguments(client):
+    assert client.get('/api/usage?from=yesterday').status_code == 400
+    assert client.get('/api/usage?groupBy=user').status_code == 400
@@ -1,13 +1,77 @@
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import threading
 from app.utils.file_processor import extract_text_from_file
+from app.utils.profiling import span
+from app.utils.usage import record_usage, estimate_tokens
 import random
-# Load environment variables
-load_dotenv()
+import time
 
-# Configure the Gemini API with your API key
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+# Characters of document text sent to the model (Gemini has token limits)
+MAX_TEXT_LENGTH = 10000
+
+# LLM providers: name -> factory(model name) returning an object with
+# generate_content(prompt). The SDK of a provider is imported, and configured,
+# the first time a model is needed, not when this module is imported.
+PROVIDERS = {}
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def provider(name):
+    """Register a model factory under a provider name (selected with LLM_PROVIDER)."""
+    def decorator(factory):
+        PROVIDERS[name] = factory
+        return factory
+    return decorator
+
+
+@provider('gemini')
+def _gemini_model(model_name):
+    import google.generativeai as genai
+
+    # GEMINI_API_KEY comes from the environment (.env is loaded by create_app)
+    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+    return genai.GenerativeModel(model_name)
+
+
+def get_model():
+    """The configured model (LLM_PROVIDER, LLM_MODEL), created on first use."""
+    key = (os.getenv('LLM_PROVIDER', 'gemini'), os.getenv('LLM_MODEL', 'gemini-2.0-flash'))
+    with _models_lock:
+        if key not in _models:
+            _models[key] = PROVIDERS[key[0]](key[1])
+        return _models[key]
+
+
+def _generate(prompt, operation):
+    """
+    Call the configured model, recording its token usage and latency
+    (app.utils.usage) whether it succeeds or not.
+    """
+    provider_name, model_name = os.getenv('LLM_PROVIDER', 'gemini'), os.getenv('LLM_MODEL', 'gemini-2.0-flash')
+    start = time.perf_counter()
+    response = None
+    try:
+        model = get_model()
+        with span('llm'):
+            response = model.generate_content(prompt)
+        return response
+    finally:
+        latency_ms = (time.perf_counter() - start) * 1000
+        # Counts reported by the provider, estimated from the text when there are none
+        metadata = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(metadata, 'prompt_token_count', None)
+        response_tokens = getattr(metadata, 'candidates_token_count', None)
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt)
+        if response_tokens is None:
+            try:
+                response_tokens = estimate_tokens(response.text) if response is not None else 0
+            except Exception:
+                response_tokens = 0
+        record_usage(operation, provider_name, model_name, prompt_tokens, response_tokens, latency_ms,
+                     failed=response is None)
 
 
 def generate_question_from_document(file_path, topic=None):
@@ -22,14 +86,29 @@ def generate_question_from_document(file_path, topic=None):
         tuple: (question, answer)
     """
     # Extract text from the document
-    text = extract_text_from_file(file_path)
+    text = extract_text_from_file(file_path, max_chars=MAX_TEXT_LENGTH + 1)
 
     # If text extraction failed or returned an error message
     if text.startswith("Error") or text.startswith("Unsupported"):
         return f"Could not generate question", text
 
+    return generate_question_from_text(text, topic)
+
+
+def generate_question_from_text(text, topic=None, avoid=None):
+    """
+    Generate a question and its answer based on already extracted text.
+
+    Args:
+        text (str): Content of the document (or a passage of it)
+        topic (str, optional): A specific topic to focus on. Defaults to None.
+        avoid (list, optional): Questions already asked, the new one must be different. Defaults to None.
+
+    Returns:
+        tuple: (question, answer)
+    """
     # Truncate text if too long (Gemini has token limits)
-    max_length = 10000  # Adjust as needed based on Gemini's limits
+    max_length = MAX_TEXT_LENGTH
     if len(text) > max_length:
         text = text[:max_length] + "..."
 
@@ -63,10 +142,13 @@ def generate_question_from_document(file_path, topic=None):
     if topic:
         prompt += f"\n- Focus the question on the topic of: {topic}"
 
+    if avoid:
+        prompt += "\n- These questions have already been asked, ask about something different:"
+        prompt += "".join(f"\n  * {question}" for question in avoid)
+
     # Generate content using Gemini
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt)
+        response = _generate(prompt, 'generate_question')
 
         # Extract question and answer from the response
         response_text = response.text
@@ -107,14 +189,27 @@ def extract_questions_from_test(file_path):
         list: List of tuples (question, answer) extracted from the document
     """
     # Extract text from the document
-    text = extract_text_from_file(file_path)
+    text = extract_text_from_file(file_path, max_chars=MAX_TEXT_LENGTH + 1)
 
     # If text extraction failed or returned an error message
     if text.startswith("Error") or text.startswith("Unsupported"):
         return [("Could not extract questions", text)]
 
+    return extract_questions_from_text(text)
+
+
+def extract_questions_from_text(text):
+    """
+    Extract exam questions from the already extracted text of a TEST document.
+
+    Args:
+        text (str): Content of the TEST document
+
+    Returns:
+        list: List of tuples (question, answer) extracted from the text
+    """
     # Truncate text if too long (Gemini has token limits)
-    max_length = 10000  # Adjust as needed based on Gemini's limits
+    max_length = MAX_TEXT_LENGTH
     if len(text) > max_length:
         text = text[:max_length] + "..."
 
@@ -137,8 +232,7 @@ def extract_questions_from_test(file_path):
 
     # Generate content using Gemini
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt)
+        response = _generate(prompt, 'extract_questions')
 
         # Extract question and answer from the response
         response_text = response.text
@@ -165,4 +259,62 @@ def extract_questions_from_test(file_path):
             return [("Failed to extract questions properly", f"Error parsing response: {str(e)}")]
 
     except Exception as e:
-        return [(f"Error extracting questions", f"An error occurred: {str(e)}")]
\ No newline at end of file
+        return [(f"Error extracting questions", f"An error occurred: {str(e)}")]
+
+def grade_answers(items):
+    """
+    Grade a batch of answers in a single model call.
+
+    Args:
+        items (list): dicts with 'id', 'question', 'reference' (expected answer) and 'answer' (given answer)
+
+    Returns:
+        dict: {id: (evaluation 0-100, correction)} for every item the model graded
+    """
+    entries = "\n".join(
+        f"""
+        - ID: {item['id']}
+          QUESTION: {item['question']}
+          REFERENCE ANSWER: {item['reference']}
+          STUDENT ANSWER: {item['answer']}"""
+        for item in items
+    )
+
+    prompt = f"""
+        You are grading a student's answers. For each entry below, compare the student answer
+        with the reference answer and grade how correct and complete it is.
+
+        ENTRIES:
+        {entries}
+
+        INSTRUCTIONS:
+        - Give each answer an evaluation from 0 (completely wrong) to 100 (fully correct)
+        - Write a short correction explaining what is wrong or missing (or confirming it is correct)
+        - Format your response as a JSON array of objects with 'id', 'evaluation' and 'correction' fields
+        - Use exactly the IDs given above, one object per entry
+        - Don't include any other text outside the JSON format
+        """
+
+    response = _generate(prompt, 'grade_answers')
+
+    response_text = response.text
+
+    # Clean up response text to extract just the JSON
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].strip()
+
+    import json
+    result = json.loads(response_text)
+    if isinstance(result, dict):
+        result = [result]
+
+    grades = {}
+    for entry in result:
+        try:
+            evaluation = min(100.0, max(0.0, float(entry.get("evaluation"))))
+        except (TypeError, ValueError):
+            continue
+        grades[str(entry.get("id"))] = (evaluation, entry.get("correction"))
+    return grades
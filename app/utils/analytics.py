@@ -0,0 +1,311 @@
+"""
+Columnar snapshots of the sessions, questions and tasks, for offline analytics.
+
+A snapshot is one flat table (SNAPSHOTS: one row per session, question or
+task, metrics and scores as numbers, ids and enums as strings) written as:
+
+    npz      a NumPy archive, one array per column (`numpy.load(f)['evaluation']`).
+             Written with the standard library: numpy is only needed to read it.
+             Missing numbers are NaN, missing dates NaT, missing ids ''. String
+             columns are as wide as their longest value.
+    parquet  a Parquet file, one row group per chunk (optional `pyarrow` package)
+
+Rows are read with a server-side cursor (`yield_per`), ANALYTICS_CHUNK_SIZE
+at a time; each chunk is appended to one temporary file per column (npz) or
+written as a row group (parquet), so memory stays bounded whatever the size
+of the database. On PostgreSQL the rows are read in a REPEATABLE READ
+transaction, so a snapshot is consistent even while the tables change.
+
+Sessions in cold storage (app.utils.cold_storage) are included, with their
+questions, and flagged by the `archived` column.
+"""
+import datetime
+import enum
+import functools
+import importlib.util
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+
+import click
+from flask import current_app
+from sqlalchemy import false, func, select
+
+from app import db
+from app.utils.archive import _decode
+
+NAT = -2 ** 63  # NumPy's "not a time"
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Columns of each snapshot: (name, kind)
+SNAPSHOTS = {
+    'sessions': [
+        ('id', 'str'), ('project_id', 'str'), ('timestamp', 'datetime'), ('duration_minutes', 'int'),
+        ('awareness_level', 'float'), ('confidence_level', 'float'), ('energy_level', 'float'),
+        ('performance_level', 'float'), ('satisfaction_level', 'float'), ('question_count', 'int'),
+        ('archived', 'bool'),
+    ],
+    'questions': [
+        ('id', 'str'), ('session_id', 'str'), ('project_id', 'str'), ('session_timestamp', 'datetime'),
+        ('evaluation', 'float'), ('source_type', 'str'), ('test_document_id', 'str'), ('archived', 'bool'),
+    ],
+    'tasks': [
+        ('id', 'str'), ('project_id', 'str'), ('milestone_id', 'str'), ('name', 'str'), ('completed', 'bool'),
+        ('created_at', 'datetime'),
+    ],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def formats():
+    """Formats available here: npz always, parquet when pyarrow is installed (not imported until used)."""
+    return ('npz',) + (('parquet',) if importlib.util.find_spec('pyarrow') is not None else ())
+
+
+def default_format():
+    return 'parquet' if 'parquet' in formats() else 'npz'
+
+
+# -----------------------------------------------
+# ROWS
+# -----------------------------------------------
+def _hot_query(snapshot, project_id):
+    """SELECT of the rows of a snapshot in the hot tables, columns in SNAPSHOTS order."""
+    from app.models.models import LearningSession, Question, Task
+
+    if snapshot == 'sessions':
+        s = LearningSession
+        query = (select(s.id, s.project_id, s.timestamp, s.duration_minutes, s.awareness_level,
+                        s.confidence_level, s.energy_level, s.performance_level, s.satisfaction_level,
+                        s.question_count, false())
+                 .order_by(s.id))
+        owner = s.project_id
+    elif snapshot == 'questions':
+        q, s = Question, LearningSession
+        query = (select(q.id, q.session_id, s.project_id, s.timestamp, q.evaluation, q.source_type,
+                        q.test_document_id, false())
+                 .join(s, q.session_id == s.id).order_by(q.id))
+        owner = s.project_id
+    else:
+        t = Task
+        query = (select(t.id, t.project_id, t.milestone_id, t.name, func.coalesce(t.completed, false()),
+                        t.created_at)
+                 .order_by(t.id))
+        owner = t.project_id
+    return query.where(owner == project_id) if project_id is not None else query
+
+
+def _archived_rows(snapshot, project_id, chunk_size):
+    """Chunks of rows of a snapshot held by the sessions in cold storage."""
+    from app.models.models import ArchivedSession
+    from app.utils.cold_storage import _unpack
+
+    if snapshot not in ('sessions', 'questions'):
+        return
+    tables = db.metadata.tables
+    session_table, question_table = tables['learning_session'], tables['question']
+    query = select(ArchivedSession.project_id, ArchivedSession.payload).order_by(ArchivedSession.id)
+    if project_id is not None:
+        query = query.where(ArchivedSession.project_id == project_id)
+
+    rows = []
+    for owner, payload in db.session.execute(query.execution_options(yield_per=50)):
+        records = _unpack(payload)
+        session = {key: _decode(session_table.c[key], value) for key, value in records['learning_session'][0].items()}
+        if snapshot == 'sessions':
+            rows.append((session['id'], owner, session['timestamp'], session['duration_minutes'],
+                         session['awareness_level'], session['confidence_level'], session['energy_level'],
+                         session['performance_level'], session['satisfaction_level'],
+                         len(records.get('question', [])), True))
+        else:
+            for record in records.get('question', []):
+                rows.append((record['id'], session['id'], owner, session['timestamp'], record['evaluation'],
+                             _decode(question_table.c.source_type, record['source_type']),
+                             record.get('test_document_id'), True))
+        if len(rows) >= chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def snapshot_rows(snapshot, project_id=None, chunk_size=None):
+    """
+    Read the rows of a snapshot, chunk by chunk, through a server-side cursor.
+
+    Yields:
+        list: tuples, columns in SNAPSHOTS order
+    """
+    chunk_size = chunk_size or current_app.config['ANALYTICS_CHUNK_SIZE']
+    result = db.session.execute(_hot_query(snapshot, project_id).execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield partition
+    yield from _archived_rows(snapshot, project_id, chunk_size)
+
+
+# -----------------------------------------------
+# WRITERS
+# -----------------------------------------------
+def _normalize(kind, value):
+    """Value as written: enums by name, datetimes naive UTC, booleans without None."""
+    if value is None:
+        return False if kind == 'bool' else None
+    if kind == 'str':
+        return value.name if isinstance(value, enum.Enum) else str(value)
+    if kind == 'datetime' and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _npy_header(dtype, length):
+    """Header of a version 1.0 .npy file holding a 1-d array (padded to 64 bytes, as numpy does)."""
+    header = f"{{'descr': '{dtype}', 'fortran_order': False, 'shape': ({length},), }}"
+    padding = -(10 + len(header) + 1) % 64
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header
+
+
+class NpzWriter:
+    """
+    Writes a snapshot as a NumPy .npz archive (uncompressed, like numpy.savez).
+
+    Strings are spooled with their length and padded on close to the longest
+    value of the column, since a .npy string array has a fixed width.
+    """
+
+    def __init__(self, fileobj, columns):
+        self.fileobj = fileobj
+        self.columns = columns
+        self.spools = [tempfile.TemporaryFile() for _ in columns]
+        self.widths = [1] * len(columns)
+        self.length = 0
+
+    @staticmethod
+    def _dtype(kind, width):
+        return {'str': f'<U{width}', 'int': '<i8', 'float': '<f8', 'bool': '|b1', 'datetime': '<M8[us]'}[kind]
+
+    @staticmethod
+    def _pack(kind, values):
+        if kind == 'str':
+            return b''.join(struct.pack('<I', len(value or '')) + (value or '').encode('utf-32-le') for value in values)
+        if kind == 'int':
+            return struct.pack(f'<{len(values)}q', *(value or 0 for value in values))
+        if kind == 'float':
+            return struct.pack(f'<{len(values)}d', *(float('nan') if value is None else value for value in values))
+        if kind == 'bool':
+            return bytes(bool(value) for value in values)
+        return struct.pack(f'<{len(values)}q', *(NAT if value is None else (value - EPOCH) // datetime.timedelta(
+            microseconds=1) for value in values))
+
+    def write(self, rows):
+        for position, ((name, kind), spool) in enumerate(zip(self.columns, self.spools)):
+            values = [_normalize(kind, row[position]) for row in rows]
+            if kind == 'str':
+                self.widths[position] = max([self.widths[position]] + [len(value or '') for value in values])
+            spool.write(self._pack(kind, values))
+        self.length += len(rows)
+
+    def _copy_padded(self, spool, member, width):
+        """Copy spooled (length, UTF-32 text) records as fixed-width UTF-32 values."""
+        for _ in range(self.length):
+            length, = struct.unpack('<I', spool.read(4))
+            member.write(spool.read(length * 4).ljust(width * 4, b'\0'))
+
+    def close(self):
+        with zipfile.ZipFile(self.fileobj, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for (name, kind), width, spool in zip(self.columns, self.widths, self.spools):
+                spool.seek(0)
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    member.write(_npy_header(self._dtype(kind, width), self.length))
+                    if kind == 'str':
+                        self._copy_padded(spool, member, width)
+                    else:
+                        shutil.copyfileobj(spool, member)
+                spool.close()
+
+
+class ParquetWriter:
+    """Writes a snapshot as a Parquet file, one row group per chunk."""
+
+    def __init__(self, fileobj, columns):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pyarrow = pyarrow
+        types = {'str': pyarrow.string(), 'int': pyarrow.int64(), 'float': pyarrow.float64(),
+                 'bool': pyarrow.bool_(), 'datetime': pyarrow.timestamp('us')}
+        self.columns = columns
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(fileobj, self.schema)
+
+    def write(self, rows):
+        pyarrow = self.pyarrow
+        arrays = [pyarrow.array([_normalize(kind, row[position]) for row in rows], type=field.type)
+                  for position, ((name, kind), field) in enumerate(zip(self.columns, self.schema))]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'npz': NpzWriter, 'parquet': ParquetWriter}
+
+
+def write_snapshot(snapshot, fileobj, fmt=None, project_id=None, chunk_size=None):
+    """
+    Write a snapshot to a binary file.
+
+    Args:
+        snapshot (str): 'sessions', 'questions' or 'tasks'
+        fileobj: Binary file to write to
+        fmt (str, optional): One of formats() (default: parquet when available, else npz)
+        project_id (str, optional): Only the rows of this project
+        chunk_size (int, optional): Rows per fetch (default ANALYTICS_CHUNK_SIZE)
+
+    Returns:
+        int: number of rows written
+    """
+    fmt = fmt or default_format()
+    if snapshot not in SNAPSHOTS:
+        raise ValueError(f"Unknown snapshot {snapshot!r} (expected one of: {', '.join(SNAPSHOTS)})")
+    if fmt not in formats():
+        raise ValueError(f"Unknown or unavailable format {fmt!r} (expected one of: {', '.join(formats())})")
+
+    if db.session.get_bind().dialect.name == 'postgresql' and not db.session().in_transaction():
+        db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+    writer = WRITERS[fmt](fileobj, SNAPSHOTS[snapshot])
+    count = 0
+    try:
+        for rows in snapshot_rows(snapshot, project_id, chunk_size):
+            writer.write(rows)
+            count += len(rows)
+        writer.close()
+    finally:
+        db.session.rollback()
+    return count
+
+
+def init_analytics(app):
+    """Configure snapshot exports and register the `flask export-snapshot` command."""
+    app.config.setdefault('ANALYTICS_CHUNK_SIZE', int(os.getenv('ANALYTICS_CHUNK_SIZE', 10000)))
+
+    @app.cli.command('export-snapshot')
+    @click.argument('directory', type=click.Path(file_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['npz', 'parquet']), default=None,
+                  help='npz, or parquet (needs pyarrow). Default: parquet when available, else npz.')
+    @click.option('--project', 'project_id', default=None, help='Only this project (default: all).')
+    @click.option('--snapshot', 'snapshots', multiple=True, type=click.Choice(list(SNAPSHOTS)),
+                  help='Snapshot to export, can be repeated (default: all).')
+    def export_snapshot_command(directory, fmt, project_id, snapshots):
+        """Write columnar snapshots of the sessions, questions and tasks to DIRECTORY."""
+        fmt = fmt or default_format()
+        if fmt not in formats():
+            raise click.BadParameter(f'{fmt} is not available (install pyarrow)', param_hint='--format')
+        os.makedirs(directory, exist_ok=True)
+        for snapshot in snapshots or SNAPSHOTS:
+            path = os.path.join(directory, f'{snapshot}.{fmt}')
+            with open(path, 'wb') as f:
+                count = write_snapshot(snapshot, f, fmt, project_id)
+            click.echo(f'{path}: {count} rows')
@@ -0,0 +1,310 @@
+"""
+Streaming export and import of a whole project.
+
+The export is a tar archive (optionally gzip-compressed) built on the fly:
+
+    manifest.json
+    records/NN_<table>.ndjson   one JSON object per row, tables in foreign key order
+    files/<document id>/<filename>   the uploaded files
+
+Rows are read from the database in batches and every NDJSON file is spooled to
+a temporary file before being streamed, and uploaded files are streamed in
+chunks, so memory stays constant whatever the size of the project.
+
+The import reads the archive sequentially from the request stream: rows are
+bulk-inserted in chunks with fresh ids (so a project can be imported next to
+its original) and files are copied to uploads/<new project id>/.
+"""
+import datetime
+import enum
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zlib
+
+from sqlalchemy import select, DateTime, Enum
+from werkzeug.utils import secure_filename
+
+from app import db
+from app.models.types import new_id
+from app.utils.counters import recount
+from app.utils.changes import record_snapshot
+
+FORMAT = 'purplle-export'
+FORMAT_VERSION = 1
+BATCH_SIZE = 500
+CHUNK_SIZE = 1024 * 1024
+
+# Tables of a project, parents before children
+EXPORT_TABLES = [
+    'project', 'document', 'document_chunk', 'milestone', 'task', 'learning_session',
+    'learning_session_resource', 'learning_session_test', 'question', 'question_resource',
+    'document_reference', 'review_state', 'question_lsh_band',
+]
+
+
+def _project_filter(table_name, project_id):
+    """WHERE clause selecting the rows of a table that belong to a project."""
+    tables = db.metadata.tables
+    t = tables[table_name]
+    documents = select(tables['document'].c.id).where(tables['document'].c.project_id == project_id)
+    sessions = select(tables['learning_session'].c.id).where(
+        tables['learning_session'].c.project_id == project_id)
+    questions = select(tables['question'].c.id).where(tables['question'].c.session_id.in_(sessions))
+
+    if table_name == 'project':
+        return t.c.id == project_id
+    if 'project_id' in t.c:
+        return t.c.project_id == project_id
+    if table_name == 'document_chunk':
+        return t.c.document_id.in_(documents)
+    if table_name in ('learning_session_resource', 'learning_session_test'):
+        return t.c.session_id.in_(sessions)
+    if table_name == 'question':
+        return t.c.session_id.in_(sessions)
+    if table_name in ('question_resource', 'document_reference'):
+        return t.c.question_id.in_(questions)
+    raise ValueError(f'No project filter for table {table_name}')
+
+
+def _encode(value):
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _decode(column, value):
+    """Inverse of _encode for a column of the table."""
+    if value is None:
+        return None
+    if isinstance(column.type, Enum) and column.type.enum_class:
+        return column.type.enum_class[value]
+    if isinstance(column.type, DateTime):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+# -----------------------------------------------
+# EXPORT
+# -----------------------------------------------
+def _tar_header(name, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT)
+
+
+def _tar_padding(size):
+    return b'\0' * ((tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE) % tarfile.BLOCKSIZE)
+
+
+def _tar_member(name, fileobj, size):
+    """Yield a tar member (header, content in chunks, padding)."""
+    yield _tar_header(name, size)
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+    yield _tar_padding(size)
+
+
+def _spool_table(table_name, project_id):
+    """Write the rows of a table to a temporary NDJSON file. Returns (file, size)."""
+    from app.utils.cold_storage import archived_records
+
+    table = db.metadata.tables[table_name]
+    spool = tempfile.TemporaryFile()
+    result = db.session.execute(
+        select(table).where(_project_filter(table_name, project_id)).execution_options(yield_per=BATCH_SIZE)
+    )
+    for row in result.mappings():
+        spool.write(json.dumps({key: _encode(value) for key, value in row.items()}).encode())
+        spool.write(b'\n')
+    # Sessions in cold storage are exported like the others
+    for record in archived_records(table_name, project_id):
+        spool.write(json.dumps(record).encode())
+        spool.write(b'\n')
+    size = spool.tell()
+    spool.seek(0)
+    return spool, size
+
+
+def export_project(project_id):
+    """
+    Generate the tar archive of a project, chunk by chunk.
+    Must be consumed inside an app context (e.g. with stream_with_context).
+    """
+    tables = db.metadata.tables
+    documents = db.session.execute(
+        select(tables['document'].c.id, tables['document'].c.filename, tables['document'].c.file_path)
+        .where(tables['document'].c.project_id == project_id)
+    ).all()
+
+    manifest = json.dumps({
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'projectId': project_id,
+        'exportedAt': datetime.datetime.utcnow().isoformat(),
+        'tables': EXPORT_TABLES,
+    }).encode()
+    yield from _tar_member('manifest.json', io.BytesIO(manifest), len(manifest))
+
+    for position, table_name in enumerate(EXPORT_TABLES):
+        spool, size = _spool_table(table_name, project_id)
+        with spool:
+            yield from _tar_member(f'records/{position:02d}_{table_name}.ndjson', spool, size)
+
+    for document_id, filename, file_path in documents:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, 'rb') as f:
+            yield from _tar_member(f'files/{document_id}/{filename}', f, os.fstat(f.fileno()).st_size)
+
+    # End of archive: two empty blocks
+    yield b'\0' * (tarfile.BLOCKSIZE * 2)
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream of byte chunks as gzip."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# -----------------------------------------------
+# IMPORT
+# -----------------------------------------------
+def _safe_filename(filename):
+    """
+    Name an imported file is stored under, inside the project's upload folder
+    (as for uploads, see secure_filename). Absolute paths and `..` are refused.
+    """
+    parts = filename.replace('\\', '/').split('/')
+    if filename.startswith(('/', '\\')) or os.path.isabs(filename) or '..' in parts:
+        raise ValueError(f'Invalid file name in archive: {filename}')
+    safe = secure_filename(parts[-1])
+    if not safe:
+        raise ValueError(f'Invalid file name in archive: {filename}')
+    return safe
+
+
+class _Importer:
+    """Inserts the rows of an archive with fresh ids, remembering old -> new."""
+
+    def __init__(self, upload_root):
+        self.ids = {}
+        self.project_id = None
+        self.upload_root = upload_root
+        self.counts = {}
+
+    def _new_id(self, old):
+        new = self.ids.get(old)
+        if new is None:
+            new = self.ids[old] = new_id()
+        return new
+
+    def _convert(self, table, record):
+        row = {}
+        for column in table.columns:
+            if column.name not in record:
+                continue
+            value = record[column.name]
+            if column.primary_key and isinstance(column.type, db.Integer):
+                # Surrogate integer keys are regenerated by the database
+                continue
+            if value is not None and (column.foreign_keys or (column.primary_key and column.name == 'id')):
+                value = self._new_id(value)
+            else:
+                value = _decode(column, value)
+            row[column.name] = value
+        if table.name == 'document':
+            from app.models.models import DocumentStatus
+
+            row['file_path'] = os.path.join(self.upload_root, row['project_id'], _safe_filename(record['filename']))
+            # Was being processed when exported: process it again
+            if row.get('status') == DocumentStatus.PROCESSING:
+                row['status'] = DocumentStatus.PENDING
+        return row
+
+    def insert_records(self, table_name, lines):
+        if table_name not in EXPORT_TABLES:
+            raise ValueError(f'Unknown table in archive: {table_name}')
+        table = db.metadata.tables[table_name]
+        batch = []
+        for line in lines:
+            if not line.strip():
+                continue
+            row = self._convert(table, json.loads(line))
+            if table_name == 'project':
+                self.project_id = row['id']
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                db.session.execute(table.insert(), batch)
+                self.counts[table_name] = self.counts.get(table_name, 0) + len(batch)
+                batch = []
+        if batch:
+            db.session.execute(table.insert(), batch)
+            self.counts[table_name] = self.counts.get(table_name, 0) + len(batch)
+
+    def write_file(self, old_document_id, filename, fileobj):
+        if self.project_id is None or old_document_id not in self.ids:
+            raise ValueError(f'File for an unknown document: {old_document_id}/{filename}')
+        folder = os.path.join(self.upload_root, self.project_id)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, _safe_filename(filename)), 'wb') as out:
+            shutil.copyfileobj(fileobj, out, CHUNK_SIZE)
+        self.counts['files'] = self.counts.get('files', 0) + 1
+
+
+def import_project(stream, upload_root='uploads'):
+    """
+    Import a project archive (tar or tar.gz) read sequentially from a stream.
+    Everything is inserted in one transaction; on error the transaction is
+    rolled back and the files already written are removed.
+
+    Returns:
+        tuple: (new project id, {table: rows inserted, 'files': n})
+    """
+    importer = _Importer(upload_root)
+    try:
+        with tarfile.open(fileobj=stream, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = member.name
+                fileobj = archive.extractfile(member)
+                if name == 'manifest.json':
+                    manifest = json.load(fileobj)
+                    if manifest.get('format') != FORMAT or manifest.get('version') != FORMAT_VERSION:
+                        raise ValueError('Not a supported project archive')
+                elif name.startswith('records/') and name.endswith('.ndjson'):
+                    table_name = name[len('records/'):-len('.ndjson')].split('_', 1)[1]
+                    importer.insert_records(table_name, fileobj)
+                elif name.startswith('files/'):
+                    _, old_document_id, filename = name.split('/', 2)
+                    importer.write_file(old_document_id, filename, fileobj)
+
+        if importer.project_id is None:
+            raise ValueError('The archive does not contain a project')
+        # Counters of archives from older versions are missing or stale
+        recount(importer.project_id)
+        record_snapshot(importer.project_id)
+        db.session.commit()
+        return importer.project_id, importer.counts
+
+    except Exception:
+        db.session.rollback()
+        if importer.project_id:
+            shutil.rmtree(os.path.join(upload_root, importer.project_id), ignore_errors=True)
+        raise
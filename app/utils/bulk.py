@@ -0,0 +1,107 @@
+"""
+Bulk partial updates with optimistic concurrency.
+
+Tasks and questions carry a `version` counter (the ORM's version_id_col, so
+every write bumps it). A client sends the version it last saw with each
+patch: rows whose version has moved on since are reported as conflicts with
+their current values and left untouched, so an update made in another tab is
+never overwritten. The remaining patches are applied with one executemany
+UPDATE per set of columns, still guarded by `WHERE version = :seen`, in the
+caller's transaction.
+"""
+from sqlalchemy import bindparam, select
+
+from app import db
+
+
+class ConcurrentUpdateError(Exception):
+    """A row changed between the read and the guarded UPDATE (retry the request)."""
+
+
+def parse_patches(patches, fields):
+    """
+    Validate a list of patches.
+
+    Args:
+        patches (list): dicts with 'id', 'version' and some of the API fields
+        fields (dict): API field name -> (column name, validator(value) returning the value to store)
+
+    Returns:
+        list: (id, version, {column: value}) tuples
+
+    Raises:
+        ValueError: on a malformed patch
+    """
+    if not isinstance(patches, list) or not patches:
+        raise ValueError('A non-empty list of updates is required')
+
+    parsed, seen = [], set()
+    for patch in patches:
+        if not isinstance(patch, dict) or not patch.get('id'):
+            raise ValueError('Every update needs an id')
+        if not isinstance(patch.get('version'), int) or isinstance(patch.get('version'), bool):
+            raise ValueError(f"Update of {patch['id']} needs the integer version it is based on")
+        if patch['id'] in seen:
+            raise ValueError(f"Duplicate update for {patch['id']}")
+        seen.add(patch['id'])
+
+        values = {}
+        for name, (column, validate) in fields.items():
+            if name in patch:
+                values[column] = validate(patch[name])
+        if not values:
+            raise ValueError(f"Update of {patch['id']} changes nothing (fields: {', '.join(fields)})")
+        parsed.append((patch['id'], patch['version'], values))
+    return parsed
+
+
+def apply_patches(model, scope, patches):
+    """
+    Apply parsed patches to the rows of `model` matching `scope`.
+
+    Returns:
+        dict: {'changed': {id: {column: new value}}, 'previous': {id: row before the update},
+               'conflicts': [current rows], 'not_found': [ids]}
+
+    Raises:
+        ConcurrentUpdateError: if a guarded UPDATE did not match (concurrent write)
+    """
+    table = model.__table__
+    columns = {column for _, _, values in patches for column in values}
+    current = {row.id: row for row in db.session.execute(
+        select(*[table.c[name] for name in {'id', 'version'} | columns])
+        .where(table.c.id.in_([patch_id for patch_id, _, _ in patches]), scope)
+        .with_for_update()
+    )}
+
+    changed, conflicts, not_found = {}, [], []
+    for patch_id, version, values in patches:
+        row = current.get(patch_id)
+        if row is None:
+            not_found.append(patch_id)
+        elif row.version != version:
+            conflicts.append(row)
+        else:
+            values = {column: value for column, value in values.items() if getattr(row, column) != value}
+            if values:
+                changed[patch_id] = dict(values, _version=version)
+
+    # One executemany per set of updated columns
+    groups = {}
+    for patch_id, values in changed.items():
+        key = tuple(sorted(column for column in values if column != '_version'))
+        groups.setdefault(key, []).append(
+            dict({f'b_{column}': values[column] for column in key}, b_id=patch_id, b_version=values['_version']))
+
+    for key, params in groups.items():
+        statement = (table.update()
+                     .where(table.c.id == bindparam('b_id'), table.c.version == bindparam('b_version'))
+                     .values(version=table.c.version + 1, **{column: bindparam(f'b_{column}') for column in key}))
+        result = db.session.execute(statement, params)
+        if db.engine.dialect.supports_sane_multi_rowcount and result.rowcount != len(params):
+            raise ConcurrentUpdateError('Some rows were modified concurrently, retry the request')
+
+    for values in changed.values():
+        del values['_version']
+    return {'changed': changed, 'previous': {patch_id: current[patch_id] for patch_id in changed},
+            'conflicts': conflicts, 'not_found': not_found}
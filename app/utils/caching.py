@@ -0,0 +1,187 @@
+"""
+HTTP caching for the read endpoints.
+
+Every project has a `version` counter that is bumped, in the same transaction,
+whenever something belonging to the project is written (see `_bump_versions`,
+hooked on the session's before_flush). Read endpoints decorated with
+`etag_cached` use that counter to build an ETag: a request carrying a matching
+`If-None-Match` gets a 304 without running the view or the serializer.
+
+The serialized bodies can also be kept in an in-process LRU keyed by
+(resource, version, fieldset), so that clients polling the same resource
+share one serialization. Its size is set with RESPONSE_CACHE_SIZE (0 disables it).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request
+from sqlalchemy import event
+from sqlalchemy.exc import StatementError
+
+from app import db
+
+
+class ResponseCache:
+    """Thread-safe LRU of serialized response bodies."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# -----------------------------------------------
+# VERSION COUNTERS
+# -----------------------------------------------
+def project_id_of(obj):
+    """Id of the project a row belongs to (None while it is not attached to one)."""
+    from app.models.models import Project, Question, DocumentReference
+
+    if isinstance(obj, Project):
+        return obj.id
+    if isinstance(obj, Question):
+        return obj.session.project_id if obj.session else None
+    if isinstance(obj, DocumentReference):
+        question = obj.question
+        return project_id_of(question) if question else None
+    return getattr(obj, 'project_id', None)
+
+
+def _increment_versions(session, project_ids):
+    from app.models.models import Project
+
+    table = Project.__table__
+    session.connection().execute(
+        table.update().where(table.c.id.in_(project_ids)).values(version=table.c.version + 1)
+    )
+
+
+def _bump_versions(session, flush_context, instances):
+    from app.models.models import Project
+
+    project_ids = set()
+    with session.no_autoflush:
+        for obj in list(session.dirty) + list(session.deleted):
+            if isinstance(obj, Project) and not session.is_modified(obj):
+                continue
+            project_ids.add(project_id_of(obj))
+        for obj in session.new:
+            if not isinstance(obj, Project):
+                project_ids.add(project_id_of(obj))
+    project_ids.discard(None)
+
+    if not project_ids:
+        return
+
+    _increment_versions(session, project_ids)
+    for obj in session.identity_map.values():
+        if isinstance(obj, Project) and obj.id in project_ids and obj not in session.dirty:
+            session.expire(obj, ['version'])
+
+
+def bump_project_version(project_id):
+    """
+    Bump a project's version after a bulk (Core) write, which the flush hook
+    does not see. Runs in the current transaction.
+    """
+    _increment_versions(db.session, [project_id])
+
+
+def project_version(project_id):
+    """Current version of a project, or None if it does not exist."""
+    from app.models.models import Project
+
+    try:
+        return db.session.query(Project.version).filter_by(id=project_id).scalar()
+    except StatementError as e:
+        # Malformed id for the column type (e.g. not a UUID on PostgreSQL): no such project
+        if not isinstance(e.orig, ValueError):
+            raise
+        db.session.rollback()
+        return None
+
+
+def projects_version():
+    """Fingerprint of the (id, version) pairs of every project, for the listing endpoint."""
+    from app.models.models import Project
+
+    digest = hashlib.sha1()
+    for project_id, version in db.session.query(Project.id, Project.version).order_by(Project.id):
+        digest.update(f'{project_id}:{version};'.encode())
+    return digest.hexdigest()[:16]
+
+
+# -----------------------------------------------
+# VIEW DECORATOR
+# -----------------------------------------------
+def etag_cached(resource):
+    """
+    Serve a GET view with an ETag derived from the owning project's version.
+
+    The view must take `project_id`; with resource='projects' the fingerprint
+    of every project is used instead. Only 200 responses are cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if 'project_id' in kwargs:
+                version = project_version(kwargs['project_id'])
+                if version is None:
+                    return view(**kwargs)
+            else:
+                version = projects_version()
+
+            fieldset = request.query_string.decode()
+            ids = '/'.join(str(v) for _, v in sorted(kwargs.items()))
+            etag = hashlib.sha1(f'{resource}|{ids}|{version}|{fieldset}'.encode()).hexdigest()[:24]
+
+            # Weak comparison: compressed representations carry the ETag as W/"..."
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            cache = current_app.extensions['response_cache']
+            body = cache.get(etag)
+            if body is not None:
+                response = current_app.response_class(body, mimetype='application/json')
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                if not response.is_streamed:
+                    cache.put(etag, response.get_data())
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def init_caching(app):
+    """Set up the response cache and the version bump hook."""
+    app.config.setdefault('RESPONSE_CACHE_SIZE', int(os.getenv('RESPONSE_CACHE_SIZE', 256)))
+    app.extensions['response_cache'] = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
+
+    if not event.contains(db.session, 'before_flush', _bump_versions):
+        event.listen(db.session, 'before_flush', _bump_versions)
@@ -0,0 +1,399 @@
+"""
+Change feed for incremental client sync.
+
+Every commit that creates, updates or deletes a project, milestone, document,
+task, learning session or question appends one row per entity to the
+`change_log` table, in the same transaction: an upsert, or a tombstone for a
+deleted row. Rows are numbered by a monotonically increasing `seq`; a client
+remembers the highest one it has applied and asks for what came after it
+(`GET /api/changes?since=<seq>`), getting the current state of the upserted
+rows and the ids of the deleted ones. A project whose children changed is
+upserted too, so that its counters follow.
+
+ORM writes are collected by a before_flush hook and written in before_commit.
+On PostgreSQL the log rows are inserted under a transaction-level advisory
+lock, held only until the commit: seq order is commit order, so a reader can
+never see seq n+1 while n is still to come (on SQLite writers are serialized
+anyway). Writes that bypass the ORM record their rows with `record_changes`
+(or `record_snapshot` for a whole imported project).
+
+The log is compacted with `flask compact-changes`: rows superseded by a later
+change of the same entity, and the rows of deleted projects' children, are
+dropped; tombstones older than CHANGE_LOG_RETENTION_DAYS are dropped too and
+move the horizon up. Every page carries the horizon it was read at and the
+client sends it back: a client whose `since` fell below a newer horizon may
+have missed a deletion and must start over from 0, which replays the live rows.
+"""
+import datetime
+import os
+import time
+
+import click
+from sqlalchemy import event, exists, false, func, inspect, literal, select, text
+from sqlalchemy.orm import load_only, selectinload
+
+from app import db
+
+# Sync order of the entities (parents first)
+ENTITIES = ('project', 'milestone', 'document', 'task', 'session', 'question')
+
+# Key of the advisory lock serializing the change log writers (PostgreSQL)
+LOCK_KEY = 0x636c6f67
+
+_OBJECTS = 'changes.objects'
+_ROWS = 'changes.rows'
+_SNAPSHOTS = 'changes.snapshots'
+
+
+class ResyncRequired(Exception):
+    """The changes after `since` were compacted away: the client must sync from 0."""
+
+
+def _models():
+    from app.models.models import Document, LearningSession, Milestone, Project, Question, Task
+
+    return {'project': Project, 'milestone': Milestone, 'document': Document, 'task': Task,
+            'session': LearningSession, 'question': Question}
+
+
+def _entity_of(obj):
+    for entity, model in _models().items():
+        if isinstance(obj, model):
+            return entity
+    return None
+
+
+# -----------------------------------------------
+# COLLECTING WRITES
+# -----------------------------------------------
+def _collect(session, flush_context, instances):
+    """before_flush: remember the rows written, tombstones are resolved now (the parents are still there)."""
+    from app.models.models import DocumentReference
+    from app.utils.caching import project_id_of
+
+    objects = session.info.setdefault(_OBJECTS, set())
+    rows = session.info.setdefault(_ROWS, {})
+
+    def add(obj):
+        # A document reference is part of its question
+        target = obj.question if isinstance(obj, DocumentReference) else obj
+        if target is not None and _entity_of(target):
+            objects.add(target)
+
+    with session.no_autoflush:
+        for obj in session.deleted:
+            entity = _entity_of(obj)
+            if entity is not None:
+                rows[(entity, obj.id)] = (project_id_of(obj), True)
+            elif isinstance(obj, DocumentReference):
+                add(obj)
+        for obj in session.new:
+            add(obj)
+        for obj in session.dirty:
+            if session.is_modified(obj):
+                add(obj)
+
+
+def record_changes(entity, ids, project_id, deleted=False):
+    """
+    Record changes made without the ORM (bulk updates, set-based deletes);
+    they are written to the log when the current transaction commits.
+
+    Args:
+        entity (str): One of ENTITIES
+        ids (iterable): Ids of the changed rows
+        project_id (str): Their project
+        deleted (bool): Tombstones instead of upserts
+    """
+    rows = db.session.info.setdefault(_ROWS, {})
+    for entity_id in ids:
+        rows[(entity, entity_id)] = (project_id, deleted)
+
+
+def record_snapshot(project_id):
+    """Upsert every row of a project (e.g. after an import) when the current transaction commits."""
+    db.session.info.setdefault(_SNAPSHOTS, set()).add(project_id)
+
+
+def _snapshot_queries(project_id):
+    from app.models.models import Document, LearningSession, Milestone, Project, Question, Task
+
+    def rows(entity, project_column, id_column, *where):
+        return (select(project_column, literal(entity), id_column, false(), literal(now, db.DateTime))
+                .where(project_column == project_id, *where))
+
+    now = datetime.datetime.utcnow()
+    yield rows('project', Project.id, Project.id)
+    yield rows('milestone', Milestone.project_id, Milestone.id)
+    yield rows('document', Document.project_id, Document.id)
+    yield rows('task', Task.project_id, Task.id)
+    yield rows('session', LearningSession.project_id, LearningSession.id)
+    yield (rows('question', LearningSession.project_id, Question.id)
+           .select_from(Question).join(LearningSession, Question.session_id == LearningSession.id))
+
+
+def _write(session):
+    """before_commit: append the collected changes to the log."""
+    from app.models.models import Change
+    from app.utils.caching import project_id_of
+
+    # Commit only flushes after this hook: collect what is still pending
+    session.flush()
+    if not any(session.info.get(key) for key in (_OBJECTS, _ROWS, _SNAPSHOTS)):
+        return
+    objects = session.info.pop(_OBJECTS, set())
+    rows = session.info.pop(_ROWS, {})
+    snapshots = session.info.pop(_SNAPSHOTS, set())
+
+    changes = {}
+    for obj in objects:
+        state = inspect(obj)
+        if state.persistent:
+            changes[(_entity_of(obj), obj.id)] = (project_id_of(obj), False)
+    changes.update(rows)
+    # The project of a changed row is upserted too (its counters moved)
+    for (entity, _), (project_id, _) in list(changes.items()):
+        if project_id is not None and ('project', project_id) not in changes:
+            changes[('project', project_id)] = (project_id, False)
+    changes = {key: value for key, value in changes.items() if key[1] is not None}
+    if not changes and not snapshots:
+        return
+
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': LOCK_KEY})
+
+    table = Change.__table__
+    columns = ['project_id', 'entity', 'entity_id', 'deleted', 'created_at']
+    for project_id in snapshots:
+        for query in _snapshot_queries(project_id):
+            connection.execute(table.insert().from_select(columns, query))
+    if changes:
+        now = datetime.datetime.utcnow()
+        connection.execute(table.insert(), [
+            {'project_id': project_id, 'entity': entity, 'entity_id': entity_id, 'deleted': deleted,
+             'created_at': now}
+            for (entity, entity_id), (project_id, deleted)
+            in sorted(changes.items(), key=lambda item: (item[1][1], ENTITIES.index(item[0][0])))
+        ])
+
+
+def _discard(session, *args):
+    for key in (_OBJECTS, _ROWS, _SNAPSHOTS):
+        session.info.pop(key, None)
+
+
+# -----------------------------------------------
+# READING THE FEED
+# -----------------------------------------------
+def _serialize_task(task):
+    return {
+        'id': task.id,
+        'name': task.name,
+        'projectId': task.project_id,
+        'milestoneId': task.milestone_id,
+        'completed': task.completed,
+        'description': task.description,
+        'version': task.version
+    }
+
+
+def _serialize_session(session):
+    return {
+        'id': session.id,
+        'projectId': session.project_id,
+        'timestamp': session.timestamp,
+        'durationMinutes': session.duration_minutes,
+        'motivation': session.motivation,
+        'learningObjective': session.learning_objective,
+        'questionCount': session.question_count,
+        'metrics': {
+            'awarenessLevel': session.awareness_level,
+            'confidenceLevel': session.confidence_level,
+            'energyLevel': session.energy_level,
+            'performanceLevel': session.performance_level,
+            'satisfactionLevel': session.satisfaction_level
+        },
+        'resourceDocumentIds': [document.id for document in session.resource_documents],
+        'testDocumentIds': [document.id for document in session.test_documents]
+    }
+
+
+def _serialize_question(question):
+    return {
+        'id': question.id,
+        'sessionId': question.session_id,
+        'question': question.question,
+        'answer': question.answer,
+        'correction': question.correction,
+        'evaluation': question.evaluation,
+        'sourceType': question.source_type,
+        'version': question.version,
+        'testDocumentId': question.test_document_id,
+        'resourceDocumentIds': [document.id for document in question.resource_documents],
+        'references': [reference.to_dict() for reference in question.references]
+    }
+
+
+def _loaders():
+    """entity -> (loader options, compact serializer): flat rows, children are synced on their own."""
+    from app.models.models import Document, LearningSession, Question
+
+    documents = lambda relationship: selectinload(relationship).options(load_only(Document.id))
+    return {
+        'project': ((), lambda project: {**project.to_summary(), 'motivations': project.motivations,
+                                         'version': project.version}),
+        'milestone': ((), lambda milestone: {**milestone.to_dict(), 'projectId': milestone.project_id}),
+        'document': ((), lambda document: document.to_dict()),
+        'task': ((), _serialize_task),
+        'session': ((documents(LearningSession.resource_documents), documents(LearningSession.test_documents)),
+                    _serialize_session),
+        'question': ((documents(Question.resource_documents), selectinload(Question.references)),
+                     _serialize_question),
+    }
+
+
+def horizon():
+    """Highest seq whose tombstones were compacted away (0 if none)."""
+    from app.models.models import ChangeHorizon
+
+    return db.session.query(func.coalesce(func.max(ChangeHorizon.seq), 0)).scalar()
+
+
+def read_changes(since=0, project_id=None, limit=500, known_horizon=0):
+    """
+    Changes committed after `since`, oldest first, at most one per entity.
+
+    Args:
+        since (int): Last seq the client applied (0 for a full sync)
+        project_id (str, optional): Only the changes of this project
+        limit (int): Log rows read per page
+        known_horizon (int): Horizon returned with the client's previous page
+
+    Returns:
+        dict: {'changes': [{seq, entity, id, op, data?}], 'nextSince', 'hasMore', 'horizon'}
+
+    Raises:
+        ResyncRequired: if tombstones after `since` were compacted away since the client's previous page
+    """
+    from app.models.models import Change
+
+    compacted = horizon()
+    # A full sync pages through rows below the horizon: that is only a problem
+    # if a compaction moved the horizon past `since` in the meantime
+    if since and since < compacted and known_horizon < compacted:
+        raise ResyncRequired(f'Changes up to {compacted} were compacted, sync again from 0')
+
+    query = select(Change).where(Change.seq > since).order_by(Change.seq).limit(limit + 1)
+    if project_id is not None:
+        query = query.where(Change.project_id == project_id)
+    rows = db.session.execute(query).scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Only the last change of each entity matters
+    latest = {}
+    for row in rows:
+        latest[(row.entity, row.entity_id)] = row
+
+    loaders, models = _loaders(), _models()
+    data = {}
+    for entity in ENTITIES:
+        ids = [entity_id for (name, entity_id), row in latest.items() if name == entity and not row.deleted]
+        if not ids:
+            continue
+        options, serialize = loaders[entity]
+        model = models[entity]
+        for obj in model.query.options(*options).filter(model.id.in_(ids)):
+            data[(entity, obj.id)] = serialize(obj)
+
+    changes = []
+    for row in sorted(latest.values(), key=lambda row: row.seq):
+        change = {'seq': row.seq, 'entity': row.entity, 'id': row.entity_id}
+        current = data.get((row.entity, row.entity_id))
+        if current is None:
+            # Deleted since (its tombstone follows)
+            change['op'] = 'delete'
+        else:
+            change['op'] = 'upsert'
+            change['data'] = current
+        changes.append(change)
+
+    return {'changes': changes, 'nextSince': rows[-1].seq if rows else since, 'hasMore': has_more,
+            'horizon': compacted}
+
+
+# -----------------------------------------------
+# COMPACTION
+# -----------------------------------------------
+def compact_changes(retention_days=None, chunk_size=10000):
+    """
+    Drop the log rows no client needs: changes superseded by a later change of
+    the same entity, rows of the children of deleted projects (the project's
+    tombstone covers them) and tombstones older than `retention_days`, which
+    move the horizon up. Runs in chunks of `chunk_size` seqs, one transaction each.
+
+    Returns:
+        dict: rows removed per kind and the new horizon
+    """
+    from flask import current_app
+    from app.models.models import Change, ChangeHorizon
+
+    if retention_days is None:
+        retention_days = current_app.config['CHANGE_LOG_RETENTION_DAYS']
+    table = Change.__table__
+    newer = table.alias('newer')
+    removed = {'superseded': 0, 'orphaned': 0, 'tombstones': 0}
+
+    low, high = db.session.query(func.min(Change.seq), func.max(Change.seq)).one()
+    for start in range(low or 0, (high or 0) + 1, chunk_size):
+        superseded = select(table.c.seq).where(
+            table.c.seq.between(start, start + chunk_size - 1),
+            exists().where(newer.c.entity_id == table.c.entity_id, newer.c.entity == table.c.entity,
+                           newer.c.seq > table.c.seq))
+        removed['superseded'] += db.session.execute(table.delete().where(table.c.seq.in_(superseded))).rowcount
+        db.session.commit()
+
+    dropped_projects = select(table.c.entity_id).where(table.c.entity == 'project', table.c.deleted.is_(True))
+    removed['orphaned'] = db.session.execute(table.delete().where(
+        table.c.entity != 'project', table.c.project_id.in_(dropped_projects))).rowcount
+    db.session.commit()
+
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    expired = db.session.query(func.max(Change.seq)).filter(Change.deleted.is_(True),
+                                                            Change.created_at < cutoff).scalar()
+    state = db.session.get(ChangeHorizon, 1)
+    if state is None:
+        state = ChangeHorizon(id=1, seq=0)
+        db.session.add(state)
+    if expired is not None:
+        removed['tombstones'] = db.session.execute(table.delete().where(
+            table.c.deleted.is_(True), table.c.seq <= expired)).rowcount
+        state.seq = max(state.seq, expired)
+    removed['horizon'] = state.seq
+    db.session.commit()
+    return removed
+
+
+def init_changes(app):
+    """Install the change log hooks and register the `flask compact-changes` command."""
+    app.config.setdefault('CHANGE_LOG_RETENTION_DAYS', float(os.getenv('CHANGE_LOG_RETENTION_DAYS', 30)))
+
+    for name, hook in (('before_flush', _collect), ('before_commit', _write), ('after_rollback', _discard)):
+        if not event.contains(db.session, name, hook):
+            event.listen(db.session, name, hook)
+
+    @app.cli.command('compact-changes')
+    @click.option('--retention-days', type=float, default=None,
+                  help='Keep tombstones this long (default CHANGE_LOG_RETENTION_DAYS).')
+    @click.option('--watch', type=float, default=None,
+                  help='Keep compacting every WATCH seconds.')
+    def compact_changes_command(retention_days, watch):
+        """Drop superseded and expired rows from the change log."""
+        while True:
+            removed = compact_changes(retention_days)
+            click.echo(f"Removed {removed['superseded']} superseded, {removed['orphaned']} orphaned and "
+                       f"{removed['tombstones']} expired rows, horizon {removed['horizon']}")
+            if watch is None:
+                break
+            time.sleep(watch)
@@ -0,0 +1,274 @@
+"""
+Cold storage of old learning sessions.
+
+`archive_sessions` moves the sessions older than a cutoff out of the hot
+tables: each one becomes a row of `archived_session` holding a summary
+(duration, number of questions, average evaluation) and, compressed with
+zlib, the rows of the session and of everything that hangs off it
+(SESSION_TABLES: questions, their references, review state and LSH bands,
+the links to documents). The hot rows are then removed with the set-based
+deletes of app.utils.deletion, a chunk of SESSION_ARCHIVE_CHUNK_SIZE sessions
+per transaction, so the tables and indexes every project read goes through
+only hold the recent sessions.
+
+Archived sessions still count in the project counters (app.utils.counters)
+and are exported with their project (app.utils.archive). Any request naming
+one (`/api/projects/<project_id>/sessions/<session_id>/...`) rehydrates it
+first: its rows are inserted back as they were, minus the links to documents
+deleted since. For the change feed a session leaves when it is archived
+(tombstones) and comes back when it is rehydrated.
+"""
+import datetime
+import json
+import os
+import zlib
+from collections import defaultdict
+
+import click
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, StatementError
+
+from app import db
+from app.utils.archive import _decode, _encode
+from app.utils.caching import bump_project_version
+from app.utils.changes import record_changes
+from app.utils.deletion import _delete_sessions
+
+# Tables holding the rows of a session, parents before children
+SESSION_TABLES = [
+    'learning_session', 'learning_session_resource', 'learning_session_test', 'question',
+    'question_resource', 'document_reference', 'review_state', 'question_lsh_band',
+]
+
+COMPRESSION_LEVEL = 6
+
+
+def _session_filter(table_name, session_ids):
+    """WHERE clause selecting the rows of a table that belong to the sessions."""
+    tables = db.metadata.tables
+    t = tables[table_name]
+    if table_name == 'learning_session':
+        return t.c.id.in_(session_ids)
+    if 'session_id' in t.c:
+        return t.c.session_id.in_(session_ids)
+    questions = select(tables['question'].c.id).where(tables['question'].c.session_id.in_(session_ids))
+    return t.c.question_id.in_(questions)
+
+
+def _pack(tables):
+    """{table: [encoded rows]} -> compressed JSON (column names stored once per table)."""
+    data = {}
+    for table_name, rows in tables.items():
+        if rows:
+            columns = list(rows[0])
+            data[table_name] = {'columns': columns, 'rows': [[row[c] for c in columns] for row in rows]}
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def _unpack(payload):
+    """Inverse of _pack."""
+    data = json.loads(zlib.decompress(payload))
+    return {table_name: [dict(zip(table['columns'], row)) for row in table['rows']]
+            for table_name, table in data.items()}
+
+
+# -----------------------------------------------
+# ARCHIVE
+# -----------------------------------------------
+def _archive_chunk(session_ids, counts):
+    from app.models.models import ArchivedSession
+
+    tables = db.metadata.tables
+    grouped = defaultdict(lambda: defaultdict(list))
+    question_sessions = {}
+    for table_name in SESSION_TABLES:
+        result = db.session.execute(select(tables[table_name]).where(_session_filter(table_name, session_ids)))
+        for row in result.mappings():
+            row = {key: _encode(value) for key, value in row.items()}
+            if table_name == 'learning_session':
+                session_id = row['id']
+            elif 'session_id' in row:
+                session_id = row['session_id']
+            else:
+                session_id = question_sessions[row['question_id']]
+            if table_name == 'question':
+                question_sessions[row['id']] = session_id
+            grouped[session_id][table_name].append(row)
+
+    archived, questions = [], defaultdict(list)
+    for session_id in session_ids:
+        rows = grouped[session_id]
+        session = rows['learning_session'][0]
+        evaluations = [q['evaluation'] for q in rows['question'] if q['evaluation'] is not None]
+        payload = _pack(rows)
+        archived.append({
+            'id': session_id,
+            'project_id': session['project_id'],
+            'timestamp': _decode(tables['learning_session'].c.timestamp, session['timestamp']),
+            'archived_at': datetime.datetime.utcnow(),
+            'duration_minutes': session['duration_minutes'] or 0,
+            'question_count': len(rows['question']),
+            'evaluated_count': len(evaluations),
+            'average_evaluation': sum(evaluations) / len(evaluations) if evaluations else None,
+            'payload': payload,
+            'payload_size': len(payload),
+        })
+        questions[session['project_id']].extend(q['id'] for q in rows['question'])
+        counts['bytes'] += len(payload)
+        counts['questions'] += len(rows['question'])
+
+    db.session.execute(ArchivedSession.__table__.insert(), archived)
+    _delete_sessions(session_ids, {})
+
+    for project_id in {row['project_id'] for row in archived}:
+        record_changes('question', questions[project_id], project_id, deleted=True)
+        record_changes('session', [row['id'] for row in archived if row['project_id'] == project_id],
+                       project_id, deleted=True)
+        bump_project_version(project_id)
+    counts['sessions'] += len(session_ids)
+
+
+def archive_sessions(before, project_id=None, chunk_size=None):
+    """
+    Move the sessions started before a date to cold storage.
+
+    Args:
+        before (datetime): Cutoff (sessions without a timestamp are kept)
+        project_id (str, optional): Only the sessions of this project
+        chunk_size (int, optional): Sessions per transaction (default SESSION_ARCHIVE_CHUNK_SIZE)
+
+    Returns:
+        dict: number of sessions and questions archived, compressed bytes written
+    """
+    from app.models.models import LearningSession
+
+    chunk_size = chunk_size or current_app.config['SESSION_ARCHIVE_CHUNK_SIZE']
+    query = (select(LearningSession.id).where(LearningSession.timestamp < before)
+             .order_by(LearningSession.timestamp, LearningSession.id).limit(chunk_size).with_for_update())
+    if project_id is not None:
+        query = query.where(LearningSession.project_id == project_id)
+
+    counts = {'sessions': 0, 'questions': 0, 'bytes': 0}
+    while True:
+        session_ids = [session_id for session_id, in db.session.execute(query)]
+        if not session_ids:
+            return counts
+        _archive_chunk(session_ids, counts)
+        db.session.commit()
+
+
+# -----------------------------------------------
+# REHYDRATION
+# -----------------------------------------------
+def _restorable(tables, existing=None):
+    """
+    Drop the links to documents deleted while the session was archived.
+
+    Args:
+        existing (set, optional): Ids of the documents that still exist (default: looked up)
+    """
+    if existing is None:
+        document_ids = {row[column] for rows in tables.values() for row in rows
+                        for column in ('document_id', 'test_document_id') if row.get(column)}
+        document = db.metadata.tables['document']
+        existing = {document_id for document_id, in db.session.execute(
+            select(document.c.id).where(document.c.id.in_(document_ids)))} if document_ids else set()
+    for table_name, rows in tables.items():
+        if 'document_id' in db.metadata.tables[table_name].c:
+            tables[table_name] = [row for row in rows if row['document_id'] in existing]
+    for row in tables.get('question', []):
+        if row.get('test_document_id') not in existing:
+            row['test_document_id'] = None
+    return tables
+
+
+def rehydrate_session(session_id):
+    """
+    Move an archived session back to the hot tables, in one transaction.
+
+    Returns:
+        bool: whether the session was archived (False for hot or unknown sessions)
+    """
+    from app.models.models import ArchivedSession
+
+    archived_table = ArchivedSession.__table__
+    try:
+        archived = db.session.execute(
+            select(archived_table.c.project_id, archived_table.c.payload)
+            .where(archived_table.c.id == session_id).with_for_update()
+        ).first()
+    except StatementError as e:
+        # Malformed id for the column type (e.g. not a UUID on PostgreSQL): not archived
+        if not isinstance(e.orig, ValueError):
+            raise
+        db.session.rollback()
+        return False
+    if archived is None:
+        return False
+
+    tables = _restorable(_unpack(archived.payload))
+    try:
+        for table_name in SESSION_TABLES:
+            table = db.metadata.tables[table_name]
+            rows = [{column.name: _decode(column, row[column.name]) for column in table.columns
+                     if column.name in row and not (column.primary_key and isinstance(column.type, db.Integer))}
+                    for row in tables.get(table_name, [])]
+            if rows:
+                db.session.execute(table.insert(), rows)
+        db.session.execute(archived_table.delete().where(archived_table.c.id == session_id))
+        record_changes('session', [session_id], archived.project_id)
+        record_changes('question', [row['id'] for row in tables.get('question', [])], archived.project_id)
+        bump_project_version(archived.project_id)
+        db.session.commit()
+    except IntegrityError:
+        # Rehydrated by a concurrent request in the meantime (SQLite does not lock the row)
+        db.session.rollback()
+        if archived_session_exists(session_id):
+            raise
+    return True
+
+
+def archived_session_exists(session_id):
+    from app.models.models import ArchivedSession
+
+    return db.session.query(ArchivedSession.id).filter_by(id=session_id).scalar() is not None
+
+
+def archived_records(table_name, project_id):
+    """Rows of a table held by the archived sessions of a project, encoded as in the export."""
+    from app.models.models import ArchivedSession, Document
+
+    if table_name not in SESSION_TABLES:
+        return
+    existing = {document_id for document_id, in db.session.query(Document.id).filter_by(project_id=project_id)}
+    result = db.session.execute(select(ArchivedSession.payload).where(ArchivedSession.project_id == project_id)
+                                .execution_options(yield_per=50))
+    for payload, in result:
+        yield from _restorable(_unpack(payload), existing).get(table_name, [])
+
+
+def init_cold_storage(app):
+    """Configure session archiving and register the `flask archive-sessions` and `flask rehydrate-session` commands."""
+    app.config.setdefault('SESSION_ARCHIVE_AFTER_DAYS', int(os.getenv('SESSION_ARCHIVE_AFTER_DAYS', 365)))
+    app.config.setdefault('SESSION_ARCHIVE_CHUNK_SIZE', int(os.getenv('SESSION_ARCHIVE_CHUNK_SIZE', 100)))
+
+    @app.cli.command('archive-sessions')
+    @click.option('--older-than-days', type=int, default=None,
+                  help='Archive the sessions older than this (default: SESSION_ARCHIVE_AFTER_DAYS).')
+    @click.option('--project', 'project_id', default=None, help='Only this project (default: all).')
+    def archive_sessions_command(older_than_days, project_id):
+        """Move the old learning sessions to cold storage."""
+        days = older_than_days if older_than_days is not None else app.config['SESSION_ARCHIVE_AFTER_DAYS']
+        counts = archive_sessions(datetime.datetime.utcnow() - datetime.timedelta(days=days), project_id)
+        click.echo(f"Archived {counts['sessions']} sessions ({counts['questions']} questions, "
+                   f"{counts['bytes']} compressed bytes)")
+
+    @app.cli.command('rehydrate-session')
+    @click.argument('session_id')
+    def rehydrate_session_command(session_id):
+        """Move an archived learning session back to the hot tables."""
+        if rehydrate_session(session_id):
+            click.echo(f'Rehydrated session {session_id}')
+        else:
+            click.echo(f'Session {session_id} is not archived')
@@ -0,0 +1,229 @@
+"""
+Negotiated response compression.
+
+An after_request hook compresses JSON and text responses with the best
+encoding the client accepts (Accept-Encoding, q-values honoured): zstd and
+brotli when the optional `zstandard` and `brotli` packages are installed,
+gzip always. Bodies smaller than COMPRESSION_MIN_SIZE are sent as they are.
+Streamed responses (JSON arrays, NDJSON) are compressed chunk by chunk as
+they are produced, so memory stays flat and the first bytes go out early.
+
+Responses carrying an ETag (see app.utils.caching) are compressed once per
+encoding and kept in an LRU of COMPRESSION_CACHE_SIZE entries; the ETag of a
+compressed representation is made weak, as its bytes differ from the
+uncompressed one. Files (send_file) are left alone: the extracted text of the
+documents is stored precompressed next to the plain text (`precompress_file`)
+and served as is.
+"""
+import importlib.util
+import itertools
+import os
+import zlib
+
+from flask import current_app, request
+
+from app.utils.caching import ResponseCache
+
+# Mimetypes worth compressing (prefixes)
+COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'text/')
+
+
+class _Gzip:
+    extension = 'gz'
+    module = None
+
+    @staticmethod
+    def compress(data, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    @staticmethod
+    def stream(chunks, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class _Brotli:
+    extension = 'br'
+
+    module = 'brotli'
+
+    @staticmethod
+    def compress(data, level):
+        import brotli
+        return brotli.compress(data, quality=level)
+
+    @staticmethod
+    def stream(chunks, level):
+        import brotli
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class _Zstd:
+    extension = 'zst'
+
+    module = 'zstandard'
+
+    @staticmethod
+    def compress(data, level):
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    @staticmethod
+    def stream(chunks, level):
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+# Content-Encoding -> codec, in order of preference. The optional packages are
+# only looked up here, and imported on first use
+CODECS = {name: codec for name, codec in (('zstd', _Zstd), ('br', _Brotli), ('gzip', _Gzip))
+          if codec.module is None or importlib.util.find_spec(codec.module) is not None}
+
+# Levels for responses compressed on the fly, and for files compressed once
+LEVELS = {'zstd': 3, 'br': 5, 'gzip': 6}
+PRECOMPRESS_LEVELS = {'zstd': 15, 'br': 9, 'gzip': 9}
+
+
+def negotiate(accept_encodings, encodings=None):
+    """
+    Best encoding the client accepts, None for identity.
+
+    Args:
+        accept_encodings: werkzeug Accept of the request's Accept-Encoding
+        encodings (list, optional): Candidates in order of preference (default: every available codec)
+    """
+    best, best_quality = None, 0
+    for name in encodings if encodings is not None else CODECS:
+        quality = accept_encodings[name]
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compressed_path(path, encoding):
+    return f'{path}.{CODECS[encoding].extension}'
+
+
+def precompress_file(path, encodings=None):
+    """
+    Write a compressed copy of a file for each encoding (`<path>.gz`,
+    `<path>.br`, `<path>.zst`), at higher levels than on the fly: it is done
+    once and served many times.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    for encoding in encodings if encodings is not None else CODECS:
+        target = compressed_path(path, encoding)
+        tmp_path = target + '.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(CODECS[encoding].compress(data, PRECOMPRESS_LEVELS[encoding]))
+        os.replace(tmp_path, target)
+
+
+def precompressed(path, encoding):
+    """Path of an up-to-date compressed copy of a file, None if there is none."""
+    if encoding is None:
+        return None
+    target = compressed_path(path, encoding)
+    try:
+        return target if os.path.getmtime(target) >= os.path.getmtime(path) else None
+    except OSError:
+        return None
+
+
+# -----------------------------------------------
+# RESPONSE HOOK
+# -----------------------------------------------
+def _compressible(response):
+    if request.method == 'HEAD' or response.status_code not in (200, 201):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers or 'Content-Range' in response.headers:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.mimetype.startswith(COMPRESSIBLE)
+
+
+def _read_ahead(chunks, size):
+    """
+    Buffer chunks until `size` bytes. Returns (None, buffered chunks) if the
+    iterator ended before, else (iterator over every chunk, None).
+    """
+    buffered, total = [], 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        total += len(chunk)
+        if total >= size:
+            return itertools.chain(buffered, chunks), None
+    return None, buffered
+
+
+def _compress_response(response):
+    if not _compressible(response):
+        return response
+    config = current_app.config
+    if response.is_streamed:
+        # The wrappers below do not forward close() to the view's generator
+        if hasattr(response.response, 'close'):
+            response.call_on_close(response.response.close)
+        # Read ahead up to the threshold: a short stream is sent as one plain body
+        stream, body = _read_ahead(response.iter_encoded(), config['COMPRESSION_MIN_SIZE'])
+        if stream is None:
+            response.set_data(b''.join(body))
+        else:
+            response.response = stream
+    if not response.is_streamed and response.calculate_content_length() < config['COMPRESSION_MIN_SIZE']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings, config['COMPRESSION_ENCODINGS'])
+    if encoding is None:
+        return response
+    codec, level = CODECS[encoding], LEVELS[encoding]
+
+    if response.is_streamed:
+        response.response = codec.stream(response.iter_encoded(), level)
+        response.headers.pop('Content-Length', None)
+    else:
+        etag, weak = response.get_etag()
+        cache = current_app.extensions['compression_cache']
+        key = (etag, encoding) if etag else None
+        body = cache.get(key) if key else None
+        if body is None:
+            body = codec.compress(response.get_data(), level)
+            if key:
+                cache.put(key, body)
+        response.set_data(body)
+        if etag:
+            response.set_etag(etag, weak=True)
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    """Configure response compression and install the hook."""
+    app.config.setdefault('COMPRESSION_MIN_SIZE', int(os.getenv('COMPRESSION_MIN_SIZE', 1024)))
+    app.config.setdefault('COMPRESSION_CACHE_SIZE', int(os.getenv('COMPRESSION_CACHE_SIZE', 256)))
+    encodings = os.getenv('COMPRESSION_ENCODINGS')
+    app.config.setdefault('COMPRESSION_ENCODINGS', [name for name in encodings.split(',') if name in CODECS]
+                          if encodings is not None else list(CODECS))
+
+    app.extensions['compression_cache'] = ResponseCache(app.config['COMPRESSION_CACHE_SIZE'])
+    if app.config['COMPRESSION_ENCODINGS']:
+        app.after_request(_compress_response)
@@ -0,0 +1,257 @@
+"""
+Denormalized child counters.
+
+Projects keep the number of their documents, sessions, questions, tasks and
+completed tasks, and the total study minutes of their sessions; sessions keep
+the number of their questions. Sessions moved to cold storage still count,
+through their summaries (see app.utils.cold_storage). The summary listing reads them from the
+project table alone, instead of loading every project's tree.
+
+The counters are updated in the same transaction as the rows they count: a
+before_flush hook turns the documents, sessions, questions and tasks being
+inserted, deleted or moved into increments (`SET n = n + :delta`, so
+concurrent writers never lose an update). Writes that bypass the ORM (bulk
+updates, set-based deletes, archive imports) adjust the counters themselves
+with `adjust_counters` or `recount`. `flask recount` recomputes every counter
+from the child tables, `--check` only reports the ones that drifted.
+"""
+from collections import Counter, defaultdict
+
+import click
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+
+from app import db
+
+PROJECT_COUNTERS = ('document_count', 'session_count', 'question_count', 'task_count', 'completed_task_count',
+                    'study_minutes')
+SESSION_COUNTERS = ('question_count',)
+
+
+# -----------------------------------------------
+# ORM WRITES (before_flush)
+# -----------------------------------------------
+def _tracked(obj):
+    """(parent kind, foreign key, relationship, attributes that affect the counters) of a counted row."""
+    from app.models.models import Document, LearningSession, Question, Task
+
+    if isinstance(obj, Document):
+        return 'project', 'project_id', 'project', ('project_id',)
+    if isinstance(obj, LearningSession):
+        return 'project', 'project_id', 'project', ('project_id', 'duration_minutes')
+    if isinstance(obj, Task):
+        return 'project', 'project_id', 'project', ('project_id', 'completed')
+    if isinstance(obj, Question):
+        return 'session', 'session_id', 'session', ('session_id',)
+    return None
+
+
+def _increments(obj, value):
+    """Counter increments contributed by a row, given a getter of its attribute values."""
+    from app.models.models import LearningSession, Task, Document
+
+    if isinstance(obj, Document):
+        return {'document_count': 1}
+    if isinstance(obj, LearningSession):
+        return {'session_count': 1, 'study_minutes': value('duration_minutes') or 0}
+    if isinstance(obj, Task):
+        return {'task_count': 1, 'completed_task_count': 1 if value('completed') else 0}
+    return {'question_count': 1}
+
+
+def _old_value(obj, name):
+    history = get_history(obj, name)
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    if history.added and inspect(obj).persistent:
+        # Set while expired: the previous value was never loaded
+        model = type(obj)
+        return object_session(obj).execute(select(getattr(model, name)).where(model.id == obj.id)).scalar()
+    return getattr(obj, name)
+
+
+def _parent(session, obj, foreign_key, relationship, value):
+    """Id of the parent row, or the parent object itself while it is pending (no id yet)."""
+    parent_id = value(foreign_key)
+    if parent_id is not None:
+        return parent_id
+    parent = getattr(obj, relationship, None)
+    if parent is None:
+        return None
+    return parent if parent in session.new else parent.id
+
+
+def _count_changes(session, flush_context, instances):
+    from app.models.models import LearningSession, Project
+
+    deltas = {'project': defaultdict(Counter), 'session': defaultdict(Counter)}
+
+    def add(obj, value, sign):
+        kind, foreign_key, relationship, _ = _tracked(obj)
+        parent = _parent(session, obj, foreign_key, relationship, value)
+        if parent is not None:
+            for column, n in _increments(obj, value).items():
+                deltas[kind][parent][column] += sign * n
+
+    with session.no_autoflush:
+        for obj in session.new:
+            if _tracked(obj):
+                add(obj, lambda name, obj=obj: getattr(obj, name), 1)
+        for obj in session.deleted:
+            if _tracked(obj):
+                add(obj, lambda name, obj=obj: _old_value(obj, name), -1)
+        for obj in session.dirty:
+            tracked = _tracked(obj)
+            if tracked and any(get_history(obj, name).has_changes() for name in tracked[3]):
+                add(obj, lambda name, obj=obj: _old_value(obj, name), -1)
+                add(obj, lambda name, obj=obj: getattr(obj, name), 1)
+
+        # Questions count for the project of their session too
+        session_ids = [parent for parent in deltas['session'] if not isinstance(parent, LearningSession)]
+        projects = dict(session.execute(select(LearningSession.id, LearningSession.project_id)
+                                        .where(LearningSession.id.in_(session_ids))).all()) if session_ids else {}
+        for parent, counter in deltas['session'].items():
+            if isinstance(parent, LearningSession):
+                project = _parent(session, parent, 'project_id', 'project',
+                                  lambda name, parent=parent: getattr(parent, name))
+            else:
+                project = projects.get(parent)
+            if project is not None:
+                deltas['project'][project]['question_count'] += counter['question_count']
+
+    for kind, model in (('project', Project), ('session', LearningSession)):
+        for parent, counter in deltas[kind].items():
+            counter = {column: n for column, n in counter.items() if n}
+            if not counter:
+                continue
+            if isinstance(parent, model):
+                # Pending row: the INSERT carries the counters
+                for column, n in counter.items():
+                    setattr(parent, column, (getattr(parent, column) or 0) + n)
+            else:
+                _increment(session, model, parent, counter)
+
+
+def _increment(session, model, row_id, counter):
+    table = model.__table__
+    session.connection().execute(
+        table.update().where(table.c.id == row_id)
+        .values({column: table.c[column] + n for column, n in counter.items()})
+    )
+    obj = session.identity_map.get(session.identity_key(model, row_id))
+    if obj is not None:
+        session.expire(obj, list(counter))
+
+
+# -----------------------------------------------
+# CORE WRITES
+# -----------------------------------------------
+def adjust_counters(project_id=None, session_id=None, **deltas):
+    """
+    Apply counter increments after a write that bypassed the ORM, in the
+    current transaction. Keyword arguments are counter names, e.g.
+    adjust_counters(project_id, completed_task_count=3).
+    """
+    from app.models.models import LearningSession, Project
+
+    if project_id is not None:
+        counter = {column: deltas[column] for column in PROJECT_COUNTERS if deltas.get(column)}
+        if counter:
+            _increment(db.session, Project, project_id, counter)
+    if session_id is not None:
+        counter = {column: deltas[column] for column in SESSION_COUNTERS if deltas.get(column)}
+        if counter:
+            _increment(db.session, LearningSession, session_id, counter)
+
+
+def _actual_counts():
+    """Correlated subqueries computing each counter from the child tables."""
+    from app.models.models import ArchivedSession, Document, LearningSession, Question, Task, Project
+
+    def count(*where):
+        return select(func.count()).where(*where).scalar_subquery()
+
+    def archived(column):
+        return (select(func.coalesce(func.sum(column), 0))
+                .where(ArchivedSession.project_id == Project.id).scalar_subquery())
+
+    project = {
+        'document_count': count(Document.project_id == Project.id),
+        'session_count': (count(LearningSession.project_id == Project.id)
+                          + count(ArchivedSession.project_id == Project.id)),
+        'question_count': (select(func.count()).select_from(Question)
+                           .join(LearningSession, Question.session_id == LearningSession.id)
+                           .where(LearningSession.project_id == Project.id).scalar_subquery()
+                           + archived(ArchivedSession.question_count)),
+        'task_count': count(Task.project_id == Project.id),
+        'completed_task_count': count(Task.project_id == Project.id, Task.completed.is_(True)),
+        'study_minutes': (select(func.coalesce(func.sum(LearningSession.duration_minutes), 0))
+                          .where(LearningSession.project_id == Project.id).scalar_subquery()
+                          + archived(ArchivedSession.duration_minutes)),
+    }
+    session = {'question_count': count(Question.session_id == LearningSession.id)}
+    return project, session
+
+
+def recount(project_id=None):
+    """
+    Recompute the counters of one project (and its sessions) or of all of
+    them, with one set-based UPDATE per table, in the current transaction.
+    """
+    from app.models.models import LearningSession, Project
+
+    project_counts, session_counts = _actual_counts()
+    sessions = LearningSession.__table__.update().values(session_counts)
+    projects = Project.__table__.update().values(project_counts)
+    if project_id is not None:
+        sessions = sessions.where(LearningSession.project_id == project_id)
+        projects = projects.where(Project.id == project_id)
+    db.session.execute(sessions)
+    db.session.execute(projects)
+
+
+def counter_drift(project_id=None):
+    """
+    Counters that differ from the child tables.
+
+    Returns:
+        list: (table, row id, counter, stored value, actual value) tuples
+    """
+    from app.models.models import LearningSession, Project
+
+    project_counts, session_counts = _actual_counts()
+    drift = []
+    for table, model, counts in (('project', Project, project_counts),
+                                 ('learning_session', LearningSession, session_counts)):
+        query = select(model.id, *[getattr(model, column) for column in counts],
+                       *[expression.label(f'actual_{column}') for column, expression in counts.items()])
+        if project_id is not None:
+            query = query.where((Project.id if model is Project else LearningSession.project_id) == project_id)
+        for row in db.session.execute(query):
+            for column in counts:
+                stored, actual = getattr(row, column), getattr(row, f'actual_{column}')
+                if stored != actual:
+                    drift.append((table, row.id, column, stored, actual))
+    return drift
+
+
+def init_counters(app):
+    """Install the counter hook and register the `flask recount` command."""
+    if not event.contains(db.session, 'before_flush', _count_changes):
+        event.listen(db.session, 'before_flush', _count_changes)
+
+    @app.cli.command('recount')
+    @click.option('--project', 'project_id', default=None, help='Only this project (default: all).')
+    @click.option('--check', is_flag=True, help='Only report the counters that drifted.')
+    def recount_command(project_id, check):
+        """Recompute the project and session counters from the child tables."""
+        drift = counter_drift(project_id)
+        for table, row_id, column, stored, actual in drift:
+            click.echo(f'{table} {row_id}: {column} is {stored}, should be {actual}')
+        if not check:
+            recount(project_id)
+            db.session.commit()
+        click.echo(f"{len(drift)} counters {'drifted' if check else 'repaired'}")
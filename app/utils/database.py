@@ -0,0 +1,33 @@
+"""
+Engine settings per database backend.
+
+SQLite needs none. For a server database (PostgreSQL) the connection pool is
+sized for the threads of a worker process and connections are checked before
+use (pre-ping), so a database restart or an idle timeout on the network does
+not surface as errors on the first requests:
+
+    DB_POOL_SIZE       connections kept open per process (default 10)
+    DB_MAX_OVERFLOW    extra connections under bursts (default 20)
+    DB_POOL_TIMEOUT    seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE    seconds after which a connection is replaced (default 1800)
+
+With the production server every worker process has its own pool: keep
+workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the server's max_connections.
+"""
+import os
+
+from sqlalchemy.engine import make_url
+
+
+def engine_options(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS suited to the backend of `database_uri`."""
+    if not database_uri or make_url(database_uri).get_backend_name() == 'sqlite':
+        return {}
+
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
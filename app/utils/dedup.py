@@ -0,0 +1,211 @@
+"""
+Near-duplicate detection of questions with MinHash and LSH.
+
+Each question is reduced to a set of word shingles and to a MinHash signature
+of NUM_PERM values. The signature is cut into BANDS bands of ROWS values; every
+band is hashed into a bucket stored in the question_lsh_band table. Two
+questions of the same project that share a bucket are candidates, and only the
+candidates are compared (exact Jaccard similarity of their shingles), so a
+lookup costs a handful of indexed reads whatever the size of the project.
+
+With 16 bands of 4 rows, pairs with a similarity around 0.5 or more are very
+likely to share a bucket; DEDUP_THRESHOLD (default 0.6) decides what counts as
+a duplicate.
+"""
+import hashlib
+import os
+import random
+import re
+import unicodedata
+
+import click
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app import db
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(NUM_PERM)]
+
+
+# -----------------------------------------------
+# SIGNATURES
+# -----------------------------------------------
+def shingles(text):
+    """Word bigrams of the normalized text (the single word for one-word texts)."""
+    words = re.sub(r'\W+', ' ', unicodedata.normalize('NFKC', text or '').lower()).split()
+    if len(words) < 2:
+        return set(words)
+    return {f'{a} {b}' for a, b in zip(words, words[1:])}
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def minhash(shingle_set):
+    """MinHash signature (NUM_PERM values) of a shingle set."""
+    hashes = [_hash64(s) for s in shingle_set]
+    if not hashes:
+        return [_MERSENNE_PRIME] * NUM_PERM
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_buckets(signature):
+    """(band, bucket) pairs of a signature. Buckets are signed 64-bit ints."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(','.join(map(str, rows)).encode(), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return buckets
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+# -----------------------------------------------
+# INDEX
+# -----------------------------------------------
+def index_question(question, project_id):
+    """Attach the LSH band buckets of a (new) question."""
+    from app.models.models import QuestionBand
+
+    question.lsh_bands = [QuestionBand(project_id=project_id, band=band, bucket=bucket)
+                          for band, bucket in band_buckets(minhash(shingles(question.question)))]
+
+
+def find_duplicate(project_id, text, threshold=None, exclude_id=None):
+    """
+    Look for a near-duplicate of `text` among the questions of a project.
+
+    Returns:
+        tuple: (Question, similarity) of the most similar duplicate, or (None, 0)
+    """
+    from app.models.models import Question, QuestionBand
+
+    threshold = current_app.config['DEDUP_THRESHOLD'] if threshold is None else threshold
+    text_shingles = shingles(text)
+    buckets = band_buckets(minhash(text_shingles))
+
+    candidate_ids = {row.question_id for row in db.session.query(QuestionBand.question_id).filter(
+        QuestionBand.project_id == project_id,
+        or_(*[and_(QuestionBand.band == band, QuestionBand.bucket == bucket) for band, bucket in buckets])
+    ).distinct()}
+    candidate_ids.discard(exclude_id)
+
+    best, best_score = None, 0.0
+    if candidate_ids:
+        for candidate in Question.query.filter(Question.id.in_(candidate_ids)):
+            score = jaccard(text_shingles, shingles(candidate.question))
+            if score >= threshold and score > best_score:
+                best, best_score = candidate, score
+    return best, best_score
+
+
+# -----------------------------------------------
+# BULK DEDUPE
+# -----------------------------------------------
+def merge_questions(kept, duplicate):
+    """
+    Fold a duplicate into the question that is kept: document links and
+    references are moved over, the grade is kept if the survivor has none.
+    The duplicate is deleted.
+    """
+    for document in duplicate.resource_documents:
+        if document not in kept.resource_documents:
+            kept.resource_documents.append(document)
+    for reference in list(duplicate.references):
+        reference.question = kept
+    if kept.evaluation is None and duplicate.evaluation is not None:
+        kept.evaluation = duplicate.evaluation
+        kept.correction = duplicate.correction
+    db.session.delete(duplicate)
+
+
+def dedupe_project(project_id, threshold=None, dry_run=False, index_only=False):
+    """
+    Rebuild the LSH index of a project and merge its near-duplicate questions.
+    Older sessions win: a question is merged into the first similar question
+    found in an earlier (or the same) session.
+
+    Returns:
+        list: (kept question id, merged question id, similarity) tuples
+    """
+    from app.models.models import Question, QuestionBand, LearningSession
+
+    threshold = current_app.config['DEDUP_THRESHOLD'] if threshold is None else threshold
+    if not 0 < threshold <= 1:
+        raise ValueError(f'The similarity threshold must be in (0, 1], got {threshold}')
+    buckets_index = {}
+    kept_shingles = {}
+    merges = []
+
+    questions = (Question.query.join(LearningSession)
+                 .filter(LearningSession.project_id == project_id)
+                 .order_by(LearningSession.timestamp, Question.id)
+                 .all())
+
+    if not dry_run:
+        QuestionBand.query.filter_by(project_id=project_id).delete(synchronize_session=False)
+
+    by_id = {q.id: q for q in questions}
+    for question in questions:
+        question_shingles = shingles(question.question)
+        buckets = band_buckets(minhash(question_shingles))
+
+        duplicate_of, best = None, 0.0
+        if not index_only:
+            candidates = {qid for key in buckets for qid in buckets_index.get(key, ())}
+            for candidate_id in candidates:
+                score = jaccard(question_shingles, kept_shingles[candidate_id])
+                if score >= threshold and score > best:
+                    duplicate_of, best = candidate_id, score
+
+        if duplicate_of:
+            merges.append((duplicate_of, question.id, best))
+            if not dry_run:
+                merge_questions(by_id[duplicate_of], question)
+            continue
+
+        kept_shingles[question.id] = question_shingles
+        for key in buckets:
+            buckets_index.setdefault(key, []).append(question.id)
+        if not dry_run:
+            db.session.add_all(QuestionBand(question_id=question.id, project_id=project_id, band=band,
+                                            bucket=bucket) for band, bucket in buckets)
+
+    if not dry_run:
+        db.session.commit()
+    return merges
+
+
+def init_dedup(app):
+    """Configure the similarity threshold and register the `flask dedupe` command."""
+    app.config.setdefault('DEDUP_THRESHOLD', float(os.getenv('DEDUP_THRESHOLD', 0.6)))
+    if not 0 < app.config['DEDUP_THRESHOLD'] <= 1:
+        raise ValueError(f"DEDUP_THRESHOLD must be in (0, 1], got {app.config['DEDUP_THRESHOLD']}")
+
+    @app.cli.command('dedupe')
+    @click.option('--project', 'project_id', default=None, help='Only this project (default: all).')
+    @click.option('--threshold', type=click.FloatRange(0, 1, min_open=True), default=None,
+                  help='Jaccard similarity threshold.')
+    @click.option('--dry-run', is_flag=True, help='Only report the duplicates.')
+    @click.option('--index-only', is_flag=True, help='Rebuild the LSH index without merging.')
+    def dedupe_command(project_id, threshold, dry_run, index_only):
+        """Rebuild the near-duplicate index and merge duplicate questions."""
+        from app.models.models import Project
+
+        project_ids = [project_id] if project_id else [row.id for row in db.session.query(Project.id)]
+        for pid in project_ids:
+            merges = dedupe_project(pid, threshold, dry_run, index_only)
+            click.echo(f"{pid}: {len(merges)} duplicates {'found' if dry_run else 'merged'}")
@@ -0,0 +1,277 @@
+"""
+Deletion of projects and learning sessions.
+
+The ORM cascades (`cascade='all, delete-orphan'`) would load every document,
+chunk, session and question of a project into the session to delete them one
+row at a time. Here the rows are removed with set-based DELETE statements,
+children first, a chunk of DELETE_CHUNK_SIZE parent rows (sessions, documents,
+tasks, milestones) per transaction: memory stays bounded and no transaction
+holds its locks for long. The parent row itself goes last, in a transaction
+that locks it and removes whatever was added in the meantime. A deletion that
+is interrupted leaves a smaller project behind; deleting it again finishes
+the job.
+
+Files are not touched inside the transactions. Once a project is gone its
+upload directory is removed by a background sweeper; `flask sweep-uploads`
+also removes every file no document refers to any more (e.g. a file written
+by an upload that was still running when its project was deleted).
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.utils.changes import record_changes
+
+UPLOAD_ROOT = 'uploads'
+
+_sweeper = None
+
+
+def _tables():
+    return db.metadata.tables
+
+
+def _delete(counts, table_name, where):
+    table = _tables()[table_name]
+    deleted = db.session.execute(table.delete().where(where)).rowcount
+    if deleted:
+        counts[table_name] = counts.get(table_name, 0) + deleted
+
+
+def _in_chunks(query, delete_rows, counts, chunk_size, commit=True):
+    """
+    Run `delete_rows(ids, counts)` on the ids returned by `query`, chunk_size
+    at a time, until none are left.
+    """
+    while True:
+        ids = [row[0] for row in db.session.execute(query.limit(chunk_size))]
+        if not ids:
+            return
+        delete_rows(ids, counts)
+        if commit:
+            db.session.commit()
+
+
+# -----------------------------------------------
+# SET-BASED DELETES, CHILDREN FIRST
+# -----------------------------------------------
+def _delete_sessions(session_ids, counts):
+    t = _tables()
+    questions = select(t['question'].c.id).where(t['question'].c.session_id.in_(session_ids))
+    for name in ('review_state', 'question_lsh_band', 'question_resource', 'document_reference'):
+        _delete(counts, name, t[name].c.question_id.in_(questions))
+    _delete(counts, 'question', t['question'].c.session_id.in_(session_ids))
+    for name in ('learning_session_resource', 'learning_session_test'):
+        _delete(counts, name, t[name].c.session_id.in_(session_ids))
+    _delete(counts, 'learning_session', t['learning_session'].c.id.in_(session_ids))
+
+
+def _delete_documents(document_ids, counts):
+    t = _tables()
+    for name in ('document_chunk', 'document_reference', 'question_resource',
+                 'learning_session_resource', 'learning_session_test'):
+        _delete(counts, name, t[name].c.document_id.in_(document_ids))
+    db.session.execute(t['question'].update().where(t['question'].c.test_document_id.in_(document_ids))
+                       .values(test_document_id=None))
+    _delete(counts, 'document', t['document'].c.id.in_(document_ids))
+
+
+def _delete_tasks(task_ids, counts):
+    _delete(counts, 'task', _tables()['task'].c.id.in_(task_ids))
+
+
+def _delete_milestones(milestone_ids, counts):
+    t = _tables()
+    db.session.execute(t['task'].update().where(t['task'].c.milestone_id.in_(milestone_ids))
+                       .values(milestone_id=None))
+    _delete(counts, 'milestone', t['milestone'].c.id.in_(milestone_ids))
+
+
+def _delete_archived_sessions(session_ids, counts):
+    _delete(counts, 'archived_session', _tables()['archived_session'].c.id.in_(session_ids))
+
+
+def _delete_project_children(project_id, counts, chunk_size, commit=True):
+    t = _tables()
+    for table_name, delete_rows in (('learning_session', _delete_sessions),
+                                    ('archived_session', _delete_archived_sessions),
+                                    ('document', _delete_documents), ('task', _delete_tasks),
+                                    ('milestone', _delete_milestones)):
+        table = t[table_name]
+        query = select(table.c.id).where(table.c.project_id == project_id)
+        _in_chunks(query, delete_rows, counts, chunk_size, commit)
+
+
+# -----------------------------------------------
+# PUBLIC API
+# -----------------------------------------------
+def delete_project(project_id, chunk_size=None):
+    """
+    Delete a project and everything that belongs to it.
+
+    Args:
+        project_id (str): The project
+        chunk_size (int, optional): Parent rows deleted per transaction (default DELETE_CHUNK_SIZE)
+
+    Returns:
+        dict: table name -> number of deleted rows, None if the project does not exist
+    """
+    from app.models.models import Project
+
+    chunk_size = chunk_size or current_app.config['DELETE_CHUNK_SIZE']
+    if db.session.query(Project.id).filter_by(id=project_id).scalar() is None:
+        return None
+
+    counts = {}
+    _delete_project_children(project_id, counts, chunk_size)
+
+    # Last transaction: lock the project so that nothing new is attached to it,
+    # clear what was added while the chunks were running, then drop the row
+    if db.session.query(Project.id).filter_by(id=project_id).with_for_update().scalar() is None:
+        db.session.rollback()
+        return counts
+    _delete_project_children(project_id, counts, chunk_size, commit=False)
+    _delete(counts, 'text_dictionary', _tables()['text_dictionary'].c.project_id == project_id)
+    _delete(counts, 'project', _tables()['project'].c.id == project_id)
+    record_changes('project', [project_id], project_id, deleted=True)
+    db.session.commit()
+    return counts
+
+
+def delete_session(session_id):
+    """
+    Delete a learning session with its questions, in one transaction (a
+    session holds far fewer rows than a project).
+
+    Returns:
+        dict: table name -> number of deleted rows
+    """
+    from app.models.models import LearningSession, Question
+    from app.utils.caching import bump_project_version
+    from app.utils.counters import adjust_counters
+
+    session = db.session.query(LearningSession.project_id, LearningSession.duration_minutes).filter_by(
+        id=session_id).first()
+    question_ids = [question_id for question_id, in db.session.query(Question.id).filter_by(session_id=session_id)]
+    counts = {}
+    _delete_sessions([session_id], counts)
+    if session is not None:
+        record_changes('question', question_ids, session.project_id, deleted=True)
+        record_changes('session', [session_id], session.project_id, deleted=True)
+        adjust_counters(session.project_id, session_count=-counts.get('learning_session', 0),
+                        question_count=-counts.get('question', 0),
+                        study_minutes=-(session.duration_minutes or 0) * counts.get('learning_session', 0))
+        bump_project_version(session.project_id)
+    db.session.commit()
+    return counts
+
+
+# -----------------------------------------------
+# ORPHAN FILES
+# -----------------------------------------------
+def sweep_uploads(upload_root=UPLOAD_ROOT, project_ids=None, min_age=0):
+    """
+    Remove the upload files no document refers to any more: the directories
+    of deleted projects, files left by other uploads and stale extracted text
+    sidecars. Files younger than `min_age` seconds are kept, they may belong
+    to an upload that is not committed yet.
+
+    Args:
+        upload_root (str): Directory holding one subdirectory per project
+        project_ids (list, optional): Only look at these project directories
+        min_age (float): Minimum age (seconds) of a file before it is removed
+
+    Returns:
+        int: number of files removed
+    """
+    from app.models.models import Document, Project
+
+    if not os.path.isdir(upload_root):
+        return 0
+    cutoff = time.time() - min_age
+    names = project_ids if project_ids is not None else sorted(os.listdir(upload_root))
+
+    removed = 0
+    for name in names:
+        directory = os.path.join(upload_root, name)
+        if not os.path.isdir(directory):
+            continue
+        try:
+            exists = db.session.query(Project.id).filter_by(id=name).scalar() is not None
+        except Exception:
+            db.session.rollback()
+            continue
+
+        documents = [] if not exists else db.session.query(Document.id, Document.file_path).filter_by(
+            project_id=name).all()
+        db.session.rollback()
+        referenced = {os.path.normpath(file_path) for _, file_path in documents if file_path}
+        document_ids = {document_id for document_id, _ in documents}
+
+        for dirpath, _, filenames in os.walk(directory):
+            in_text_dir = os.path.basename(dirpath) == '.text'
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                # Text sidecars are <document_id>.txt and its compressed copies (.txt.gz, ...)
+                if ((filename.partition('.')[0] in document_ids) if in_text_dir
+                        else (os.path.normpath(path) in referenced)):
+                    continue
+                try:
+                    if os.path.getmtime(path) <= cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+
+        if not exists:
+            # Drop the emptied directories (a file too young to go keeps its own)
+            for dirpath, _, _ in sorted(os.walk(directory), key=lambda entry: len(entry[0]), reverse=True):
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
+    return removed
+
+
+def _run_sweep(app, project_ids):
+    with app.app_context():
+        try:
+            sweep_uploads(project_ids=project_ids)
+        finally:
+            db.session.remove()
+
+
+def schedule_sweep(app, project_ids):
+    """Remove the files of deleted projects in the background."""
+    global _sweeper
+
+    if _sweeper is None:
+        _sweeper = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-sweeper')
+    _sweeper.submit(_run_sweep, app, list(project_ids))
+
+
+def shutdown_sweeper(wait=True):
+    """Stop the background sweeper, by default after the scheduled sweeps are done."""
+    global _sweeper
+
+    if _sweeper is not None:
+        _sweeper.shutdown(wait=wait)
+        _sweeper = None
+
+
+def init_deletion(app):
+    """Configure the chunk size and register the `flask sweep-uploads` command."""
+    app.config.setdefault('DELETE_CHUNK_SIZE', int(os.getenv('DELETE_CHUNK_SIZE', 500)))
+
+    @app.cli.command('sweep-uploads')
+    @click.option('--min-age', type=float, default=3600, show_default=True,
+                  help='Only remove files older than MIN_AGE seconds.')
+    def sweep_uploads_command(min_age):
+        """Remove the upload files that no document refers to."""
+        removed = sweep_uploads(min_age=min_age)
+        click.echo(f'Removed {removed} orphan files')
@@ -1,52 +1,292 @@
+"""
+File handling: text extraction, uploads and extracted text sidecars.
+
+Text extractors are registered per file extension. The parsing libraries
+(pypdf, pdfplumber, python-docx, odfpy) are imported by each extractor on
+first use, so importing this module (every worker, every `flask` command)
+stays cheap.
+
+Extraction is page by page: `iter_pages` yields the pages of a document
+lazily, and callers that need only part of the text pass a character or token
+budget to `extract_text_from_file`, which stops reading the file as soon as
+the budget is met. PDF pages are released as soon as their text is read; the
+PDF backend is chosen once with `set_pdf_backend` (the PDF_BACKEND setting:
+pypdf, the default, or pdfplumber for layout-aware extraction).
+"""
+import hashlib
+import mmap
 import os
-from pypdf import PdfReader
-import docx
-# Correct imports for odfpy
-from odf.opendocument import load
-from odf.text import P
-from odf.teletype import extractText
+from app.utils.profiling import timed
+
+# Rough characters-per-token ratio, to turn a token budget into characters
+CHARS_PER_TOKEN = 4
+
+# File extension -> function(file_path) yielding (page number, text)
+EXTRACTORS = {}
+# PDF backend name -> function(file_path) yielding (page number, text)
+PDF_BACKENDS = {}
+# Name of the PDF backend in use (see set_pdf_backend)
+_pdf_backend = 'pypdf'
+
+
+def extractor(*extensions, paged=False):
+    """
+    Register a text extractor for one or more file extensions (e.g. '.pdf').
+    A paged extractor yields (page number, text); any other returns the whole
+    text, which is treated as a single page.
+    """
+    def decorator(func):
+        if paged:
+            pages = func
+        else:
+            def pages(file_path):
+                yield 1, func(file_path)
+        for extension in extensions:
+            EXTRACTORS[extension.lower()] = pages
+        return func
+    return decorator
+
+
+def pdf_backend(name):
+    """Register a PDF backend (selected with set_pdf_backend)."""
+    def decorator(func):
+        PDF_BACKENDS[name] = func
+        return func
+    return decorator
+
+
+def set_pdf_backend(name):
+    """Select the backend used to read PDF files (see PDF_BACKENDS)."""
+    global _pdf_backend
+
+    if name not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF_BACKEND {name!r} (expected one of: {', '.join(PDF_BACKENDS)})")
+    _pdf_backend = name
+
+
+@extractor('.txt')
+def _extract_txt(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+@extractor('.pdf', paged=True)
+def _extract_pdf(file_path):
+    yield from PDF_BACKENDS[_pdf_backend](file_path)
+
+
+@pdf_backend('pypdf')
+def _pdf_pages_pypdf(file_path):
+    from pypdf import PdfReader
+
+    pdf = PdfReader(file_path)
+    for number in range(len(pdf.pages)):
+        text = pdf.pages[number].extract_text()
+        # Drop the objects parsed for this page (content streams, fonts...),
+        # the reader would otherwise keep every page of the file in memory
+        pdf.resolved_objects.clear()
+        yield number + 1, text
 
 
-def extract_text_from_file(file_path):
+@pdf_backend('pdfplumber')
+def _pdf_pages_pdfplumber(file_path):
+    import pdfplumber
+
+    with pdfplumber.open(file_path) as pdf:
+        for number, page in enumerate(pdf.pages, 1):
+            text = page.extract_text() or ''
+            page.flush_cache()
+            yield number, text
+
+
+@extractor('.docx')
+def _extract_docx(file_path):
+    import docx
+
+    doc = docx.Document(file_path)
+    return "\n".join([paragraph.text for paragraph in doc.paragraphs])
+
+
+@extractor('.odt')
+def _extract_odt(file_path):
+    # OpenDocument Text, using odfpy directly
+    from odf.opendocument import load
+    from odf.text import P
+    from odf.teletype import extractText
+
+    textdoc = load(file_path)
+    paragraphs = textdoc.getElementsByType(P)
+    return "\n".join([extractText(paragraph) for paragraph in paragraphs])
+
+
+def iter_pages(file_path):
     """
-    Extract text content from various file formats
+    Yield the pages of a document lazily
 
     Args:
         file_path (str): Path to the file
 
+    Yields:
+        tuple: (page number starting at 1, text of the page)
+
+    Raises:
+        ValueError: if the file format is not supported
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    pages = EXTRACTORS.get(file_extension)
+    if pages is None:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+    yield from pages(file_path)
+
+
+@timed('extract')
+def read_text(file_path, max_chars=None, max_tokens=None):
+    """
+    Extract the text of a document, up to a budget
+
+    Args:
+        file_path (str): Path to the file
+        max_chars (int, optional): Stop once this many characters are read
+        max_tokens (int, optional): Stop once about this many tokens are read
+
     Returns:
-        str: Extracted text content
+        str: Extracted text content (at most the budget, if one is given)
+
+    Raises:
+        ValueError: if the file format is not supported or the file cannot be parsed
     """
+    budget = min(filter(None, [max_chars, max_tokens and max_tokens * CHARS_PER_TOKEN]), default=None)
+
     file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension not in EXTRACTORS:
+        raise ValueError(f"Unsupported file format: {file_extension}")
 
+    pages = iter_pages(file_path)
+    parts = []
+    length = 0
     try:
-        # Text files
-        if file_extension == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-
-        # PDF files
-        elif file_extension == '.pdf':
-            text = ""
-            pdf = PdfReader(file_path)
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
-            return text
-
-        # Word documents
-        elif file_extension == '.docx':
-            doc = docx.Document(file_path)
-            return "\n".join([paragraph.text for paragraph in doc.paragraphs])
-
-        # ODT files (OpenDocument Text)
-        elif file_extension == '.odt':
-            # Using odfpy directly with correct imports
-            textdoc = load(file_path)
-            paragraphs = textdoc.getElementsByType(P)
-            return "\n".join([extractText(paragraph) for paragraph in paragraphs])
+        for _, text in pages:
+            parts.append(text)
+            length += len(text) + 1
+            if budget and length >= budget:
+                break
+    except Exception as e:
+        raise ValueError(f"Error extracting text from {file_path}: {str(e)}") from e
+    finally:
+        # Closes the file (and the parser) when stopping early
+        pages.close()
 
-        else:
-            return f"Unsupported file format: {file_extension}"
+    text = "\n".join(parts)
+    return text[:budget] if budget else text
 
-    except Exception as e:
-        return f"Error extracting text from {file_path}: {str(e)}"
\ No newline at end of file
+
+def extract_text_from_file(file_path, max_chars=None, max_tokens=None):
+    """
+    Extract text content from various file formats (see `read_text`)
+
+    Returns:
+        str: Extracted text content, or the error message if extraction failed
+             (use `read_text` to tell the two apart reliably)
+    """
+    try:
+        return read_text(file_path, max_chars=max_chars, max_tokens=max_tokens)
+    except ValueError as e:
+        return str(e)
+
+
+def save_upload(file_storage, file_path, chunk_size=1024 * 1024):
+    """
+    Save an uploaded file to disk, computing its size and SHA-256 on the way
+
+    Args:
+        file_storage (FileStorage): The uploaded file
+        file_path (str): Destination path
+        chunk_size (int): Bytes read at a time
+
+    Returns:
+        tuple: (size in bytes, hex SHA-256 digest)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'wb') as out:
+        while True:
+            chunk = file_storage.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            out.write(chunk)
+    return size, digest.hexdigest()
+
+
+def count_pages(file_path):
+    """
+    Number of pages of a PDF document, None for formats without pages
+    """
+    if os.path.splitext(file_path)[1].lower() != '.pdf':
+        return None
+    try:
+        from pypdf import PdfReader
+
+        return len(PdfReader(file_path).pages)
+    except Exception:
+        return None
+
+
+def extracted_text_path(file_path, document_id):
+    """
+    Path of the plain text file holding the extracted text of a document
+    """
+    return os.path.join(os.path.dirname(file_path), '.text', f'{document_id}.txt')
+
+
+def write_text_file(text_path, text):
+    """
+    Store extracted text as UTF-8, so that it can be read back in ranges,
+    along with compressed copies for the text download
+    """
+    from app.utils.compression import precompress_file
+
+    os.makedirs(os.path.dirname(text_path), exist_ok=True)
+    tmp_path = text_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, text_path)
+    precompress_file(text_path)
+
+
+def read_text_range(text_path, offset, length):
+    """
+    Read a slice of a UTF-8 text file through mmap, without loading the whole file
+
+    Offsets are in bytes. The slice is widened/narrowed to character
+    boundaries, so a multi-byte character is never split, and holds at least
+    one character unless `offset` is at the end of the file.
+
+    Args:
+        text_path (str): Path of the text file
+        offset (int): Start byte
+        length (int): Maximum number of bytes to read
+
+    Returns:
+        tuple: (text, start byte, end byte, total bytes)
+    """
+    total = os.path.getsize(text_path)
+    if total == 0 or offset >= total:
+        return '', min(offset, total), min(offset, total), total
+
+    with open(text_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = offset
+        # Move the start forward past UTF-8 continuation bytes (10xxxxxx)
+        while start < total and mm[start] & 0xC0 == 0x80:
+            start += 1
+        end = min(start + length, total)
+        while start < end < total and mm[end] & 0xC0 == 0x80:
+            end -= 1
+        if end == start < total:
+            # `length` is shorter than the character at `start`: return that
+            # whole character, so that paging by the end offset always advances
+            end = start + 1
+            while end < total and mm[end] & 0xC0 == 0x80:
+                end += 1
+        return mm[start:end].decode('utf-8'), start, end, total
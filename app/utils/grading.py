@@ -0,0 +1,152 @@
+"""
+Batched grading of answers.
+
+Answers that are the reference answer up to case, punctuation and typos (same
+words in the same order, same numbers) are scored locally, without any model
+call. The others are packed into batches that fit a token budget and each
+batch is graded with a single model request; batches run concurrently.
+"""
+import difflib
+import contextvars
+import os
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+# Rough characters-per-token ratio used to estimate prompt sizes
+CHARS_PER_TOKEN = 4
+# Fixed cost of the grading prompt (instructions) and of each entry (labels, id)
+PROMPT_OVERHEAD_TOKENS = 200
+ENTRY_OVERHEAD_TOKENS = 20
+
+
+def _normalize(text):
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return re.sub(r'\W+', ' ', text).strip()
+
+
+def similarity(answer, reference):
+    """Character-level similarity (sequence ratio) of the normalized answers, from 0 to 1."""
+    a, b = _normalize(answer), _normalize(reference)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def _same_words(answer, reference, threshold):
+    """
+    Whether the answer has the reference's words in the same order, each one
+    at most misspelled: swapped, added or missing words and any different
+    number send the answer to the model.
+    """
+    words_a, words_b = _normalize(answer).split(), _normalize(reference).split()
+    if len(words_a) != len(words_b):
+        return False
+    for a, b in zip(words_a, words_b):
+        if a == b:
+            continue
+        if any(c.isdigit() for c in a + b):
+            return False
+        if difflib.SequenceMatcher(None, a, b, autojunk=False).ratio() < threshold:
+            return False
+    return True
+
+
+def pre_score(answer, reference, threshold):
+    """
+    Grade an answer locally when no model call is needed: empty answers, and
+    answers equal to the reference up to case, punctuation and typos.
+
+    Returns:
+        tuple: (evaluation, correction), or None if the answer has to go to the model
+    """
+    if not _normalize(answer):
+        return 0.0, 'No answer given.'
+    if not _same_words(answer, reference, threshold):
+        return None
+    score = similarity(answer, reference)
+    if score >= threshold:
+        return round(score * 100, 1), 'The answer matches the reference answer.'
+    return None
+
+
+def estimate_tokens(item):
+    chars = len(item['question']) + len(item['reference']) + len(item['answer'])
+    return chars // CHARS_PER_TOKEN + ENTRY_OVERHEAD_TOKENS
+
+
+def make_batches(items, token_budget, max_items):
+    """
+    Pack items into batches whose estimated prompt size stays within the token
+    budget (an item larger than the budget gets a batch of its own).
+    """
+    batches = []
+    current, used = [], PROMPT_OVERHEAD_TOKENS
+    for item in items:
+        tokens = estimate_tokens(item)
+        if current and (used + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], PROMPT_OVERHEAD_TOKENS
+        current.append(item)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def grade(items, config=None):
+    """
+    Grade a list of answers.
+
+    Args:
+        items (list): dicts with 'id', 'question', 'reference' and 'answer'
+        config (dict, optional): GRADING_* settings, defaults to the environment
+
+    Returns:
+        dict: {'grades': {id: (evaluation, correction)}, 'local': n graded locally,
+               'llm_calls': n model calls, 'failed': [ids the model did not grade]}
+    """
+    config = config or {}
+    threshold = float(config.get('GRADING_SHORTCUT_THRESHOLD', os.getenv('GRADING_SHORTCUT_THRESHOLD', 0.9)))
+    token_budget = int(config.get('GRADING_BATCH_TOKENS', os.getenv('GRADING_BATCH_TOKENS', 6000)))
+    max_items = int(config.get('GRADING_BATCH_SIZE', os.getenv('GRADING_BATCH_SIZE', 25)))
+    concurrency = int(config.get('GRADING_CONCURRENCY', os.getenv('GRADING_CONCURRENCY', 4)))
+
+    grades = {}
+    remaining = []
+    for item in items:
+        local = pre_score(item['answer'], item['reference'], threshold)
+        if local is not None:
+            grades[item['id']] = local
+        else:
+            remaining.append(item)
+    local_count = len(grades)
+
+    # Short batch-local ids keep the prompt small, they are mapped back afterwards
+    batches = []
+    for batch in make_batches(remaining, token_budget, max_items):
+        batches.append({str(i): item for i, item in enumerate(batch, 1)})
+
+    def run(batch):
+        from app.utils.ai_services import grade_answers
+
+        try:
+            return batch, grade_answers([dict(item, id=local_id) for local_id, item in batch.items()])
+        except Exception:
+            return batch, {}
+
+    failed = []
+    if batches:
+        # The calls are charged to the caller's project (app.utils.usage), a context variable
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as pool:
+            for batch, result in pool.map(lambda batch: context.copy().run(run, batch), batches):
+                for local_id, item in batch.items():
+                    if local_id in result:
+                        grades[item['id']] = result[local_id]
+                    else:
+                        failed.append(item['id'])
+
+    return {'grades': grades, 'local': local_count, 'llm_calls': len(batches), 'failed': failed}
@@ -0,0 +1,263 @@
+"""
+Document ingestion pipeline.
+
+An uploaded document starts as PENDING. The pipeline moves it to PROCESSING,
+then runs: extract text -> normalize -> count pages/characters -> chunk ->
+index (store the chunks with their offsets), and finally marks it READY, or
+FAILED with the error message. Question generation only ever reads the
+pre-processed text, no file is parsed inside a request.
+
+Documents are processed by a pool of background threads in the web process
+(INGESTION_MODE=thread, the default), inline at upload time (sync), or left
+PENDING for separate worker processes running `flask ingest` (off). Claiming
+a document is an atomic UPDATE, so several workers can run side by side. A
+document still PROCESSING INGESTION_CLAIM_TIMEOUT seconds after it was claimed
+(its worker crashed, was killed or recycled) can be claimed again.
+"""
+import os
+import random
+import re
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+
+from app import db
+from app.utils.file_processor import (count_pages, extracted_text_path, read_text,
+                                      set_pdf_backend, write_text_file)
+from app.utils.text_compression import compress_text, project_dictionary
+
+CHUNK_SIZE = 2000
+
+_executor = None
+
+
+# -----------------------------------------------
+# PIPELINE STEPS
+# -----------------------------------------------
+def normalize_text(text):
+    """
+    Clean up extracted text: Unicode NFKC, no control characters, words
+    hyphenated across lines joined back, runs of blanks collapsed.
+    """
+    text = unicodedata.normalize('NFKC', text)
+    text = ''.join(ch for ch in text if ch in '\n\t' or unicodedata.category(ch)[0] != 'C')
+    text = re.sub(r'(\w)-\n(\w)', r'\1\2', text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r' *\n *', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def chunk_text(text, size=CHUNK_SIZE):
+    """
+    Split text into passages of about `size` characters, cutting at paragraph
+    (or line, or word) boundaries when possible.
+
+    Returns:
+        list: (char offset, passage) tuples
+    """
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            for separator in ('\n\n', '\n', ' '):
+                cut = text.rfind(separator, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunks.append((start, text[start:end]))
+        start = end
+    return chunks
+
+
+def _claimable(retry_failed=False):
+    """WHERE clause of the documents waiting for ingestion, stale claims included."""
+    from app.models.models import Document, DocumentStatus
+
+    states = [DocumentStatus.PENDING] + ([DocumentStatus.FAILED] if retry_failed else [])
+    stale = datetime.utcnow() - timedelta(seconds=current_app.config['INGESTION_CLAIM_TIMEOUT'])
+    return db.or_(Document.status.in_(states),
+                  db.and_(Document.status == DocumentStatus.PROCESSING,
+                          db.or_(Document.claimed_at.is_(None), Document.claimed_at < stale)))
+
+
+def _claim(document_id, retry_failed=False):
+    """Atomically move a document to PROCESSING. Returns False if someone else has it."""
+    from app.models.models import Document, DocumentStatus
+
+    claimed = (Document.query
+               .filter(Document.id == document_id, _claimable(retry_failed))
+               .update({'status': DocumentStatus.PROCESSING, 'processing_error': None,
+                        'claimed_at': datetime.utcnow()},
+                       synchronize_session=False))
+    db.session.commit()
+    return claimed == 1
+
+
+def ingest_document(document_id, retry_failed=False):
+    """
+    Run the whole pipeline for a document. Must be called inside an app context.
+
+    Returns:
+        bool: True if the document ended up READY, False if it FAILED, None if
+              it was not waiting for ingestion (e.g. claimed by another worker)
+    """
+    from app.models.models import Document, DocumentChunk, DocumentStatus
+
+    if not _claim(document_id, retry_failed):
+        return None
+
+    document = Document.query.get(document_id)
+    try:
+        text = read_text(document.file_path, max_chars=current_app.config['INGESTION_MAX_CHARS'] or None)
+
+        text = normalize_text(text)
+
+        # Stored compressed with the project's dictionary, if it has one (see app.utils.text_compression)
+        dictionary = project_dictionary(document.project_id)
+        document.content = compress_text(text, dictionary)
+        document.char_count = len(text)
+        document.page_count = count_pages(document.file_path)
+
+        DocumentChunk.query.filter_by(document_id=document.id).delete()
+        db.session.bulk_insert_mappings(DocumentChunk, [
+            {'document_id': document.id, 'position': i, 'char_offset': offset,
+             'content': compress_text(passage, dictionary)}
+            for i, (offset, passage) in enumerate(chunk_text(text))
+        ])
+
+        write_text_file(extracted_text_path(document.file_path, document.id), text)
+
+        document.status = DocumentStatus.READY
+        document.processed_at = datetime.utcnow()
+        db.session.commit()
+        return True
+
+    except Exception as e:
+        db.session.rollback()
+        document = Document.query.get(document_id)
+        if document is None:
+            # Deleted (with its project) while it was being processed
+            return False
+        document.status = DocumentStatus.FAILED
+        document.processing_error = str(e)
+        document.processed_at = datetime.utcnow()
+        db.session.commit()
+        return False
+
+
+def sample_document_text(document, max_length):
+    """
+    Pick a random window of consecutive chunks of a READY document, up to
+    `max_length` characters, so that repeated generations cover the whole text.
+    """
+    from app.models.models import DocumentChunk
+
+    count = document.chunks.count()
+    if count == 0:
+        return document.content or ''
+
+    first = random.randrange(count)
+    passages = []
+    length = 0
+    for chunk in document.chunks.filter(DocumentChunk.position >= first):
+        if passages and length + len(chunk.content) > max_length:
+            break
+        passages.append(chunk.content)
+        length += len(chunk.content)
+    return ''.join(passages)[:max_length]
+
+
+# -----------------------------------------------
+# SCHEDULING
+# -----------------------------------------------
+def _run_in_context(app, document_id):
+    with app.app_context():
+        ingest_document(document_id)
+
+
+def enqueue_document(app, document_id):
+    """Schedule the ingestion of a freshly uploaded document."""
+    mode = app.config['INGESTION_MODE']
+    if mode == 'sync':
+        ingest_document(document_id)
+    elif mode == 'thread':
+        executor = _executor
+        try:
+            if executor is None:
+                raise RuntimeError('the ingestion workers are shut down')
+            executor.submit(_run_in_context, app, document_id)
+        except RuntimeError as e:
+            # The document stays PENDING, for `flask ingest` or the next claim
+            app.logger.warning('Document %s left pending: %s', document_id, e)
+
+
+def shutdown_ingestion(wait=True):
+    """Stop the background workers, by default after the queued documents are done."""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def process_pending(retry_failed=False, limit=None):
+    """
+    Process the documents waiting for ingestion, one at a time.
+
+    Returns:
+        tuple: (ready, failed) counts
+    """
+    from app.models.models import Document
+
+    query = db.session.query(Document.id).filter(_claimable(retry_failed))
+    if limit:
+        query = query.limit(limit)
+    document_ids = [row.id for row in query]
+
+    ready = failed = 0
+    for document_id in document_ids:
+        result = ingest_document(document_id, retry_failed)
+        if result is True:
+            ready += 1
+        elif result is False:
+            failed += 1
+    return ready, failed
+
+
+def init_ingestion(app):
+    """Configure the background workers and register the `flask ingest` command."""
+    global _executor
+
+    app.config.setdefault('INGESTION_MODE', os.getenv('INGESTION_MODE', 'thread').lower())
+    app.config.setdefault('INGESTION_WORKERS', int(os.getenv('INGESTION_WORKERS', 2)))
+    # Characters of text kept per document, the rest of the file is not read (0 = everything)
+    app.config.setdefault('INGESTION_MAX_CHARS', int(os.getenv('INGESTION_MAX_CHARS', 0)))
+    # Seconds after which a document still PROCESSING is considered abandoned by its worker
+    app.config.setdefault('INGESTION_CLAIM_TIMEOUT', int(os.getenv('INGESTION_CLAIM_TIMEOUT', 900)))
+    app.config.setdefault('PDF_BACKEND', os.getenv('PDF_BACKEND', 'pypdf'))
+    set_pdf_backend(app.config['PDF_BACKEND'])
+
+    if app.config['INGESTION_MODE'] == 'thread' and _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config['INGESTION_WORKERS'],
+                                       thread_name_prefix='ingestion')
+
+    @app.cli.command('ingest')
+    @click.option('--retry-failed', is_flag=True, help='Also reprocess FAILED documents.')
+    @click.option('--watch', type=float, default=None,
+                  help='Keep polling for new documents every WATCH seconds.')
+    def ingest_command(retry_failed, watch):
+        """Process the documents waiting for ingestion."""
+        while True:
+            ready, failed = process_pending(retry_failed)
+            if ready or failed or watch is None:
+                click.echo(f'Ingested {ready} documents, {failed} failed')
+            if watch is None:
+                break
+            retry_failed = False
+            time.sleep(watch)
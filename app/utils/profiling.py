@@ -0,0 +1,330 @@
+"""
+Opt-in request profiling.
+
+When enabled (PROFILING_ENABLED=1) every request records timing spans for its
+phases (SQL, serialization, text extraction, LLM call), the number and total
+time of the SQL statements it ran and the size of its response. The numbers
+are returned in a `Server-Timing` header and aggregated per endpoint into a
+Prometheus-format `/metrics` endpoint.
+
+A request can also be run under a profiler by sending `X-Profile: cprofile`
+(or `pyinstrument`, if installed) together with `X-Profile-Token` set to
+PROFILE_TOKEN (the header is ignored when no token is configured), or by
+setting PROFILING_SAMPLE_RATE to profile a random fraction of the traffic.
+Profiles are written to PROFILE_DIR, which keeps the newest PROFILE_MAX_FILES.
+
+When profiling is disabled `span` and `timed` are no-ops.
+"""
+import functools
+import hmac
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, has_request_context, request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_enabled = False
+
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestProfile:
+    """Timings collected while serving a single request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.depth = {}
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.profiler = None
+
+    def add(self, name, seconds):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + seconds, count + 1)
+
+
+def _current():
+    if not _enabled or not has_request_context():
+        return None
+    return g.get('_profile')
+
+
+@contextmanager
+def span(name):
+    """
+    Time a phase of the current request. Nested spans with the same name
+    (e.g. `to_dict` calling `to_dict`) are only counted once.
+    """
+    profile = _current()
+    if profile is None:
+        yield
+        return
+
+    depth = profile.depth.get(name, 0)
+    profile.depth[name] = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.depth[name] = depth
+        if depth == 0:
+            profile.add(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator version of `span`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# -----------------------------------------------
+# SQL INSTRUMENTATION
+# -----------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault('_profile_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current()
+    starts = conn.info.get('_profile_start')
+    if profile is None or not starts:
+        return
+    profile.sql_count += 1
+    profile.sql_time += time.perf_counter() - starts.pop()
+
+
+# -----------------------------------------------
+# AGGREGATED METRICS
+# -----------------------------------------------
+class Metrics:
+    """Per-process counters exposed in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.durations = {}
+        self.sql = {}
+        self.phases = {}
+        self.response_bytes = {}
+
+    def observe(self, endpoint, method, status, duration, profile, size):
+        with self.lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            buckets, total, count = self.durations.get(endpoint, ([0] * len(DURATION_BUCKETS), 0.0, 0))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            self.durations[endpoint] = (buckets, total + duration, count + 1)
+
+            statements, seconds = self.sql.get(endpoint, (0, 0.0))
+            self.sql[endpoint] = (statements + profile.sql_count, seconds + profile.sql_time)
+
+            for name, (phase_seconds, _) in profile.spans.items():
+                self.phases[(endpoint, name)] = self.phases.get((endpoint, name), 0.0) + phase_seconds
+
+            if size is not None:
+                self.response_bytes[endpoint] = self.response_bytes.get(endpoint, 0) + size
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append('# HELP purplle_requests_total Requests served.')
+            lines.append('# TYPE purplle_requests_total counter')
+            for (endpoint, method, status), value in sorted(self.requests.items()):
+                lines.append(f'purplle_requests_total{{endpoint="{endpoint}",method="{method}",'
+                             f'status="{status}"}} {value}')
+
+            lines.append('# HELP purplle_request_duration_seconds Request duration.')
+            lines.append('# TYPE purplle_request_duration_seconds histogram')
+            for endpoint, (buckets, total, count) in sorted(self.durations.items()):
+                for bound, value in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'purplle_request_duration_seconds_bucket{{endpoint="{endpoint}",'
+                                 f'le="{bound}"}} {value}')
+                lines.append(f'purplle_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {count}')
+                lines.append(f'purplle_request_duration_seconds_sum{{endpoint="{endpoint}"}} {total:.6f}')
+                lines.append(f'purplle_request_duration_seconds_count{{endpoint="{endpoint}"}} {count}')
+
+            lines.append('# HELP purplle_sql_statements_total SQL statements executed.')
+            lines.append('# TYPE purplle_sql_statements_total counter')
+            for endpoint, (statements, _) in sorted(self.sql.items()):
+                lines.append(f'purplle_sql_statements_total{{endpoint="{endpoint}"}} {statements}')
+
+            lines.append('# HELP purplle_sql_duration_seconds_total Time spent executing SQL.')
+            lines.append('# TYPE purplle_sql_duration_seconds_total counter')
+            for endpoint, (_, seconds) in sorted(self.sql.items()):
+                lines.append(f'purplle_sql_duration_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+
+            lines.append('# HELP purplle_phase_duration_seconds_total Time spent per request phase.')
+            lines.append('# TYPE purplle_phase_duration_seconds_total counter')
+            for (endpoint, phase), seconds in sorted(self.phases.items()):
+                lines.append(f'purplle_phase_duration_seconds_total{{endpoint="{endpoint}",'
+                             f'phase="{phase}"}} {seconds:.6f}')
+
+            lines.append('# HELP purplle_response_bytes_total Bytes sent in response bodies.')
+            lines.append('# TYPE purplle_response_bytes_total counter')
+            for endpoint, value in sorted(self.response_bytes.items()):
+                lines.append(f'purplle_response_bytes_total{{endpoint="{endpoint}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# -----------------------------------------------
+# SAMPLING PROFILER
+# -----------------------------------------------
+def _start_profiler(kind):
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            kind = 'cprofile'
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return kind, profiler
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return 'cprofile', profiler
+
+
+def _requested_profiler(app):
+    """The profiler asked for in X-Profile, if the request carries the profiling token."""
+    kind = (request.headers.get('X-Profile') or '').lower()
+    token = app.config['PROFILE_TOKEN']
+    if kind not in ('cprofile', 'pyinstrument') or not token:
+        return None
+    if not hmac.compare_digest(request.headers.get('X-Profile-Token', '').encode(), token.encode()):
+        return None
+    return kind
+
+
+def _prune_profiles(folder, keep):
+    """Delete all but the `keep` newest profiles in the folder."""
+    paths = [entry.path for entry in os.scandir(folder)
+             if entry.is_file() and entry.name.endswith(('.prof', '.html'))]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _stop_profiler(app, kind, profiler, endpoint):
+    folder = app.config['PROFILE_DIR']
+    os.makedirs(folder, exist_ok=True)
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{re.sub(r'[^A-Za-z0-9]+', '_', endpoint).strip('_') or 'root'}"
+
+    if kind == 'pyinstrument':
+        profiler.stop()
+        path = os.path.join(folder, name + '.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = os.path.join(folder, name + '.prof')
+        profiler.dump_stats(path)
+    _prune_profiles(folder, app.config['PROFILE_MAX_FILES'])
+    return path
+
+
+# -----------------------------------------------
+# REGISTRATION
+# -----------------------------------------------
+def _endpoint():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_profiling(app):
+    """Register the profiling hooks and the /metrics endpoint on the app."""
+    global _enabled
+    _enabled = True
+
+    app.config.setdefault('PROFILING_SAMPLE_RATE', float(os.getenv('PROFILING_SAMPLE_RATE', 0)))
+    app.config.setdefault('PROFILE_DIR', os.getenv('PROFILE_DIR', 'profiles'))
+    app.config.setdefault('PROFILE_MAX_FILES', int(os.getenv('PROFILE_MAX_FILES', 100)))
+    app.config.setdefault('PROFILE_TOKEN', os.getenv('PROFILE_TOKEN'))
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_profile():
+        if request.path == '/metrics':
+            return
+        profile = RequestProfile()
+        g._profile = profile
+
+        kind = _requested_profiler(app)
+        if not kind and random.random() < app.config['PROFILING_SAMPLE_RATE']:
+            kind = 'cprofile'
+        if kind:
+            profile.profiler = _start_profiler(kind)
+
+    @app.after_request
+    def finish_request_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+
+        endpoint = _endpoint()
+        if profile.profiler:
+            kind, profiler = profile.profiler
+            path = _stop_profiler(app, kind, profiler, endpoint)
+            response.headers['X-Profile-File'] = os.path.basename(path)
+
+        duration = time.perf_counter() - profile.start
+        size = response.calculate_content_length()
+
+        timings = [f'sql;dur={profile.sql_time * 1000:.2f};desc="{profile.sql_count} queries"']
+        for name, (seconds, count) in profile.spans.items():
+            timings.append(f'{name};dur={seconds * 1000:.2f}')
+        timings.append(f'total;dur={duration * 1000:.2f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        metrics.observe(endpoint, request.method, response.status_code, duration, profile, size)
+        return response
+
+    @app.teardown_request
+    def abandon_request_profile(exc):
+        # after_request is skipped when the view (or another hook) raised: stop
+        # the profiler still running on this thread and count the request as a 500
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return
+
+        endpoint = _endpoint()
+        if profile.profiler:
+            kind, profiler = profile.profiler
+            try:
+                _stop_profiler(app, kind, profiler, endpoint)
+            except OSError as e:
+                app.logger.warning('Could not write the profile of a failed request: %s', e)
+        metrics.observe(endpoint, request.method, 500, time.perf_counter() - profile.start, profile, None)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
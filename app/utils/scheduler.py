@@ -0,0 +1,82 @@
+"""
+Spaced-repetition scheduling of the question bank (SM-2).
+
+Every question has a ReviewState with its due date, ease factor and interval.
+New questions are due immediately; each evaluation (0-100) is turned into an
+SM-2 quality grade (0-5) that moves the due date forward, or back to the next
+day when the answer was wrong.
+"""
+import datetime
+
+MIN_EASE_FACTOR = 1.3
+# Quality grades below this count as a lapse
+PASSING_QUALITY = 3
+
+
+def schedule_new_question(question, project_id, now=None):
+    """Attach a review state to a new question, due immediately."""
+    from app.models.models import ReviewState
+
+    question.review = ReviewState(project_id=project_id, due_at=now or datetime.datetime.utcnow())
+    return question.review
+
+
+def quality_from_evaluation(evaluation):
+    """Map an evaluation (0-100) to an SM-2 quality grade (0-5)."""
+    return max(0, min(5, int(round(evaluation / 20))))
+
+
+def record_review(question, evaluation, now=None):
+    """
+    Update the schedule of a question after it has been evaluated.
+
+    Args:
+        question (Question): The evaluated question (its session must be loaded or loadable)
+        evaluation (float): Score from 0 to 100
+        now (datetime, optional): Time of the review, defaults to utcnow
+
+    Returns:
+        ReviewState: The updated state
+    """
+    now = now or datetime.datetime.utcnow()
+    state = question.review or schedule_new_question(question, question.session.project_id, now)
+    quality = quality_from_evaluation(evaluation)
+
+    if quality < PASSING_QUALITY:
+        state.repetitions = 0
+        state.interval_days = 1
+        state.lapses = (state.lapses or 0) + 1
+    else:
+        state.repetitions = (state.repetitions or 0) + 1
+        if state.repetitions == 1:
+            state.interval_days = 1
+        elif state.repetitions == 2:
+            state.interval_days = 6
+        else:
+            state.interval_days = round(state.interval_days * state.ease_factor, 2)
+
+    ease = (state.ease_factor or 2.5) + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    state.ease_factor = max(MIN_EASE_FACTOR, ease)
+    state.last_reviewed_at = now
+    state.due_at = now + datetime.timedelta(days=state.interval_days)
+    return state
+
+
+def due_questions(project_id, limit, now=None):
+    """
+    The `limit` most overdue questions of a project, read with a range scan
+    on the (project_id, due_at) index.
+
+    Returns:
+        list: ReviewState rows, with their question loaded
+    """
+    from app.models.models import ReviewState
+    from sqlalchemy.orm import joinedload
+
+    now = now or datetime.datetime.utcnow()
+    return (ReviewState.query
+            .options(joinedload(ReviewState.question))
+            .filter(ReviewState.project_id == project_id, ReviewState.due_at <= now)
+            .order_by(ReviewState.due_at)
+            .limit(limit)
+            .all())
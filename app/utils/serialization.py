@@ -0,0 +1,115 @@
+"""
+JSON encoding for the API responses.
+
+The app uses orjson when it is installed and falls back to the standard library
+encoder otherwise (JSON_PROVIDER=auto|orjson|stdlib). Both providers encode
+Enum members as their value and datetimes in ISO 8601, so the models' `to_dict`
+can return them as they are and leave the conversion to the encoder instead of
+calling `.value`/`.isoformat()` on every row in Python.
+
+List endpoints use `json_array_response`, which encodes one element at a time
+and streams the array, so the full response string is never held in memory.
+orjson is optional and not listed in requirements.txt.
+"""
+import datetime
+import itertools
+import os
+from enum import Enum
+
+from flask import Response, current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Standard library encoder: compact output (also in debug) and no key sorting."""
+
+    default = staticmethod(_default)
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('separators', (',', ':'))
+        return super().dumps(obj, **kwargs)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """orjson encoder. Enum, datetime and UUID are encoded natively in C."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Install the JSON provider selected by JSON_PROVIDER on the app."""
+    backend = app.config.setdefault('JSON_PROVIDER', os.getenv('JSON_PROVIDER', 'auto')).lower()
+
+    if backend == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER=orjson but orjson is not installed')
+
+    if backend in ('auto', 'orjson') and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = StdlibJSONProvider(app)
+
+
+def json_array_response(items, serialize=None, status=200, buffer=100):
+    """
+    Stream a JSON array, encoding one element at a time.
+
+    The first `buffer` items are encoded before the response is returned, so
+    a failing query or serializer still raises inside the view (and becomes
+    its error response), and results that fit in the buffer are sent whole.
+    An error after the stream has started cannot change the status any more:
+    it is logged and the body ends with an error object instead of the
+    closing bracket, so a client parsing the array gets a JSON error rather
+    than a silently truncated list.
+
+    Args:
+        items (iterable): Model instances (or a query, iterated lazily)
+        serialize (callable, optional): Turns an item into a dict. Defaults to `item.to_dict()`
+        status (int): HTTP status code
+        buffer (int): Items encoded before the response starts
+
+    Returns:
+        Response: `application/json` response, streamed past `buffer` items
+    """
+    serialize = serialize or (lambda item: item.to_dict())
+    dumps = current_app.json.dumps
+    items = iter(items)
+    head = [dumps(serialize(item)) for item in itertools.islice(items, buffer)]
+    if len(head) < buffer:
+        return Response('[' + ','.join(head) + ']', status=status, mimetype='application/json')
+
+    def generate():
+        yield '[' + ','.join(head)
+        try:
+            for item in items:
+                yield ',' + dumps(serialize(item))
+        except Exception:
+            current_app.logger.exception('JSON array stream failed after it started')
+            yield '\n' + dumps({'error': 'response truncated'})
+            return
+        yield ']'
+
+    return Response(stream_with_context(generate()), status=status, mimetype='application/json')
@@ -0,0 +1,329 @@
+"""
+Compressed storage of the extracted text of the documents.
+
+Document.content and DocumentChunk.content are CompressedText columns (see
+app.models.types): the text is compressed when it is written and
+decompressed when the column is loaded, which for the deferred
+Document.content only happens when the text is actually used. A stored value
+is one tag byte followed by:
+
+    0  the UTF-8 text (values under TEXT_COMPRESSION_MIN_SIZE bytes, or that do not compress)
+    1  a zlib stream
+    2  a 4 byte dictionary id, then a zlib stream using it as preset dictionary
+    3  a zstd frame (optional `zstandard` package)
+    4  a 4 byte dictionary id, then a zstd frame using it
+
+New values use TEXT_COMPRESSION (zstd when `zstandard` is installed, else
+zlib). Slides and lecture notes repeat the same headers, footers and phrases
+in every chunk, which a per-project dictionary (table `text_dictionary`)
+captures: `flask compress-text --train` builds one from samples of a
+project's chunks (zstd's trainer, or for zlib the lines and words recurring
+in most samples) and recompresses the project's text with it; the ingestion
+pipeline then uses the latest dictionary of the project for new documents.
+Dictionaries are never modified and their ids never reused, so they are
+cached by id in each process.
+"""
+import importlib.util
+import os
+import struct
+import threading
+import zlib
+from collections import Counter
+
+import click
+
+# Optional, imported on first use (see _zstd)
+ZSTD_AVAILABLE = importlib.util.find_spec('zstandard') is not None
+
+PLAIN, ZLIB, ZLIB_DICT, ZSTD, ZSTD_DICT = range(5)
+
+CODECS = ('none', 'zlib') + (('zstd',) if ZSTD_AVAILABLE else ())
+LEVELS = {'zlib': 6, 'zstd': 9}
+
+# zlib only looks back 32 KB: a longer preset dictionary is truncated
+ZLIB_MAX_DICTIONARY = 32 * 1024
+
+_settings = {'codec': 'zstd' if ZSTD_AVAILABLE else 'zlib', 'level': None, 'min_size': 128}
+
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+class Dictionary:
+    """A compression dictionary (row of text_dictionary), ready to use."""
+
+    def __init__(self, dictionary_id, codec, data):
+        self.id = dictionary_id
+        self.codec = codec
+        self.data = data
+        self.zstd = _zstd().ZstdCompressionDict(data) if codec == 'zstd' and ZSTD_AVAILABLE else None
+
+
+def configure(codec=None, level=None, min_size=None):
+    """Set the codec (see CODECS), level and minimum size used for new values."""
+    if codec is not None:
+        if codec not in CODECS:
+            raise ValueError(f"Unknown or unavailable TEXT_COMPRESSION {codec!r} "
+                             f"(expected one of: {', '.join(CODECS)})")
+        _settings['codec'] = codec
+    if level is not None:
+        _settings['level'] = level
+    if min_size is not None:
+        _settings['min_size'] = min_size
+
+
+def register_dictionary(dictionary_id, codec, data):
+    """Cache a dictionary (e.g. one loaded by a migration, or a benchmark's)."""
+    dictionary = Dictionary(dictionary_id, codec, bytes(data))
+    with _dictionaries_lock:
+        _dictionaries[dictionary_id] = dictionary
+    return dictionary
+
+
+def get_dictionary(dictionary_id):
+    """A dictionary by id, loaded on first use (in its own connection: values are decoded mid-query)."""
+    dictionary = _dictionaries.get(dictionary_id)
+    if dictionary is None:
+        from sqlalchemy import select
+        from app import db
+        from app.models.models import TextDictionary
+
+        with db.engine.connect() as connection:
+            row = connection.execute(select(TextDictionary.codec, TextDictionary.data)
+                                     .where(TextDictionary.id == dictionary_id)).first()
+        if row is None:
+            raise ValueError(f'Unknown text dictionary {dictionary_id}')
+        dictionary = register_dictionary(dictionary_id, row.codec, row.data)
+    return dictionary
+
+
+# -----------------------------------------------
+# ENCODING
+# -----------------------------------------------
+def compress_text(text, dictionary=None):
+    """
+    Encode a text for a CompressedText column.
+
+    Args:
+        text (str): The text
+        dictionary (Dictionary, optional): Dictionary to compress with (e.g. project_dictionary())
+
+    Returns:
+        bytes: tag byte and payload (see the module docstring)
+    """
+    data = text.encode('utf-8')
+    codec = _settings['codec']
+    if codec == 'none' or len(data) < _settings['min_size']:
+        return bytes([PLAIN]) + data
+
+    if dictionary is not None and (dictionary.codec == 'zlib' or dictionary.zstd is not None):
+        level = _settings['level'] or LEVELS[dictionary.codec]
+        if dictionary.codec == 'zstd':
+            tag, body = ZSTD_DICT, _zstd().ZstdCompressor(level=level, dict_data=dictionary.zstd).compress(data)
+        else:
+            compressor = zlib.compressobj(level, zdict=dictionary.data[-ZLIB_MAX_DICTIONARY:])
+            tag, body = ZLIB_DICT, compressor.compress(data) + compressor.flush()
+        encoded = struct.pack('>BI', tag, dictionary.id) + body
+    elif codec == 'zstd':
+        encoded = bytes([ZSTD]) + _zstd().ZstdCompressor(level=_settings['level'] or LEVELS['zstd']).compress(data)
+    else:
+        encoded = bytes([ZLIB]) + zlib.compress(data, _settings['level'] or LEVELS['zlib'])
+
+    return encoded if len(encoded) <= len(data) else bytes([PLAIN]) + data
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError('This text is compressed with zstd: install the zstandard package') from None
+    return zstandard
+
+
+def decompress_text(value):
+    """Decode a value of a CompressedText column."""
+    value = bytes(value)
+    tag = value[0]
+    if tag == PLAIN:
+        return value[1:].decode('utf-8')
+    if tag == ZLIB:
+        return zlib.decompress(value[1:]).decode('utf-8')
+    if tag == ZSTD:
+        return _zstd().ZstdDecompressor().decompress(value[1:]).decode('utf-8')
+    if tag in (ZLIB_DICT, ZSTD_DICT):
+        dictionary = get_dictionary(struct.unpack_from('>I', value, 1)[0])
+        if tag == ZSTD_DICT:
+            return _zstd().ZstdDecompressor(dict_data=dictionary.zstd).decompress(value[5:]).decode('utf-8')
+        decompressor = zlib.decompressobj(zdict=dictionary.data[-ZLIB_MAX_DICTIONARY:])
+        return (decompressor.decompress(value[5:]) + decompressor.flush()).decode('utf-8')
+    raise ValueError(f'Unknown compressed text format {tag}')
+
+
+# -----------------------------------------------
+# DICTIONARIES
+# -----------------------------------------------
+def _zlib_dictionary(samples, size):
+    """
+    zlib has no trainer: keep the lines, then the words, that recur in most
+    samples. Deflate reaches the end of the dictionary with the shortest
+    distances, so the most useful strings go last.
+    """
+    lines, words = Counter(), Counter()
+    for sample in samples:
+        lines.update({line.strip() for line in sample.splitlines() if len(line.strip()) >= 8})
+        words.update({word for word in sample.split() if len(word) >= 4})
+    candidates = sorted([(n * len(line), line) for line, n in lines.items() if n > 1] +
+                        [(n * len(word), word) for word, n in words.most_common(5000) if n > 1], reverse=True)
+
+    chosen, strings = bytearray(), []
+    for _, string in candidates:
+        encoded = string.encode('utf-8')
+        # Skip what does not fit, or is already part of a chosen line
+        if len(chosen) + len(encoded) + 1 > size or encoded in chosen:
+            continue
+        strings.append(encoded)
+        chosen += encoded + b'\n'
+    return b'\n'.join(reversed(strings))
+
+
+def build_dictionary(samples, size, codec):
+    """Dictionary content (bytes) for texts like the samples, or None if they are not enough."""
+    if codec == 'zstd':
+        zstandard = _zstd()
+        try:
+            return zstandard.train_dictionary(size, [sample.encode('utf-8') for sample in samples]).as_bytes()
+        except zstandard.ZstdError:
+            return None
+    return _zlib_dictionary(samples, min(size, ZLIB_MAX_DICTIONARY)) or None
+
+
+def train_dictionary(project_id, size=None):
+    """
+    Train a dictionary on the chunks of a project's documents and store it.
+
+    Returns:
+        int: id of the new dictionary, None if the project has too little text
+    """
+    from flask import current_app
+    from app import db
+    from app.models.models import Document, DocumentChunk, TextDictionary
+
+    config = current_app.config
+    samples = [content for content, in db.session.query(DocumentChunk.content)
+               .join(Document, DocumentChunk.document_id == Document.id)
+               .filter(Document.project_id == project_id)
+               .order_by(DocumentChunk.id).limit(config['TEXT_DICTIONARY_SAMPLES'])]
+    if len(samples) < config['TEXT_DICTIONARY_MIN_SAMPLES']:
+        return None
+
+    codec = 'zstd' if ZSTD_AVAILABLE else 'zlib'
+    data = build_dictionary(samples, size or config['TEXT_DICTIONARY_SIZE'], codec)
+    if not data:
+        return None
+    dictionary = TextDictionary(project_id=project_id, codec=codec, data=data, sample_count=len(samples))
+    db.session.add(dictionary)
+    db.session.commit()
+    return dictionary.id
+
+
+def project_dictionary(project_id):
+    """The latest usable dictionary of a project, None if it has none."""
+    from app import db
+    from app.models.models import TextDictionary
+
+    usable = [codec for codec in ('zlib', 'zstd') if codec in CODECS]
+    dictionary_id = (db.session.query(TextDictionary.id)
+                     .filter(TextDictionary.project_id == project_id, TextDictionary.codec.in_(usable))
+                     .order_by(TextDictionary.id.desc()).limit(1).scalar())
+    return get_dictionary(dictionary_id) if dictionary_id is not None else None
+
+
+# -----------------------------------------------
+# RECOMPRESSION
+# -----------------------------------------------
+def _text_columns(project_id):
+    """(table, WHERE clause selecting the rows of the project, or None for all) of each compressed column."""
+    from sqlalchemy import select
+    from app.models.models import Document, DocumentChunk
+
+    document, chunk = Document.__table__, DocumentChunk.__table__
+    if project_id is None:
+        return [(document, None), (chunk, None)]
+    return [(document, document.c.project_id == project_id),
+            (chunk, chunk.c.document_id.in_(select(document.c.id).where(document.c.project_id == project_id)))]
+
+
+def stored_size(project_id=None):
+    """Bytes taken by the stored (compressed) text of a project, or of every project."""
+    from sqlalchemy import func, select
+    from app import db
+
+    total = 0
+    for table, where in _text_columns(project_id):
+        query = select(func.coalesce(func.sum(func.length(table.c.content)), 0))
+        total += db.session.execute(query.where(where) if where is not None else query).scalar()
+    return total
+
+
+def recompress(project_id, dictionary=None, batch_size=500):
+    """
+    Rewrite the text of a project's documents and chunks with the current
+    settings and a dictionary, batch_size rows per transaction.
+
+    Returns:
+        int: number of rows rewritten
+    """
+    from sqlalchemy import bindparam, select
+    from app import db
+
+    rewritten = 0
+    for table, where in _text_columns(project_id):
+        update = (table.update().where(table.c.id == bindparam('row_id'))
+                  .values(content=bindparam('value', type_=table.c.content.type)))
+        last_id = None
+        while True:
+            query = select(table.c.id, table.c.content).order_by(table.c.id).limit(batch_size)
+            if where is not None:
+                query = query.where(where)
+            if last_id is not None:
+                query = query.where(table.c.id > last_id)
+            rows = db.session.execute(query).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            params = [{'row_id': row.id, 'value': compress_text(row.content, dictionary)}
+                      for row in rows if row.content is not None]
+            if params:
+                db.session.execute(update, params)
+            db.session.commit()
+            rewritten += len(params)
+    return rewritten
+
+
+def init_text_compression(app):
+    """Configure the compression of new text values and register the `flask compress-text` command."""
+    app.config.setdefault('TEXT_COMPRESSION', os.getenv('TEXT_COMPRESSION', _settings['codec']))
+    app.config.setdefault('TEXT_COMPRESSION_LEVEL', int(os.getenv('TEXT_COMPRESSION_LEVEL', 0)) or None)
+    app.config.setdefault('TEXT_COMPRESSION_MIN_SIZE', int(os.getenv('TEXT_COMPRESSION_MIN_SIZE', 128)))
+    app.config.setdefault('TEXT_DICTIONARY_SIZE', int(os.getenv('TEXT_DICTIONARY_SIZE', 16 * 1024)))
+    app.config.setdefault('TEXT_DICTIONARY_SAMPLES', int(os.getenv('TEXT_DICTIONARY_SAMPLES', 2000)))
+    app.config.setdefault('TEXT_DICTIONARY_MIN_SAMPLES', int(os.getenv('TEXT_DICTIONARY_MIN_SAMPLES', 20)))
+    configure(app.config['TEXT_COMPRESSION'], app.config['TEXT_COMPRESSION_LEVEL'],
+              app.config['TEXT_COMPRESSION_MIN_SIZE'])
+
+    @app.cli.command('compress-text')
+    @click.option('--project', 'project_id', default=None, help='Only this project (default: all).')
+    @click.option('--train', is_flag=True, help='Train a new dictionary for each project first.')
+    @click.option('--dictionary-size', type=int, default=None, help='Bytes (default: TEXT_DICTIONARY_SIZE).')
+    def compress_text_command(project_id, train, dictionary_size):
+        """Recompress the stored document text, with each project's latest dictionary."""
+        from app import db
+        from app.models.models import Project
+
+        project_ids = [project_id] if project_id else [pid for pid, in db.session.query(Project.id)]
+        before = stored_size(project_id)
+        for pid in project_ids:
+            if train and train_dictionary(pid, dictionary_size) is None:
+                click.echo(f'{pid}: too little text to train a dictionary')
+            recompress(pid, project_dictionary(pid))
+        click.echo(f'Stored text: {before} -> {stored_size(project_id)} bytes')
@@ -0,0 +1,293 @@
+"""
+Token and cost accounting of the model calls.
+
+Every call made through app.utils.ai_services is recorded in the append-only
+`llm_usage` table: operation, provider and model, prompt and response tokens
+(from the provider's usage metadata, estimated from the text length when it
+has none), latency, cost and whether it failed, charged to the project and
+session of the request (`usage_scope`, set by the `llm_job` decorator).
+
+Rows are not written on the request path: `record_usage` appends them to an
+in-process buffer, and a background thread inserts the buffer in one
+executemany every USAGE_FLUSH_INTERVAL seconds, or as soon as it holds
+USAGE_BATCH_SIZE rows. The buffer is flushed when a worker exits, and holds
+at most USAGE_MAX_PENDING rows: when the database is unreachable for long,
+the oldest rows are dropped. The first app initialised in a process owns the
+buffer and its writer.
+
+Each project has a monthly token budget (Project.token_budget, or
+LLM_TOKEN_BUDGET for all projects; 0/None is unlimited). Once the calls of
+the current calendar month (UTC) reach it, `llm_job` views answer 429
+instead of starting a new generation job.
+"""
+import atexit
+import contextvars
+import datetime
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, jsonify
+from sqlalchemy import func
+
+from app import db
+from app.utils.grading import CHARS_PER_TOKEN
+
+# USD per million (prompt, response) tokens; LLM_PRICE_INPUT/LLM_PRICE_OUTPUT override them
+PRICES = {
+    'gemini-2.0-flash': (0.10, 0.40),
+    'gemini-2.0-flash-lite': (0.075, 0.30),
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-1.5-pro': (1.25, 5.00),
+}
+
+_scope = contextvars.ContextVar('llm_usage_scope', default=None)
+
+_app = None
+_pending = []
+_condition = threading.Condition()
+_writer = None
+_stopping = False
+
+
+class _Scope:
+    def __init__(self, project_id, session_id):
+        self.project_id = project_id
+        self.session_id = session_id
+
+
+@contextmanager
+def usage_scope(project_id, session_id=None):
+    """Charge the model calls made inside the block to a project (and session)."""
+    token = _scope.set(_Scope(project_id, session_id))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def estimate_tokens(text):
+    return len(text or '') // CHARS_PER_TOKEN
+
+
+def _price(model):
+    prompt, response = os.getenv('LLM_PRICE_INPUT'), os.getenv('LLM_PRICE_OUTPUT')
+    if prompt is not None and response is not None:
+        return float(prompt), float(response)
+    return PRICES.get(model)
+
+
+# -----------------------------------------------
+# RECORDING (BUFFERED)
+# -----------------------------------------------
+def record_usage(operation, provider, model, prompt_tokens, response_tokens, latency_ms, failed=False):
+    """Queue a usage row for the current scope; it is written by the background writer."""
+    if _app is None:  # called outside the app (init_usage not run), nowhere to write it
+        return
+    scope = _scope.get()
+    price = _price(model)
+    row = {
+        'created_at': datetime.datetime.utcnow(),
+        'project_id': scope.project_id if scope else None,
+        'session_id': scope.session_id if scope else None,
+        'operation': operation,
+        'provider': provider,
+        'model': model,
+        'prompt_tokens': prompt_tokens,
+        'response_tokens': response_tokens,
+        'latency_ms': latency_ms,
+        'cost': (prompt_tokens * price[0] + response_tokens * price[1]) / 1e6 if price else None,
+        'failed': failed,
+    }
+    with _condition:
+        _pending.append(row)
+        dropped = len(_pending) - _app.config['USAGE_MAX_PENDING']
+        if dropped > 0:
+            del _pending[:dropped]
+        if len(_pending) >= _app.config['USAGE_BATCH_SIZE']:
+            _condition.notify()
+    if dropped > 0:
+        _app.logger.warning('LLM usage buffer full, dropped %d unwritten row(s)', dropped)
+    _start_writer()
+
+
+def pending_tokens(project_id):
+    """Tokens of the rows of a project still waiting in this process's buffer."""
+    with _condition:
+        return sum(row['prompt_tokens'] + row['response_tokens'] for row in _pending
+                   if row['project_id'] == project_id)
+
+
+def flush_usage():
+    """
+    Insert the buffered rows (one executemany, in its own transaction).
+    Needs an app context. Returns the number of rows written.
+    """
+    from app.models.models import LlmUsage
+
+    with _condition:
+        rows = _pending[:]
+        del _pending[:]
+    if not rows:
+        return 0
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(LlmUsage.__table__.insert(), rows)
+    except Exception:
+        # Keep them for the next flush (the buffer is bounded)
+        with _condition:
+            _pending[:0] = rows[-_app.config['USAGE_MAX_PENDING']:]
+        raise
+    return len(rows)
+
+
+def _run_writer(app):
+    while True:
+        with _condition:
+            _condition.wait_for(lambda: _stopping or len(_pending) >= app.config['USAGE_BATCH_SIZE'],
+                                timeout=app.config['USAGE_FLUSH_INTERVAL'])
+            stopping = _stopping
+        with app.app_context():
+            try:
+                flush_usage()
+            except Exception as e:
+                app.logger.warning('Could not write LLM usage rows: %s', e)
+        if stopping:
+            return
+
+
+def _start_writer():
+    global _writer
+
+    with _condition:
+        if _writer is not None and _writer.is_alive():
+            return
+        # Started lazily, so that each (forked) worker process has its own
+        _writer = threading.Thread(target=_run_writer, args=(_app,), name='llm-usage-writer', daemon=True)
+        _writer.start()
+
+
+def shutdown_usage():
+    """Stop the background writer after a last flush."""
+    global _writer, _stopping
+
+    with _condition:
+        writer = _writer
+        _stopping = True
+        _condition.notify_all()
+    if writer is not None:
+        writer.join()
+    with _condition:
+        _writer = None
+        _stopping = False
+
+
+# -----------------------------------------------
+# AGGREGATES AND BUDGETS
+# -----------------------------------------------
+def usage_totals(group_by=None, **filters):
+    """
+    Sum the usage rows matching the filters, optionally grouped.
+
+    Args:
+        group_by: column expression to group on (e.g. LlmUsage.operation), or None
+        filters: project_id, session_id, start, end (datetimes, end excluded)
+
+    Returns:
+        list: dicts with the group key ('key', when grouped) and the totals
+    """
+    from app.models.models import LlmUsage
+
+    columns = [func.count().label('calls'),
+               func.coalesce(func.sum(LlmUsage.prompt_tokens), 0).label('prompt_tokens'),
+               func.coalesce(func.sum(LlmUsage.response_tokens), 0).label('response_tokens'),
+               func.sum(LlmUsage.cost).label('cost'),
+               func.avg(LlmUsage.latency_ms).label('latency_ms'),
+               func.coalesce(func.sum(db.case((LlmUsage.failed.is_(True), 1), else_=0)), 0).label('failed')]
+    query = db.session.query(*([group_by.label('key')] if group_by is not None else []), *columns)
+    if filters.get('project_id') is not None:
+        query = query.filter(LlmUsage.project_id == filters['project_id'])
+    if filters.get('session_id') is not None:
+        query = query.filter(LlmUsage.session_id == filters['session_id'])
+    if filters.get('start') is not None:
+        query = query.filter(LlmUsage.created_at >= filters['start'])
+    if filters.get('end') is not None:
+        query = query.filter(LlmUsage.created_at < filters['end'])
+    if group_by is not None:
+        query = query.group_by(group_by).order_by(group_by)
+
+    return [{
+        **({'key': row.key} if group_by is not None else {}),
+        'calls': row.calls,
+        'promptTokens': int(row.prompt_tokens),
+        'responseTokens': int(row.response_tokens),
+        'totalTokens': int(row.prompt_tokens) + int(row.response_tokens),
+        'cost': round(row.cost, 6) if row.cost is not None else None,
+        'avgLatencyMs': round(row.latency_ms, 1) if row.latency_ms is not None else None,
+        'failed': int(row.failed),
+    } for row in query]
+
+
+def _month_start(now=None):
+    now = now or datetime.datetime.utcnow()
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def budget_status(project):
+    """
+    Token budget of a project for the current month.
+
+    Returns:
+        dict: budget (None if unlimited), used, remaining, since (start of the month), exhausted
+    """
+    from app.models.models import LlmUsage
+
+    budget = project.token_budget if project.token_budget is not None else current_app.config['LLM_TOKEN_BUDGET']
+    since = _month_start()
+    used = db.session.query(
+        func.coalesce(func.sum(LlmUsage.prompt_tokens + LlmUsage.response_tokens), 0)
+    ).filter(LlmUsage.project_id == project.id, LlmUsage.created_at >= since).scalar()
+    used = int(used) + pending_tokens(project.id)
+    budget = budget or None
+    return {
+        'budget': budget,
+        'used': used,
+        'remaining': max(0, budget - used) if budget else None,
+        'since': since,
+        'exhausted': bool(budget) and used >= budget,
+    }
+
+
+def llm_job(view):
+    """
+    Decorate a view that calls the model for a project (`project_id`, and
+    optionally `session_id`, view arguments): refuse it with 429 when the
+    project's budget is exhausted, else charge its calls to the project.
+    """
+    @wraps(view)
+    def wrapper(**kwargs):
+        from app.models.models import Project
+
+        project = db.session.get(Project, kwargs['project_id'])
+        if project is not None:
+            budget = budget_status(project)
+            if budget['exhausted']:
+                return jsonify({'error': 'The LLM token budget of this project is exhausted for this month',
+                                'budget': budget}), 429
+        with usage_scope(kwargs['project_id'], kwargs.get('session_id')):
+            return view(**kwargs)
+    return wrapper
+
+
+def init_usage(app):
+    """Configure usage accounting (buffer, writer, default budget)."""
+    global _app
+
+    app.config.setdefault('USAGE_FLUSH_INTERVAL', float(os.getenv('USAGE_FLUSH_INTERVAL', 2)))
+    app.config.setdefault('USAGE_BATCH_SIZE', int(os.getenv('USAGE_BATCH_SIZE', 200)))
+    app.config.setdefault('USAGE_MAX_PENDING', int(os.getenv('USAGE_MAX_PENDING', 10000)))
+    app.config.setdefault('LLM_TOKEN_BUDGET', int(os.getenv('LLM_TOKEN_BUDGET', 0)))
+    if _app is None:
+        _app = app
+        atexit.register(shutdown_usage)
@@ -0,0 +1,129 @@
+"""compressed document text
+
+Revision ID: 130f179dadd0
+Revises: 30c03894a773
+Create Date: 2026-10-19 17:47:18.946165
+
+"""
+import struct
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '130f179dadd0'
+down_revision = '30c03894a773'
+branch_labels = None
+depends_on = None
+
+# (table, nullable) of the text columns now stored compressed
+TEXT_COLUMNS = [('document', True), ('document_chunk', False)]
+BATCH_SIZE = 500
+
+# Value format of app.utils.text_compression: a tag byte, then the payload
+PLAIN, ZLIB, ZLIB_DICT, ZSTD, ZSTD_DICT = range(5)
+MIN_SIZE = 128
+ZLIB_MAX_DICTIONARY = 32 * 1024
+
+
+def _compress(text):
+    data = text.encode('utf-8')
+    if len(data) >= MIN_SIZE:
+        compressed = bytes([ZLIB]) + zlib.compress(data, 6)
+        if len(compressed) <= len(data):
+            return compressed
+    return bytes([PLAIN]) + data
+
+
+def _decompressor(bind):
+    """Decoder of the stored values, with the dictionaries of the database."""
+    dictionaries = {row.id: (row.codec, bytes(row.data))
+                    for row in bind.execute(sa.text('SELECT id, codec, data FROM text_dictionary'))}
+
+    def decompress(value):
+        value = bytes(value)
+        tag = value[0]
+        if tag == PLAIN:
+            return value[1:].decode('utf-8')
+        if tag == ZLIB:
+            return zlib.decompress(value[1:]).decode('utf-8')
+        if tag == ZLIB_DICT:
+            data = dictionaries[struct.unpack_from('>I', value, 1)[0]][1]
+            decompressor = zlib.decompressobj(zdict=data[-ZLIB_MAX_DICTIONARY:])
+            return (decompressor.decompress(value[5:]) + decompressor.flush()).decode('utf-8')
+        import zstandard  # values written with zstd need the package to be read back
+        if tag == ZSTD:
+            return zstandard.ZstdDecompressor().decompress(value[1:]).decode('utf-8')
+        data = dictionaries[struct.unpack_from('>I', value, 1)[0]][1]
+        return (zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(data))
+                .decompress(value[5:]).decode('utf-8'))
+    return decompress
+
+
+def _convert(table_name, nullable, new_type, convert):
+    """Rewrite table.content as new_type, BATCH_SIZE rows per statement."""
+    bind = op.get_bind()
+    with op.batch_alter_table(table_name, schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_new', new_type, nullable=True))
+
+    table = sa.table(table_name, sa.column('id'), sa.column('content'), sa.column('content_new', new_type))
+    update = table.update().where(table.c.id == sa.bindparam('row_id')).values(content_new=sa.bindparam('value'))
+    last_id = None
+    while True:
+        query = sa.select(table.c.id, table.c.content).order_by(table.c.id).limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = bind.execute(query).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        params = [{'row_id': row.id, 'value': convert(row.content)} for row in rows if row.content is not None]
+        if params:
+            bind.execute(update, params)
+
+    with op.batch_alter_table(table_name, schema=None) as batch_op:
+        batch_op.drop_column('content')
+    with op.batch_alter_table(table_name, schema=None) as batch_op:
+        batch_op.alter_column('content_new', new_column_name='content', existing_type=new_type,
+                              nullable=nullable)
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('text_dictionary',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('project_id', sa.String(length=36).with_variant(postgresql.UUID(as_uuid=False), 'postgresql'),
+              nullable=False),
+    sa.Column('codec', sa.String(length=10), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('sample_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    with op.batch_alter_table('text_dictionary', schema=None) as batch_op:
+        batch_op.create_index('ix_text_dictionary_project', ['project_id', 'id'], unique=False)
+
+    # ### end Alembic commands ###
+
+    # The existing text is compressed with plain zlib (no dictionary yet):
+    # `flask compress-text --train` can recompress it with per-project ones
+    for table_name, nullable in TEXT_COLUMNS:
+        _convert(table_name, nullable, sa.LargeBinary(), _compress)
+
+
+def downgrade():
+    decompress = _decompressor(op.get_bind())
+    for table_name, nullable in TEXT_COLUMNS:
+        _convert(table_name, nullable, sa.Text(), decompress)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('text_dictionary', schema=None) as batch_op:
+        batch_op.drop_index('ix_text_dictionary_project')
+
+    op.drop_table('text_dictionary')
+    # ### end Alembic commands ###
@@ -21,6 +21,9 @@ depends_on = None
 def upgrade():
     # ### commands auto generated by Alembic - please adjust! ###
 
+    # PostgreSQL needs the enum type before a column can use it (no-op elsewhere)
+    sa.Enum('RESOURCE', 'TEST', name='questionsourcetype').create(op.get_bind(), checkfirst=True)
+
     # First add the column with a default value
     with op.batch_alter_table('question', schema=None) as batch_op:
         batch_op.add_column(sa.Column('source_type',
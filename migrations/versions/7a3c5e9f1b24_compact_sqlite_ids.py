@@ -0,0 +1,57 @@
+"""compact sqlite ids
+
+Revision ID: 7a3c5e9f1b24
+Revises: 68de148db6c3
+Create Date: 2026-10-19 19:12:40.518337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3c5e9f1b24'
+down_revision = '68de148db6c3'
+branch_labels = None
+depends_on = None
+
+CANONICAL_UUID = "'" + "-".join('[0-9a-f]' * n for n in (8, 4, 4, 4, 12)) + "'"
+
+
+def _id_columns(inspector):
+    """(table, column) of every id column, i.e. every VARCHAR(36) column."""
+    return [(table, column['name'])
+            for table in inspector.get_table_names()
+            for column in inspector.get_columns(table)
+            if isinstance(column['type'], sa.String) and column['type'].length == 36]
+
+
+def _uuid_bytes(value):
+    return bytes.fromhex(value.replace('-', ''))
+
+
+def upgrade():
+    # On SQLite the ids written so far are 36 character strings; GUID now
+    # stores canonical UUIDs as 16 byte blobs (see app.models.types), so the
+    # existing ones are converted too, keys and foreign keys alike. Other ids
+    # stay text. PostgreSQL already has a native uuid type: nothing to do.
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+
+    bind.connection.driver_connection.create_function('uuid_bytes', 1, _uuid_bytes, deterministic=True)
+    for table, column in _id_columns(sa.inspect(bind)):
+        op.execute(f'UPDATE {table} SET {column} = uuid_bytes({column}) '
+                   f'WHERE typeof({column}) = \'text\' AND {column} GLOB {CANONICAL_UUID}')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+
+    for table, column in _id_columns(sa.inspect(bind)):
+        h = f'lower(hex({column}))'
+        op.execute(f"UPDATE {table} SET {column} = substr({h}, 1, 8) || '-' || substr({h}, 9, 4) || '-' || "
+                   f"substr({h}, 13, 4) || '-' || substr({h}, 17, 4) || '-' || substr({h}, 21) "
+                   f"WHERE typeof({column}) = 'blob'")
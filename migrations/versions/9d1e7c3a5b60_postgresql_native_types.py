@@ -0,0 +1,61 @@
+"""postgresql native types
+
+Revision ID: 9d1e7c3a5b60
+Revises: 3f6a9b2d0c58
+Create Date: 2026-10-19 16:58:41.213006
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d1e7c3a5b60'
+down_revision = '3f6a9b2d0c58'
+branch_labels = None
+depends_on = None
+
+
+def _id_columns(inspector):
+    """(table, column) of every id column, i.e. every VARCHAR(36)/UUID column."""
+    columns = []
+    for table in inspector.get_table_names():
+        for column in inspector.get_columns(table):
+            if isinstance(column['type'], sa.String) and column['type'].length == 36:
+                columns.append((table, column['name']))
+            elif isinstance(column['type'], sa.Uuid):
+                columns.append((table, column['name']))
+    return columns
+
+
+def _convert(target_type, json_type):
+    # The ids are created as VARCHAR(36) by the earlier migrations. On
+    # PostgreSQL they become native UUIDs (and motivations JSONB); the foreign
+    # keys are dropped while the types change and created again afterwards.
+    # Nothing to do on the other backends.
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    inspector = sa.inspect(bind)
+    foreign_keys = [(table, fk) for table in inspector.get_table_names()
+                    for fk in inspector.get_foreign_keys(table)]
+
+    for table, fk in foreign_keys:
+        op.drop_constraint(fk['name'], table, type_='foreignkey')
+
+    for table, column in _id_columns(inspector):
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE {target_type} USING {column}::{target_type}')
+    op.execute(f'ALTER TABLE project ALTER COLUMN motivations TYPE {json_type} USING motivations::{json_type}')
+
+    for table, fk in foreign_keys:
+        op.create_foreign_key(fk['name'], table, fk['referred_table'], fk['constrained_columns'],
+                              fk['referred_columns'])
+
+
+def upgrade():
+    _convert('uuid', 'jsonb')
+
+
+def downgrade():
+    _convert('varchar(36)', 'json')
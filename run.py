@@ -1,6 +1,13 @@
+import sys
+
 from app import create_app
 
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    if '--production' in sys.argv:
+        # Preforked gunicorn workers, see app/server.py for the settings
+        from app.server import serve
+        serve(app)
+    else:
+        app.run(debug=True)